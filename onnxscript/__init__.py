@@ -4,7 +4,7 @@
 # --------------------------------------------------------------------------
 
 from .backend.onnx_export import export2python as proto2python
-from .main import export_onnx_lib, graph, script
+from .main import export_onnx_lib, graph, script, unroll
 
 # isort: off
 from .onnx_opset import (
@@ -55,6 +55,8 @@ from .onnx_types import (
 from .utils import external_tensor, proto2text
 from .values import OnnxFunction
 
+from .batching import vmap  # isort: skip  # depends on the modules above
+
 __version__ = "0.1.0"
 
 __all__ = [
@@ -65,6 +67,8 @@ __all__ = [
     "proto2text",
     "external_tensor",
     "graph",
+    "unroll",
+    "vmap",
     "BFLOAT16",
     "FLOAT16",
     "FLOAT",
@@ -86,7 +86,10 @@ def static_cast_inputs(converter, opschema, *args):
     def cast(x, typeinfo):
         if x.is_const() and typeinfo is not None:
             # Scalar values are promoted to tensors of a type chosen as below:
-
+            if converter.retype_constant(x.name, typeinfo):
+                # The type of the other operand is statically known: the constant
+                # is emitted with this type and no CastLike is needed.
+                return x.name
             tmp = converter.generate_unique_name(f"{x.name}_cast")
             converter.emit(
                 [tmp],
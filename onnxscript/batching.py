@@ -0,0 +1,904 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+"""Vectorization of functions over a batch dimension.
+
+:func:`vmap` rewrites a function computing an output for one sample into a function
+computing the outputs for a batch of samples, stacked along a new dimension. The values
+of the rewritten function depending on a batched input carry the batch dimension first;
+the values which do not depend on it are computed once, as in the original function.
+Each op with a batched input is rewritten by a batching rule, for example:
+
+* elementwise ops broadcast their inputs as before, once the batched inputs of lower
+  rank are given dimensions of size 1 after the batch dimension,
+* the axes given by attributes or inputs, such as the `axis` of `Softmax` or the
+  `perm` of `Transpose`, are shifted past the batch dimension,
+* the target shape of `Reshape` keeps the batch dimension, `Shape` drops it,
+* `MatMul` and `Gemm` multiply the matrices of each sample,
+* ops with a leading batch dimension of their own, such as `Conv`, run on a batch
+  merging the two batch dimensions,
+* calls to other functions call their vectorized version.
+
+Several rules depend on the rank of the values, inferred from the types of the inputs
+of the function: their shape should be declared. Ops with a batched input and no
+batching rule, such as an `If` whose condition depends on a batched input, are
+reported by a ValueError.
+"""
+from __future__ import annotations
+
+from typing import Any, Mapping, Optional, Sequence, Union
+
+import numpy as np
+import onnx
+from onnx import helper
+
+from onnxscript import irbuilder, onnx_opset, utils, values
+from onnxscript.cost import ELEMENTWISE_OPS
+from onnxscript.optimizer import arg_names, constant_value, make_constant_stmt
+
+Axes = Union[Optional[int], Sequence[Optional[int]]]
+
+_MIN_OPSET_VERSION = 13
+
+# Name of the batch dimension in the types of the batched inputs and outputs.
+_BATCH_DIM = "batch"
+
+# Ops computing each element, or each matrix of the trailing dimensions, of their first
+# input independently, the other inputs being parameters shared by all the elements.
+_FIRST_INPUT_OPS = frozenset(["Cast", "Clip", "Det", "Dropout", "Identity", "Trilu"])
+
+# Ops with an axis attribute (and its default value) which keep the batch dimension
+# first when their first input is batched and their other inputs are not.
+_AXIS_OPS = {
+    "ArgMax": 0,
+    "ArgMin": 0,
+    "Gather": 0,
+    "Hardmax": -1,
+    "LayerNormalization": -1,
+    "LogSoftmax": -1,
+    "LpNormalization": -1,
+    "OneHot": -1,
+    "Softmax": -1,
+    "Split": 0,
+    "TopK": -1,
+}
+
+# Ops whose first input already has a leading batch dimension: they run on a batch
+# merging the batch dimension added by vmap with theirs.
+_MERGED_BATCH_OPS = frozenset(
+    [
+        "AveragePool",
+        "BatchNormalization",
+        "Conv",
+        "ConvTranspose",
+        "DepthToSpace",
+        "GlobalAveragePool",
+        "GlobalLpPool",
+        "GlobalMaxPool",
+        "InstanceNormalization",
+        "LpPool",
+        "LRN",
+        "MaxPool",
+        "SpaceToDepth",
+    ]
+)
+
+# Ranks of the values of Constant ops, by attribute.
+_CONSTANT_RANKS = {
+    "value_float": 0,
+    "value_floats": 1,
+    "value_int": 0,
+    "value_ints": 1,
+    "value_string": 0,
+    "value_strings": 1,
+}
+
+_REDUCTION_OPS = frozenset(
+    [
+        "ReduceL1",
+        "ReduceL2",
+        "ReduceLogSum",
+        "ReduceLogSumExp",
+        "ReduceMax",
+        "ReduceMean",
+        "ReduceMin",
+        "ReduceProd",
+        "ReduceSum",
+        "ReduceSumSquare",
+    ]
+)
+
+
+def _axes_per_input(axes: Axes, count: int, what: str) -> list[Optional[int]]:
+    if axes is None or isinstance(axes, int):
+        return [axes] * count
+    axes = list(axes)
+    if len(axes) != count:
+        raise ValueError(f"vmap: {len(axes)} {what} axes given for {count} {what}s.")
+    return axes
+
+
+def _rank(type_proto: Optional[onnx.TypeProto]) -> Optional[int]:
+    if type_proto is None or not type_proto.HasField("tensor_type"):
+        return None
+    if not type_proto.tensor_type.HasField("shape"):
+        return None
+    return len(type_proto.tensor_type.shape.dim)
+
+
+def _batched_type(type_proto: Optional[onnx.TypeProto], axis: int) -> Optional[onnx.TypeProto]:
+    """Returns the type of a batch of values of the given type, batched along axis."""
+    if _rank(type_proto) is None:
+        return type_proto
+    assert type_proto is not None
+    batched = onnx.TypeProto()
+    batched.CopyFrom(type_proto)
+    dims = batched.tensor_type.shape.dim
+    dim = onnx.TensorShapeProto.Dimension(dim_param=_BATCH_DIM)
+    dims.insert(axis, dim)
+    return batched
+
+
+def _infer_types(
+    function_ir: irbuilder.IRFunction, input_types: Sequence[Optional[onnx.TypeProto]]
+) -> dict[str, onnx.TypeProto]:
+    """Returns the types of the values of a function computing one sample."""
+    from onnxscript import memory  # pylint: disable=import-outside-toplevel
+
+    types = dict(function_ir.value_types)
+    known_types = {x.name: t for x, t in zip(function_ir.inputs, input_types) if t is not None}
+    types.update(known_types)
+    if function_ir.attrs:
+        # Shape inference needs the values of the attributes.
+        return types
+    try:
+        model = memory.infer_shapes(function_ir, known_types)
+    except (onnx.shape_inference.InferenceError, ValueError, TypeError):
+        return types
+    types.update(memory.value_types(model.graph, {}))
+    return types
+
+
+class _Batcher:
+    """Rewrites the statements of a function computing one sample."""
+
+    def __init__(
+        self,
+        function: values.OnnxFunction,
+        in_axes: list[Optional[int]],
+        input_types: Sequence[Optional[onnx.TypeProto]],
+        batched_functions: dict[tuple[int, tuple[bool, ...]], values.OnnxFunction],
+    ) -> None:
+        self.function = function
+        self.function_ir = function.function_ir
+        self.in_axes = in_axes
+        self.types = _infer_types(self.function_ir, input_types)
+        self.batched_functions = batched_functions
+        standard_opsets = [
+            s.callee.opset for s in self.function_ir.stmts if s.callee.opset.domain == ""
+        ]
+        self.opset = standard_opsets[0] if standard_opsets else onnx_opset.default_opset
+        if self.opset.version < _MIN_OPSET_VERSION:
+            raise ValueError(
+                f"vmap: {function.name} uses opset {self.opset.version}, "
+                f"opset {_MIN_OPSET_VERSION} or later is required."
+            )
+        self.stmts: list[irbuilder.IRStmt] = []
+        self.called_functions: list[values.OnnxFunction] = []
+        # Names of the values which carry a batch dimension, always the first one.
+        self.batched: set[str] = set()
+        # Names of the values which replace inputs moved to the batch dimension.
+        self.renamed: dict[str, str] = {}
+        self.constants: dict[str, np.ndarray] = {}
+        # Ranks of the constants whose value is not known.
+        self.ranks: dict[str, Optional[int]] = {}
+        self.used_names = {x.name for x in self.function_ir.inputs}
+        for stmt in self.function_ir.stmts:
+            self.used_names.update(arg_names(stmt))
+            self.used_names.update(stmt.output_names)
+        self._batch_size: Optional[str] = None
+
+    # Helpers emitting statements.
+
+    def fresh(self, base: str) -> str:
+        name = base
+        i = 0
+        while name in self.used_names:
+            i += 1
+            name = f"{base}_{i}"
+        self.used_names.add(name)
+        return name
+
+    def emit(
+        self,
+        op_type: str,
+        args: Sequence[str],
+        outputs: Union[str, Sequence[str]],
+        **attributes: Any,
+    ) -> str:
+        if isinstance(outputs, str):
+            outputs = [self.fresh(outputs)]
+        attrs = [
+            irbuilder.IRAttributeValue(helper.make_attribute(k, v))
+            for k, v in attributes.items()
+        ]
+        self.stmts.append(
+            irbuilder.IRStmt(list(outputs), values.Op(self.opset, op_type), list(args), attrs)
+        )
+        return outputs[0]
+
+    def constant(self, value: Any, base: str = "const") -> str:
+        name = self.fresh(base)
+        self.stmts.append(
+            make_constant_stmt(name, np.array(value, dtype=np.int64), self.opset)
+        )
+        return name
+
+    def batch_size(self) -> str:
+        """Returns the name of a 1D tensor holding the batch size."""
+        if self._batch_size is None:
+            batched_input = next(
+                self.arg(x.name) for x in self.function_ir.inputs if x.name in self.batched
+            )
+            shape = self.emit("Shape", [batched_input], "shape")
+            self._batch_size = self.emit(
+                "Slice", [shape, self.constant([0]), self.constant([1])], "batch_size"
+            )
+        return self._batch_size
+
+    def arg(self, name: Optional[str]) -> str:
+        if not name:
+            return ""
+        return self.renamed.get(name, name)
+
+    def rank(self, name: str) -> Optional[int]:
+        if name in self.constants:
+            return self.constants[name].ndim
+        if name in self.ranks:
+            return self.ranks[name]
+        return _rank(self.types.get(name))
+
+    def require_rank(self, name: str, op_type: str) -> int:
+        rank = self.rank(name)
+        if rank is None:
+            raise ValueError(
+                f"vmap: the rank of {name!r}, used by {op_type} in {self.function.name}, "
+                "is unknown. Declare the shapes of the inputs of the function."
+            )
+        return rank
+
+    def unsqueeze(self, name: str, count: int) -> str:
+        """Inserts count dimensions of size 1 after the batch dimension of a value."""
+        if count <= 0:
+            return name
+        axes = self.constant(list(range(1, count + 1)), "axes")
+        return self.emit("Unsqueeze", [name, axes], f"{name}_unsqueezed")
+
+    def broadcast_to_batch(self, name: str) -> str:
+        """Returns a batch of copies of a value computed once for all samples."""
+        unsqueezed = self.emit("Unsqueeze", [name, self.constant([0], "axes")], name)
+        shape = self.emit(
+            "Concat", [self.batch_size(), self.emit("Shape", [name], "shape")], "shape", axis=0
+        )
+        return self.emit("Expand", [unsqueezed, shape], f"{name}_batched")
+
+    def shifted_axes(self, name: str) -> str:
+        """Returns axes (an input of an op) shifted past the batch dimension."""
+        if name in self.constants:
+            axes = self.constants[name]
+            return self.constant(np.where(axes >= 0, axes + 1, axes), "axes")
+        zero = self.constant(0, "zero")
+        nonnegative = self.emit("GreaterOrEqual", [self.arg(name), zero], "nonnegative")
+        shift = self.emit("Cast", [nonnegative], "shift", to=onnx.TensorProto.INT64)
+        return self.emit("Add", [self.arg(name), shift], "axes")
+
+    # Rewriting.
+
+    def run(self) -> None:
+        for x, axis in zip(self.function_ir.inputs, self.in_axes):
+            if axis is None:
+                continue
+            self.batched.add(x.name)
+            if axis != 0:
+                rank = self.require_rank(x.name, "vmap") + 1
+                axis = axis % rank
+                perm = [axis] + [i for i in range(rank) if i != axis]
+                self.renamed[x.name] = self.emit(
+                    "Transpose", [x.name], f"{x.name}_transposed", perm=perm
+                )
+        for stmt in self.function_ir.stmts:
+            value = constant_value(stmt)
+            if value is not None:
+                self.constants[stmt.output_names[0]] = value
+            elif stmt.callee.opname == "Constant" and stmt.attrs:
+                # The value of the constant is an attribute of the function.
+                self.ranks[stmt.output_names[0]] = _CONSTANT_RANKS.get(
+                    stmt.attrs[0].attr_proto.name
+                )
+            # The rules handle the names of the arguments and results of the statement.
+            self.rewrite(
+                irbuilder.IRStmt(
+                    list(stmt.output_names),
+                    stmt.callee,
+                    arg_names(stmt),
+                    stmt.attrs,
+                    stmt.functions,
+                )
+            )
+
+    def rewrite(self, stmt: irbuilder.IRStmt) -> None:
+        args = list(stmt.args)
+        captured: set[str] = set()
+        for attr in stmt.attrs:
+            for subgraph in utils.subgraphs(attr.attr_proto):
+                captured |= utils.referenced_names(subgraph)
+        if not (set(args) | captured) & self.batched:
+            self.stmts.append(
+                irbuilder.IRStmt(
+                    stmt.result,
+                    stmt.callee,
+                    [self.arg(x) for x in args],
+                    stmt.attrs,
+                    stmt.functions,
+                )
+            )
+            return
+        op_type = stmt.callee.opname
+        if isinstance(stmt.callee, values.OnnxFunction):
+            self.call(stmt)
+            return
+        if captured & self.batched:
+            raise ValueError(
+                f"vmap: the subgraphs of {op_type} in {self.function.name} use batched values."
+            )
+        if stmt.callee.opset.domain != "":
+            raise ValueError(
+                f"vmap: no batching rule for {stmt.callee.opset.domain}.{op_type}."
+            )
+        if op_type in ELEMENTWISE_OPS and op_type != "Clip":
+            self.elementwise(stmt)
+        elif op_type in _FIRST_INPUT_OPS:
+            self.check_unbatched(stmt, args[1:])
+            self.copy(stmt, {})
+        elif op_type == "CastLike":
+            self.copy(stmt, {}, batched=args[0] in self.batched)
+        elif op_type in _AXIS_OPS:
+            self.axis_op(stmt)
+        elif op_type in _REDUCTION_OPS:
+            self.reduction(stmt)
+        elif op_type in _MERGED_BATCH_OPS:
+            self.merged_batch_op(stmt)
+        else:
+            rule = getattr(self, f"rewrite_{op_type}", None)
+            if rule is None:
+                raise ValueError(
+                    f"vmap: no batching rule for {op_type} (in {self.function.name}) "
+                    "with batched inputs."
+                )
+            rule(stmt)
+
+    def check_unbatched(self, stmt: irbuilder.IRStmt, args: Sequence[Optional[str]]) -> None:
+        batched = [x for x in args if x in self.batched]
+        if batched:
+            raise ValueError(
+                f"vmap: {stmt.callee.opname} (in {self.function.name}) supports a batched "
+                f"{batched[0]!r} only if it is the same for all samples."
+            )
+
+    def attribute(self, stmt: irbuilder.IRStmt, name: str, default: Any = None) -> Any:
+        for attr in stmt.attrs:
+            if attr.attr_proto.name == name:
+                if attr.attr_proto.ref_attr_name:
+                    raise ValueError(
+                        f"vmap: the attribute {name} of {stmt.callee.opname} "
+                        f"(in {self.function.name}) must be known."
+                    )
+                return helper.get_attribute_value(attr.attr_proto)
+        return default
+
+    def copy(
+        self,
+        stmt: irbuilder.IRStmt,
+        attributes: Mapping[str, Any],
+        args: Optional[Sequence[str]] = None,
+        batched: bool = True,
+    ) -> None:
+        """Emits the statement with new arguments and attributes."""
+        attrs = [a for a in stmt.attrs if a.attr_proto.name not in attributes]
+        attrs.extend(
+            irbuilder.IRAttributeValue(helper.make_attribute(k, v))
+            for k, v in attributes.items()
+        )
+        if args is None:
+            args = [self.arg(x) for x in stmt.args]
+        self.stmts.append(irbuilder.IRStmt(stmt.result, stmt.callee, list(args), attrs))
+        if batched:
+            self.batched.update(x for x in stmt.output_names if x)
+
+    def call(self, stmt: irbuilder.IRStmt) -> None:
+        callee = stmt.callee
+        assert isinstance(callee, values.OnnxFunction)
+        pattern = tuple(x in self.batched for x in stmt.args)
+        key = (id(callee), pattern)
+        if key not in self.batched_functions:
+            in_axes = [0 if batched else None for batched in pattern]
+            in_axes += [None] * (len(callee.function_ir.inputs) - len(in_axes))
+            input_types = [self.types.get(x) if x else None for x in stmt.args]
+            self.batched_functions[key] = _vmap(
+                callee, in_axes, 0, input_types, self.batched_functions
+            )
+        batched_callee = self.batched_functions[key]
+        self.called_functions.append(batched_callee)
+        self.stmts.append(
+            irbuilder.IRStmt(
+                stmt.result, batched_callee, [self.arg(x) for x in stmt.args], stmt.attrs
+            )
+        )
+        self.batched.update(x for x in stmt.output_names if x)
+
+    def elementwise(self, stmt: irbuilder.IRStmt) -> None:
+        args = [x for x in stmt.args if x]
+        if len(args) > 1:
+            batched = [x for x in args if x in self.batched]
+            others = [x for x in args if x not in self.batched]
+            if all(self.rank(x) == 0 for x in others) and len(batched) == 1:
+                # Scalars broadcast to any rank.
+                self.copy(stmt, {})
+                return
+            ranks = {x: self.require_rank(x, stmt.callee.opname) for x in args}
+            rank = max(ranks.values())
+            new_args = [
+                self.unsqueeze(self.arg(x), rank - ranks[x])
+                if x in self.batched
+                else self.arg(x)
+                for x in stmt.args
+            ]
+            self.copy(stmt, {}, new_args)
+            return
+        self.copy(stmt, {})
+
+    def axis_op(self, stmt: irbuilder.IRStmt) -> None:
+        op_type = stmt.callee.opname
+        axis = self.attribute(stmt, "axis", _AXIS_OPS[op_type])
+        args = arg_names(stmt)
+        if op_type == "Gather" and args[0] not in self.batched:
+            # The batch dimension of the indices replaces the gathered axis.
+            if axis not in (0, -self.require_rank(args[0], op_type)):
+                raise ValueError(
+                    f"vmap: Gather (in {self.function.name}) with batched indices "
+                    "is supported along the first axis only."
+                )
+            self.copy(stmt, {"axis": 0})
+            return
+        self.check_unbatched(stmt, args[1:])
+        self.copy(stmt, {"axis": axis + 1 if axis >= 0 else axis})
+
+    def reduction(self, stmt: irbuilder.IRStmt) -> None:
+        op_type = stmt.callee.opname
+        args = arg_names(stmt)
+        self.check_unbatched(stmt, args[1:])
+        schema = stmt.callee.get_schema()
+        if len(schema.inputs) > 1:
+            # Since opset 13 (ReduceSum) or 18, the axes are an input.
+            if len(args) > 1 and args[1]:
+                args[1] = self.shifted_axes(args[1])
+                self.copy(stmt, {}, [self.arg(args[0]), args[1]])
+                return
+            if self.attribute(stmt, "noop_with_empty_axes", 0):
+                self.copy(stmt, {})
+                return
+            rank = self.rank(args[0])
+            if rank is not None:
+                axes = self.constant(list(range(1, rank + 1)), "axes")
+            else:
+                size = self.emit(
+                    "Size", [self.emit("Shape", [self.arg(args[0])], "shape")], "rank"
+                )
+                one = self.constant(1, "one")
+                axes = self.emit("Range", [one, size, one], "axes")
+            self.copy(stmt, {}, [self.arg(args[0]), axes])
+            return
+        reduced = self.attribute(stmt, "axes")
+        if reduced is None:
+            reduced = range(self.require_rank(args[0], op_type))
+        self.copy(stmt, {"axes": [axis + 1 if axis >= 0 else axis for axis in reduced]})
+
+    def merged_batch_op(self, stmt: irbuilder.IRStmt) -> None:
+        args = arg_names(stmt)
+        self.check_unbatched(stmt, args[1:])
+        if len([x for x in stmt.output_names if x]) > 1:
+            raise ValueError(
+                f"vmap: only the first output of {stmt.callee.opname} "
+                f"(in {self.function.name}) is supported."
+            )
+        x = self.arg(args[0])
+        shape = self.emit("Shape", [x], "shape")
+        end = self.constant([np.iinfo(np.int64).max], "end")
+        sample_shape = self.emit("Slice", [shape, self.constant([2], "start"), end], "shape")
+        minus_one = self.constant([-1], "minus_one")
+        merged_shape = self.emit("Concat", [minus_one, sample_shape], "shape", axis=0)
+        merged = self.emit("Reshape", [x, merged_shape], f"{x}_merged")
+        output = stmt.output_names[0]
+        merged_output = self.fresh(f"{output}_merged")
+        self.copy(stmt, {}, [merged] + [self.arg(a) for a in args[1:]], batched=False)
+        self.stmts[-1].result = [merged_output]
+        self.split_batch(merged_output, output)
+
+    def split_batch(self, merged: str, output: str) -> None:
+        """Computes output by splitting the leading dimension of merged into the batch."""
+        shape = self.emit("Shape", [merged], "shape")
+        end = self.constant([np.iinfo(np.int64).max], "end")
+        rest = self.emit("Slice", [shape, self.constant([1], "start"), end], "shape")
+        minus_one = self.constant([-1], "minus_one")
+        split_shape = self.emit(
+            "Concat", [self.batch_size(), minus_one, rest], "shape", axis=0
+        )
+        self.emit("Reshape", [merged, split_shape], [output])
+        self.batched.add(output)
+
+    # Rules of specific ops, named after them.
+
+    def rewrite_Concat(self, stmt: irbuilder.IRStmt) -> None:  # pylint: disable=invalid-name
+        axis = self.attribute(stmt, "axis")
+        args = [
+            self.arg(x) if x in self.batched else self.broadcast_to_batch(self.arg(x))
+            for x in stmt.args
+        ]
+        self.copy(stmt, {"axis": axis + 1 if axis >= 0 else axis}, args)
+
+    def rewrite_CumSum(self, stmt: irbuilder.IRStmt) -> None:  # pylint: disable=invalid-name
+        x, axis = arg_names(stmt)
+        self.check_unbatched(stmt, [axis])
+        self.copy(stmt, {}, [self.arg(x), self.shifted_axes(axis)])
+
+    def rewrite_Expand(self, stmt: irbuilder.IRStmt) -> None:  # pylint: disable=invalid-name
+        x, shape = arg_names(stmt)
+        self.check_unbatched(stmt, [shape])
+        rank = self.require_rank(stmt.output_names[0], "Expand")
+        x_rank = self.require_rank(x, "Expand")
+        self.copy(stmt, {}, [self.unsqueeze(self.arg(x), rank - x_rank), self.arg(shape)])
+
+    def rewrite_Flatten(self, stmt: irbuilder.IRStmt) -> None:  # pylint: disable=invalid-name
+        axis = self.attribute(stmt, "axis", 1)
+        output = stmt.output_names[0]
+        merged = self.fresh(f"{output}_merged")
+        self.copy(stmt, {"axis": axis + 1 if axis >= 0 else axis}, batched=False)
+        self.stmts[-1].result = [merged]
+        self.split_batch(merged, output)
+
+    def rewrite_Gemm(self, stmt: irbuilder.IRStmt) -> None:  # pylint: disable=invalid-name
+        a, b, *c = arg_names(stmt)
+        output = stmt.output_names[0]
+
+        def operand(name: str, transposed: bool) -> str:
+            if not transposed:
+                return self.arg(name)
+            perm = [0, 2, 1] if name in self.batched else [1, 0]
+            return self.emit("Transpose", [self.arg(name)], f"{name}_transposed", perm=perm)
+
+        product = self.emit(
+            "MatMul",
+            [
+                operand(a, self.attribute(stmt, "transA", 0)),
+                operand(b, self.attribute(stmt, "transB", 0)),
+            ],
+            f"{output}_product",
+        )
+        alpha = self.attribute(stmt, "alpha", 1.0)
+        if alpha != 1.0:
+            factor = self.emit(
+                "CastLike",
+                [self.emit("Constant", [], "alpha", value_float=alpha), product],
+                "alpha",
+            )
+            product = self.emit("Mul", [product, factor], f"{output}_scaled")
+        if c and c[0]:
+            bias = self.arg(c[0])
+            if c[0] in self.batched:
+                bias = self.unsqueeze(bias, 2 - self.require_rank(c[0], "Gemm"))
+            beta = self.attribute(stmt, "beta", 1.0)
+            if beta != 1.0:
+                factor = self.emit(
+                    "CastLike",
+                    [self.emit("Constant", [], "beta", value_float=beta), bias],
+                    "beta",
+                )
+                bias = self.emit("Mul", [bias, factor], f"{output}_bias")
+            self.emit("Add", [product, bias], [output])
+        else:
+            self.emit("Identity", [product], [output])
+        self.batched.add(output)
+
+    def rewrite_GatherElements(
+        self, stmt: irbuilder.IRStmt
+    ) -> None:  # pylint: disable=invalid-name
+        axis = self.attribute(stmt, "axis", 0)
+        args = [
+            self.arg(x) if x in self.batched else self.broadcast_to_batch(self.arg(x))
+            for x in stmt.args
+        ]
+        self.copy(stmt, {"axis": axis + 1 if axis >= 0 else axis}, args)
+
+    def rewrite_GatherND(self, stmt: irbuilder.IRStmt) -> None:  # pylint: disable=invalid-name
+        args = [
+            self.arg(x) if x in self.batched else self.broadcast_to_batch(self.arg(x))
+            for x in stmt.args
+        ]
+        self.copy(stmt, {"batch_dims": self.attribute(stmt, "batch_dims", 0) + 1}, args)
+
+    def rewrite_MatMul(self, stmt: irbuilder.IRStmt) -> None:  # pylint: disable=invalid-name
+        a, b = arg_names(stmt)
+        ranks = [self.require_rank(a, "MatMul"), self.require_rank(b, "MatMul")]
+        operands = [self.arg(a), self.arg(b)]
+        # Vectors are promoted to matrices, as MatMul does for one sample.
+        squeezed = []
+        if ranks[0] == 1:
+            operands[0] = self.emit(
+                "Unsqueeze", [operands[0], self.constant([-2], "axes")], f"{a}_matrix"
+            )
+            squeezed.append(-2)
+        if ranks[1] == 1:
+            operands[1] = self.emit(
+                "Unsqueeze", [operands[1], self.constant([-1], "axes")], f"{b}_matrix"
+            )
+            squeezed.append(-1)
+        ranks = [max(rank, 2) for rank in ranks]
+        # The batched operands get the dimensions of the stacks of matrices of the others.
+        for i, name in enumerate([a, b]):
+            if name in self.batched:
+                operands[i] = self.unsqueeze(operands[i], max(ranks) - ranks[i])
+        output = stmt.output_names[0]
+        if not squeezed:
+            self.copy(stmt, {}, operands)
+            return
+        product = self.emit("MatMul", operands, f"{output}_matrix")
+        self.emit("Squeeze", [product, self.constant(squeezed, "axes")], [output])
+        self.batched.add(output)
+
+    def rewrite_Pad(self, stmt: irbuilder.IRStmt) -> None:  # pylint: disable=invalid-name
+        x, pads, *others = arg_names(stmt)
+        self.check_unbatched(stmt, [pads, *others])
+        args = [self.arg(name) for name in stmt.args]
+        if len(others) > 1 and others[1]:
+            # Since opset 18, the padded axes are an input.
+            args[3] = self.shifted_axes(others[1])
+        else:
+            rank = self.require_rank(x, "Pad")
+            zero = self.constant([0], "zero")
+            begin = self.emit(
+                "Slice",
+                [args[1], self.constant([0], "start"), self.constant([rank], "end")],
+                "begin",
+            )
+            end = self.emit(
+                "Slice",
+                [args[1], self.constant([rank], "start"), self.constant([2 * rank], "end")],
+                "end",
+            )
+            args[1] = self.emit("Concat", [zero, begin, zero, end], "pads", axis=0)
+        self.copy(stmt, {}, args)
+
+    def rewrite_Reshape(self, stmt: irbuilder.IRStmt) -> None:  # pylint: disable=invalid-name
+        x, shape = arg_names(stmt)
+        self.check_unbatched(stmt, [shape])
+        # A 0 copies the batch dimension, unless zeros are literal values.
+        leading = (
+            self.batch_size() if self.attribute(stmt, "allowzero", 0) else self.constant([0])
+        )
+        batched_shape = self.emit("Concat", [leading, self.arg(shape)], "shape", axis=0)
+        self.copy(stmt, {}, [self.arg(x), batched_shape])
+
+    def rewrite_Shape(self, stmt: irbuilder.IRStmt) -> None:  # pylint: disable=invalid-name
+        # The shape of a sample is the same for all samples.
+        start = self.attribute(stmt, "start", 0)
+        end = self.attribute(stmt, "end")
+        if "start" not in stmt.callee.get_schema().attributes:
+            shape = self.emit("Shape", [self.arg(stmt.args[0])], "shape")
+            end = self.constant([np.iinfo(np.int64).max], "end")
+            self.emit("Slice", [shape, self.constant([1], "start"), end], stmt.output_names)
+            return
+        attributes = {"start": start + 1 if start >= 0 else start}
+        if end is not None:
+            attributes["end"] = end + 1 if end >= 0 else end
+        self.copy(stmt, attributes, batched=False)
+
+    def rewrite_Size(self, stmt: irbuilder.IRStmt) -> None:  # pylint: disable=invalid-name
+        shape = self.emit("Shape", [self.arg(stmt.args[0])], "shape")
+        end = self.constant([np.iinfo(np.int64).max], "end")
+        sample_shape = self.emit("Slice", [shape, self.constant([1], "start"), end], "shape")
+        self.emit("ReduceProd", [sample_shape], stmt.output_names, keepdims=0)
+
+    def rewrite_Slice(self, stmt: irbuilder.IRStmt) -> None:  # pylint: disable=invalid-name
+        args = list(stmt.args) + [""] * (5 - len(stmt.args))
+        self.check_unbatched(stmt, args[1:])
+        new_args = [self.arg(x) for x in args]
+        if args[3]:
+            new_args[3] = self.shifted_axes(args[3])
+        else:
+            one = self.constant(1, "one")
+            count = self.emit("Size", [new_args[1]], "count")
+            new_args[3] = self.emit(
+                "Range", [one, self.emit("Add", [count, one], "limit"), one], "axes"
+            )
+        while not new_args[-1]:
+            new_args.pop()
+        self.copy(stmt, {}, new_args)
+
+    def rewrite_Squeeze(self, stmt: irbuilder.IRStmt) -> None:  # pylint: disable=invalid-name
+        if len(stmt.args) < 2 or not stmt.args[1]:
+            raise ValueError(
+                f"vmap: Squeeze (in {self.function.name}) must be given the squeezed axes."
+            )
+        self.rewrite_Unsqueeze(stmt)
+
+    def rewrite_Tile(self, stmt: irbuilder.IRStmt) -> None:  # pylint: disable=invalid-name
+        x, repeats = arg_names(stmt)
+        self.check_unbatched(stmt, [repeats])
+        repeats = self.emit(
+            "Concat", [self.constant([1]), self.arg(repeats)], "repeats", axis=0
+        )
+        self.copy(stmt, {}, [self.arg(x), repeats])
+
+    def rewrite_Transpose(
+        self, stmt: irbuilder.IRStmt
+    ) -> None:  # pylint: disable=invalid-name
+        perm = self.attribute(stmt, "perm")
+        if perm is None:
+            perm = reversed(range(self.require_rank(arg_names(stmt)[0], "Transpose")))
+        self.copy(stmt, {"perm": [0] + [axis + 1 for axis in perm]})
+
+    def rewrite_Unsqueeze(
+        self, stmt: irbuilder.IRStmt
+    ) -> None:  # pylint: disable=invalid-name
+        x, axes = arg_names(stmt)
+        self.check_unbatched(stmt, [axes])
+        self.copy(stmt, {}, [self.arg(x), self.shifted_axes(axes)])
+
+    # Outputs.
+
+    def finish(self, out_axes: list[Optional[int]]) -> list[irbuilder.IRVar]:
+        """Moves the batch dimension of the outputs to the given axes.
+
+        Returns:
+            the outputs of the rewritten function
+        """
+        input_names = {x.name for x in self.function_ir.inputs}
+        renaming: dict[str, str] = {}
+        fixups: list[irbuilder.IRStmt] = []
+        outputs = []
+        for y, axis in zip(self.function_ir.outputs, out_axes):
+            if axis is None:
+                if y.name in self.batched:
+                    raise ValueError(
+                        f"vmap: output {y.name!r} of {self.function.name} depends on the batch."
+                    )
+                outputs.append(y)
+                continue
+            start = len(self.stmts)
+            current = self.arg(y.name)
+            if y.name not in self.batched:
+                current = self.broadcast_to_batch(current)
+            if axis != 0:
+                rank = self.require_rank(y.name, "vmap") + 1
+                axis %= rank
+                perm = list(range(1, axis + 1)) + [0] + list(range(axis + 1, rank))
+                current = self.emit("Transpose", [current], f"{y.name}_transposed", perm=perm)
+            name = y.name
+            if current != name:
+                if name in input_names:
+                    # An input cannot be assigned: the output is renamed instead.
+                    name = current
+                else:
+                    # The value computed by the statements of the function is renamed.
+                    renaming[name] = self.fresh(f"{name}_unmoved")
+                    self.stmts[-1].result = [name]
+            fixups.extend(self.stmts[start:])
+            del self.stmts[start:]
+            type_proto = self.types.get(y.name)
+            if type_proto is None and y.typeinfo is not None:
+                type_proto = y.typeinfo.to_type_proto()
+            if type_proto is not None:
+                outputs.append(
+                    irbuilder.IRVar(
+                        name, irbuilder.IRType(_batched_type(type_proto, axis)), y.info
+                    )
+                )
+            else:
+                outputs.append(irbuilder.IRVar(name, y.typeinfo, y.info))
+        for stmt in self.stmts + fixups:
+            stmt.args = [renaming.get(x, x) if x else x for x in stmt.args]
+        for stmt in self.stmts:
+            stmt.result = [renaming.get(x, x) for x in stmt.result]
+            for attr in stmt.attrs:
+                for subgraph in utils.subgraphs(attr.attr_proto):
+                    utils.rename_outer_scope_references(subgraph, renaming)
+        self.stmts.extend(fixups)
+        return outputs
+
+
+def _vmap(
+    function: values.OnnxFunction,
+    in_axes: Axes,
+    out_axes: Axes,
+    input_types: Sequence[Optional[onnx.TypeProto]],
+    batched_functions: dict[tuple[int, tuple[bool, ...]], values.OnnxFunction],
+) -> values.OnnxFunction:
+    function_ir = function.function_ir
+    in_axes = _axes_per_input(in_axes, len(function_ir.inputs), "input")
+    out_axes = _axes_per_input(out_axes, len(function_ir.outputs), "output")
+    if all(axis is None for axis in in_axes):
+        raise ValueError(f"vmap: no input of {function.name} is batched.")
+    batcher = _Batcher(function, in_axes, input_types, batched_functions)
+    batcher.run()
+    outputs = batcher.finish(out_axes)
+
+    name = function.name + "_vmap"
+    if any(axis != 0 for axis in in_axes + out_axes):
+        name += "".join(f"_{'n' if axis is None else axis}" for axis in in_axes + out_axes)
+    batched_ir = irbuilder.IRFunction(name, function_ir.domain)
+    batched_ir.docstring = function_ir.docstring
+    batched_ir.attrs = list(function_ir.attrs)
+    batched_ir.attr_protos = list(function_ir.attr_protos)
+    batched_ir.called_functions = dict(function_ir.called_functions)
+    for x, axis, input_type in zip(function_ir.inputs, in_axes, input_types):
+        type_proto = input_type or (x.typeinfo and x.typeinfo.to_type_proto())
+        if axis is not None:
+            rank = _rank(type_proto)
+            type_proto = _batched_type(
+                type_proto, axis % (rank + 1) if rank is not None else 0
+            )
+        typeinfo = irbuilder.IRType(type_proto) if type_proto is not None else x.typeinfo
+        batched_ir.append_input(irbuilder.IRVar(x.name, typeinfo, x.info))
+    for y in outputs:
+        batched_ir.append_output(y)
+    for stmt in batcher.stmts:
+        batched_ir.append_stmt(stmt)
+    for callee in batcher.called_functions:
+        batched_ir.add_called_function(callee)
+
+    def batched(*args, **kwargs):
+        from onnxscript import interpreter  # pylint: disable=import-outside-toplevel
+
+        return interpreter.run(batched_ir, *args, **kwargs)
+
+    batched.__name__ = name
+    return values.OnnxFunction(
+        function.opset, batched, batched_ir, function.source, function.kwargs
+    )
+
+
+def vmap(
+    function: values.OnnxFunction, in_axes: Axes = 0, out_axes: Axes = 0
+) -> values.OnnxFunction:
+    """Returns a function computing `function` for each sample of a batch of inputs.
+
+    Example::
+
+        @script()
+        def affine(x: FLOAT[4], w: FLOAT[4, 3]) -> FLOAT[3]:
+            return op.MatMul(x, w)
+
+        batched = vmap(affine, in_axes=(0, None))
+        batched(xs, w)  # xs: FLOAT[N, 4], the result: FLOAT[N, 3]
+
+    The rewritten function can be exported like any other function, for example with
+    `batched.to_model_proto()`, or called in eager mode, which runs it with the
+    :mod:`onnxscript.interpreter`.
+
+    Args:
+        function: the function computing one sample
+        in_axes: the axis of each input along which samples are stacked, None for the
+            inputs shared by all samples; a single value applies to all the inputs
+        out_axes: the axis of each output along which samples are stacked; a single
+            value applies to all the outputs
+
+    Returns:
+        a new function, named after function, whose inputs and outputs have one more
+        dimension than those of function
+
+    Raises:
+        ValueError: if an op with a batched input has no batching rule, or if a rule
+            needs a rank which is not known
+    """
+    return _vmap(function, in_axes, out_axes, [None] * len(function.function_ir.inputs), {})
@@ -5,17 +5,19 @@
 from __future__ import annotations
 
 import ast
+import copy
 import logging
+import re
 import sys
 from enum import IntEnum
-from typing import Any, Dict, List, NoReturn, Optional, Union
+from typing import Any, Dict, List, NoReturn, Optional, Sequence, Tuple, Union
 
 import numpy
 import onnx
 from onnx import helper, numpy_helper
 
 import onnxscript
-from onnxscript import analysis, autocast, irbuilder, onnx_types, sourceinfo
+from onnxscript import analysis, autocast, irbuilder, onnx_types, optimizer, sourceinfo
 from onnxscript import type_annotation as ta
 from onnxscript import values
 
@@ -27,6 +29,11 @@ else:
 
 logger = logging.getLogger("onnx-script")
 
+# Extreme values used as default bounds of a Slice, out of range values are
+# clamped by the Slice op.
+_INT64_MAX = 2**63 - 1
+_INT64_MIN = -(2**63)
+
 
 # Python-to-IR converter:
 
@@ -97,6 +104,32 @@ def pyvalue_to_tensor(
     return helper.make_tensor(tensor_name, onnx_type, [], [pyvalue])
 
 
+def _scanned_tensor(node: ast.AST, loop_var: str) -> Optional[str]:
+    """Returns the name `X` if node is the subscript `X[loop_var]`, None otherwise."""
+    if not isinstance(node, ast.Subscript) or not isinstance(node.value, ast.Name):
+        return None
+    index = node.slice
+    if not use_subscript and isinstance(index, ast.Index):
+        index = index.value  # type: ignore[attr-defined]
+    if isinstance(index, ast.Name) and index.id == loop_var:
+        return node.value.id
+    return None
+
+
+class _ScannedSliceReplacer(ast.NodeTransformer):
+    """Replaces every subscript `X[loop_var]` by a name bound to the Scan element of X."""
+
+    def __init__(self, loop_var: str, elements: Dict[str, str]):
+        self.loop_var = loop_var
+        self.elements = elements
+
+    def visit_Subscript(self, node: ast.Subscript) -> ast.AST:
+        scanned = _scanned_tensor(node, self.loop_var)
+        if scanned is None:
+            return self.generic_visit(node)
+        return ast.copy_location(ast.Name(id=self.elements[scanned], ctx=ast.Load()), node)
+
+
 # map from python operators to ONNX ops
 primop_map = {
     ast.Add: "Add",
@@ -127,6 +160,8 @@ class ConverterExpressionKind(IntEnum):
 
 
 class ConverterExpression:
+    __slots__ = ("name", "kind")
+
     def __init__(self, name: Optional[Union[str, List[str]]], kind: ConverterExpressionKind):
         self.name = name
         self.kind = kind
@@ -170,6 +205,9 @@ class Converter:
         global_names=None,
         source=None,
         default_opset=None,
+        attribute_values=None,
+        input_ranks=None,
+        unroll_threshold=0,
     ):
         self.ir_builder = ir_builder or irbuilder.IRBuilder()
         self.source = source
@@ -178,6 +216,13 @@ class Converter:
             self.globals = global_names.copy()
         self.this_module = opset
         self.default_opset_ = default_opset
+        # Known values of attribute-parameters: these attributes are replaced by
+        # script-time constants when translating the function.
+        self.attribute_values = attribute_values or {}
+        # Known ranks of the inputs: conditions on these ranks are resolved statically.
+        self.input_ranks = input_ranks or {}
+        # For-loops with a constant trip-count up to this threshold are unrolled.
+        self.unroll_threshold = unroll_threshold
 
     @property
     def default_opset(self):
@@ -226,6 +271,14 @@ class Converter:
         self.nextvar = 0
         self.used_vars = set()
         self.locals: List[Dict[Any, Any]] = [{}]
+        # values of the Constant statements emitted so far, used by type inference
+        self.constant_tensors: Dict[str, onnx.TensorProto] = {}
+        # one TypeProto per distinct type, shared by the variables of this type
+        self.shared_types: Dict[bytes, onnx.TypeProto] = {}
+        # one Op per opset and op name, shared by the statements calling it
+        self.shared_ops: Dict[Tuple[int, str], values.Op] = {}
+        # return types declared by the function being translated, if any
+        self.returntype: Optional[Sequence[type]] = None
 
     def source_of(self, node: ast.AST) -> sourceinfo.SourceInfo:
         return sourceinfo.SourceInfo(node, self.source, self.current_fn.name)
@@ -281,6 +334,9 @@ class Converter:
             raise ValueError(info.msg(f"Unbound name: {name}."))
         return None
 
+    def is_bound(self, name: str) -> bool:
+        return any(name in scope for scope in self.locals) or name in self.globals
+
     def generate_unique_name(self, candidate: str = "tmp") -> str:
         # TODO(justinchuby): Can we reduce the O complexity of this function?
         r = candidate
@@ -334,6 +390,187 @@ class Converter:
             attrs,
             sub_functions,
         )
+        self.infer_types(outputs, callee, inputs, attrs)
+
+    # Static type propagation:
+    # The types of the variables are tracked per function (or subgraph) in
+    # IRFunction.value_types. They are inferred from the type annotations of the
+    # inputs and propagated through each emitted statement using the ONNX shape
+    # inference of the op schema. Unknown types are simply not recorded.
+
+    def set_value_type(self, name: str, type_proto: Optional[onnx.TypeProto]) -> None:
+        """Records the statically known type of a variable of the current function."""
+        if not name or type_proto is None:
+            return
+        if type_proto.HasField("tensor_type"):
+            tensor_type = type_proto.tensor_type
+            # A tensor type may be partially known: only its rank may be known.
+            if tensor_type.elem_type == 0 and not tensor_type.HasField("shape"):
+                return
+        type_proto = self.shared_types.setdefault(type_proto.SerializeToString(), type_proto)
+        self.current_fn.value_types[name] = type_proto
+
+    def get_value_type(self, name) -> Optional[onnx.TypeProto]:
+        """Returns the statically known type of a variable, None if unknown."""
+        name = str(name)
+        for fn in [self.current_fn, *self.outer]:
+            if name in fn.value_types:
+                return fn.value_types[name]
+        return None
+
+    def get_elem_type(self, name) -> Optional[onnx.TypeProto]:
+        """Returns the type of a tensor variable without its shape, None if unknown."""
+        type_proto = self.get_value_type(name)
+        if type_proto is None or not type_proto.HasField("tensor_type"):
+            return None
+        if type_proto.tensor_type.elem_type == 0:
+            return None
+        return helper.make_tensor_type_proto(type_proto.tensor_type.elem_type, None)
+
+    def get_shaped_type(self, name) -> Optional[onnx.TypeProto]:
+        """Returns the type of a tensor variable if all its dimensions are named or known."""
+        type_proto = self.get_value_type(name)
+        if self.get_elem_type(name) is None or not type_proto.tensor_type.HasField("shape"):
+            return None
+        for d in type_proto.tensor_type.shape.dim:
+            if not d.HasField("dim_value") and not d.HasField("dim_param"):
+                return None
+        return type_proto
+
+    def get_static_shape(self, name) -> Optional[List[int]]:
+        """Returns the shape of a variable if it is known at translation time."""
+        type_proto = self.get_value_type(name)
+        if type_proto is not None and type_proto.tensor_type.HasField("shape"):
+            dims = type_proto.tensor_type.shape.dim
+            if all(d.HasField("dim_value") for d in dims):
+                return [d.dim_value for d in dims]
+        stmt = self.find_stmt(name)
+        if stmt is not None and stmt.callee.opname == "Shape" and not stmt.attrs:
+            # The output of Shape is a 1D-tensor whose size is the rank of its input.
+            type_proto = self.get_value_type(stmt.args[0])
+            if type_proto is not None and type_proto.tensor_type.HasField("shape"):
+                return [len(type_proto.tensor_type.shape.dim)]
+        return None
+
+    def find_stmt(self, name) -> Optional[irbuilder.IRStmt]:
+        """Returns the statement computing a variable, None if it is not computed."""
+        name = str(name)
+        for fn in [self.current_fn, *self.outer]:
+            for stmt in reversed(fn.stmts):
+                if name in stmt.output_names:
+                    return stmt
+        return None
+
+    def eval_static_value(self, name) -> Optional[numpy.ndarray]:
+        """Computes the value of a variable at translation time, None if unknown.
+
+        Values are computed from the constants, the statically known shapes (for
+        the ops Shape and Size) and by evaluating the ops whose inputs are known.
+        """
+        stmt = self.find_stmt(name)
+        if stmt is None or isinstance(stmt.callee, values.OnnxFunction):
+            return None
+        if stmt.callee.opname == "Constant":
+            return optimizer.constant_value(stmt)
+        if stmt.callee.opname in {"Shape", "Size"} and not stmt.attrs:
+            shape = self.get_static_shape(stmt.args[0])
+            if shape is None:
+                return None
+            if stmt.callee.opname == "Shape":
+                return numpy.array(shape, dtype=numpy.int64)
+            return numpy.array(numpy.prod(shape), dtype=numpy.int64)
+        if not optimizer.is_foldable(stmt):
+            return None
+        inputs = []
+        for x in stmt.args:
+            if x is None or str(x) == "":
+                inputs.append(None)
+                continue
+            value = self.eval_static_value(x)
+            if value is None:
+                return None
+            inputs.append(value)
+        outputs = optimizer.evaluate_statement(stmt, inputs)
+        if outputs is None:
+            return None
+        return outputs[stmt.output_names.index(str(name))]
+
+    def infer_types(self, outputs, callee, inputs, attrs) -> None:
+        """Infers the types of the outputs of a statement from its op schema."""
+        if not isinstance(callee, values.Op) or isinstance(callee, values.OnnxFunction):
+            return
+        if callee.opname in {"If", "Loop", "Scan"}:
+            # Types of control-flow outputs are computed from their subgraphs.
+            return
+        attributes = [a.attr_proto for a in attrs]
+        if any(a.ref_attr_name for a in attributes):
+            return
+        if callee.opname == "Constant" and len(attributes) == 1:
+            value = optimizer.constant_value(irbuilder.IRStmt(outputs, callee, inputs, attrs))
+            if value is not None:
+                self.constant_tensors[outputs[0]] = numpy_helper.from_array(value, outputs[0])
+        schema = callee.get_schema()
+        if schema is None:
+            return
+        input_names = ["" if x is None else str(x) for x in inputs]
+        input_types = {}
+        for x in input_names:
+            if x:
+                type_proto = self.get_value_type(x)
+                if type_proto is None or self.get_elem_type(x) is None:
+                    return
+                input_types[x] = type_proto
+        input_data = {
+            x: self.constant_tensors[x] for x in input_types if x in self.constant_tensors
+        }
+        node = helper.make_node(
+            callee.opname, input_names, outputs, domain=callee.opset.domain
+        )
+        node.attribute.extend(attributes)
+        opset_imports = [helper.make_opsetid(callee.opset.domain, callee.opset.version)]
+        try:
+            output_types = onnx.shape_inference.infer_node_outputs(
+                schema, node, input_types, input_data, opset_imports=opset_imports
+            )
+        except Exception as e:  # pylint: disable=broad-except
+            logger.debug("Converter:infer_types:%s:%s", callee.opname, e)
+            return
+        for name, type_proto in output_types.items():
+            self.set_value_type(name, type_proto)
+
+    def retype_constant(self, name: str, like: str) -> bool:
+        """Converts the Constant statement defining name to the element type of like.
+
+        Returns False if the element type of like is not statically known.
+        """
+        elem_type = self.get_elem_type(like)
+        if elem_type is None or name not in self.constant_tensors:
+            return False
+        dtype = onnx.mapping.TENSOR_TYPE_TO_NP_TYPE.get(elem_type.tensor_type.elem_type)
+        if dtype is None or dtype.kind not in "biuf":
+            return False
+        for stmt in reversed(self.current_fn.stmts):
+            if stmt.output_names == [name]:
+                if stmt.attrs[0].attr_proto.name != "value":
+                    # Constants given as value_int(s) or value_float(s) are typed explicitly.
+                    return False
+                value = numpy_helper.to_array(self.constant_tensors[name]).astype(dtype)
+                tensor = helper.make_tensor(
+                    name,
+                    elem_type.tensor_type.elem_type,
+                    value.shape,
+                    value.flatten().tolist(),
+                )
+                stmt.attrs = [self.ir_builder.make_attr("value", tensor)]
+                self.constant_tensors[name] = tensor
+                self.set_value_type(
+                    name,
+                    helper.make_tensor_type_proto(
+                        elem_type.tensor_type.elem_type, value.shape
+                    ),
+                )
+                return True
+        return False
 
     def emit_loop(self, outputs, callee, inputs, attrs, info, sub_functions=None):
         def rename(x):
@@ -416,6 +653,51 @@ class Converter:
                 )
             ) from e
 
+    def eval_static_condition(self, expr) -> Optional[bool]:
+        """Evaluates a condition whose value is known at translation time.
+
+        Returns None if the value of the condition is only known at runtime.
+        """
+        value = self.eval_static_expr(expr)
+        return None if value is None else bool(value)
+
+    def eval_static_expr(self, expr) -> Any:
+        """Evaluates an expression whose value is known at translation time.
+
+        The expression may refer to literals, global python constants and the
+        attribute-parameters whose value is known. Returns None if the value
+        of the expression is only known at runtime.
+        """
+        static_nodes = (
+            ast.Name,
+            ast.Constant,
+            ast.Compare,
+            ast.BoolOp,
+            ast.UnaryOp,
+            ast.BinOp,
+            ast.Tuple,
+            ast.List,
+            ast.expr_context,
+            ast.cmpop,
+            ast.boolop,
+            ast.unaryop,
+            ast.operator,
+        )
+        names = {}
+        for node in ast.walk(expr):
+            if not isinstance(node, static_nodes):
+                return None
+            if isinstance(node, ast.Name):
+                if not self.is_bound(node.id):
+                    # Unbound names are reported by the translation of the expression.
+                    return None
+                val = self.lookup(node.id, self.source_of(node))
+                if not isinstance(val, (bool, int, float, str, tuple, list, type(None))):
+                    return None
+                names[node.id] = val
+        cpl = compile(ast.Expression(expr), filename="<ast>", mode="eval")  # noqa: DUO110
+        return eval(cpl, {}, names)  # noqa: DUO104
+
     def translate_attr(self, attr_name, expr):
         """Translate an attribute-value specification of the form `attr_name=<expr>`
         in a call to an op. expr is an AST. The following cases are supported:
@@ -519,6 +801,8 @@ class Converter:
             A[-1]
             A[0]
             A[:0:-1]
+            A[::-1]
+            A[1::-1]
 
         *i* is a tensor holding one integer.
 
@@ -533,87 +817,38 @@ class Converter:
 
             A[i:i+j, k]
 
-        Not supported:
-
-        ::
-
-            A[::-1]
+        Statically known bounds, steps and indices are combined into a single
+        INT64 constant for each of the starts, ends, axes and steps inputs of the
+        `Slice` op, so that no node is needed at runtime to build them.
         """
         var = self.translate_expr(node.value)
         var_name = var.name
 
         info = self.source_of(node.slice if use_subscript else node)
 
-        def _get_arg(node_arg, axis, zero, one, default_value=None):
-            if node_arg is None:
-                if default_value is None:
-                    return "", None
-                # The default value for the extremities depends on the step.
-                # This one is usually positive unless it is a constant,
-                # otherwise it is unknown.
-                if default_value == "begin":
-                    return zero.name, None
-                if default_value == "begin_":
-                    self.fail(
-                        node,
-                        "`?::-1` cannot be expressed with ONNX, `?:0:-1` misses "
-                        "the first line, `:-1:-1` returns an empty tensor.",
-                    )
-                if default_value == "end":
-                    shape_name = self.generate_unique_name(f"{var_name}_shape")
-                    self.emit(
-                        [shape_name],
-                        values.Op(self.default_opset, "Shape"),
-                        [var_name],
-                        [],
-                    )
-                    dim_name = self.generate_unique_name(f"{shape_name}_dim")
-                    self.emit(
-                        [dim_name],
-                        values.Op(self.default_opset, "Gather"),
-                        [shape_name, axis.name],
-                        [],
-                    )
-                    return dim_name, None
-                raise RuntimeError(f"Unexpected default value {default_value!r}.")
-
-            name = self.translate_expr(node_arg).name
-            reshaped = self.generate_unique_name(f"{name}_reshaped")
-            self.emit(
-                [reshaped],
-                values.Op(self.default_opset, "Reshape"),
-                [name, one.name],
-                [],
-            )
-            if self.is_constant_expr(node_arg):
-                cst = self.eval_constant_expr(node_arg)
-            else:
-                cst = None
-            return reshaped, cst
-
-        def _get_slice_input(node_slice, axis, zero, one):
-            step_name, cst = _get_arg(node_slice.step, axis, zero, one)
-            if cst is not None and cst < 0:
-                # handling [::-1]
-                def_a, def_b = "end", "begin_"
-            else:
-                def_a, def_b = "begin", "end"
-            lower_name, _ = _get_arg(node_slice.lower, axis, zero, one, default_value=def_a)
-            upper_name, _ = _get_arg(node_slice.upper, axis, zero, one, default_value=def_b)
-            inputs = [var_name, lower_name, upper_name, axis.name]
-            if step_name != "":
-                inputs.append(step_name)
-            return inputs
-
         if use_subscript:
             node_slice = node.slice
         else:
             node_slice = getattr(node.slice, "value", None)
 
         if self.is_constant_expr(node_slice):
-            # A[i], i is an integer
+            # A[i], i is an integer: a Gather with a scalar index removes the axis.
             index = self.eval_constant_expr(node_slice)
-            var_index = self.emit_const([index], "subscript_index", info)
+            var_index = self.emit_const(index, "subscript_index", info)
+            return values.Op(self.default_opset, "Gather"), [var_name, var_index.name], []
+
+        if isinstance(node.slice, ast.Slice):
+            # A[a:b:c], a, b, c are expressions equivalent to integers
+            elts = [node.slice]
+        elif isinstance(node.slice, ast.Tuple):
+            # A[a:b, c:d, e], a, b, c, d, e are expressions equivalent to integers
+            # tuple can be any length
+            elts = node.slice.elts
+        elif not use_subscript and isinstance(node.slice, ast.ExtSlice):
+            elts = node.slice.dims
+        else:
+            # A[i], i is an expression equivalent to an integer
+            var_index = self.translate_expr(node_slice)
             tmp = self.generate_unique_name(f"{var_name}_gather")
             self.emit(
                 [tmp],
@@ -622,126 +857,113 @@ class Converter:
                 [],
             )
             axis = self.emit_const([0], "subscript_axis", info)
-            inputs = [tmp, axis.name]
-            return values.Op(self.default_opset, "Squeeze"), inputs, []
+            return values.Op(self.default_opset, "Squeeze"), [tmp, axis.name], []
 
-        if isinstance(node.slice, ast.Slice):
-            # A[a:b], a, b are expressions equivalent to integers
-            one = self.emit_const([1], "one", info)
-            axis = self.emit_const([0], "subscript_axis", info)
-            inputs = _get_slice_input(node.slice, axis, axis, one)
-            return values.Op(self.default_opset, "Slice"), inputs, []
+        one = None
 
-        if isinstance(node.slice, ast.Tuple) or (
-            not use_subscript and isinstance(node.slice, ast.ExtSlice)
-        ):
-            # A[a:b, c:d, e], a, b, c, d, e are expressions equivalent to integers
-            # tuple can be any length
-            if isinstance(node.slice, ast.Tuple):
-                elts = node.slice.elts
-            else:
-                elts = node.slice.dims
-            one = self.emit_const([1], "one", info)
-            zero = None
-            starts = []
-            ends = []
-            axes = []
-            steps = []
-            squeezed_axes = []
-            for axis, elt in enumerate(elts):
-                if self.is_constant_expr(elt) or (
-                    not use_subscript and isinstance(elt, ast.Index)
-                ):
-                    # if the tuple contains a constant, it is replaced
-                    # by a slice and processed like any other slice
-                    element = None
-                    if use_subscript:
-                        index = self.eval_constant_expr(elt)
-                    else:
-                        try:
-                            index = self.eval_constant_expr(elt.value)
-                        except NameError:
-                            element = elt
-                    if element is None:
-                        squeezed_axes.append(axis)
-                        kwargs = dict(
-                            lineno=getattr(elt, "lineno", node.lineno),
-                            col_offset=getattr(elt, "col_offset", node.col_offset),
-                        )
-                        element = ast.Slice(
-                            ast.Constant(index, **kwargs),
-                            ast.Constant(index + 1, **kwargs),
-                            ast.Constant(1, **kwargs),
-                        )
-                else:
-                    element = elt
-
-                var_axis = self.emit_const([axis], f"ax{axis}", info)
-                if axis == 0:
-                    zero = var_axis
-
-                if isinstance(element, ast.Slice):
-                    # process slice index
-                    inputs = _get_slice_input(element, var_axis, zero, one)
-                    starts.append(inputs[1])
-                    ends.append(inputs[2])
-                    axes.append(var_axis.name)
-                    steps.append(inputs[4] if len(inputs) > 4 else one.name)
-                    continue
+        def get_one():
+            nonlocal one
+            if one is None:
+                one = self.emit_const([1], "one", info)
+            return one.name
 
+        def to_1d(expr) -> str:
+            # Reshapes a dynamic scalar bound into a tensor of shape [1].
+            name = self.translate_expr(expr).name
+            reshaped = self.generate_unique_name(f"{name}_reshaped")
+            self.emit(
+                [reshaped], values.Op(self.default_opset, "Reshape"), [name, get_one()], []
+            )
+            return reshaped
+
+        def get_bound(expr):
+            # Returns a python int for a static bound, or the name of a 1D tensor.
+            if self.is_constant_expr(expr):
+                return self.eval_constant_expr(expr)
+            return to_1d(expr)
+
+        # Each list contains, for every sliced axis, either a python int (statically
+        # known value) or the name of a 1D tensor of one element (dynamic value).
+        starts: list[Union[int, str]] = []
+        ends: list[Union[int, str]] = []
+        steps: list[Union[int, str]] = []
+        axes = []
+        squeezed_axes = []
+        for axis, elt in enumerate(elts):
+            if not use_subscript and isinstance(elt, ast.Index):
+                elt = elt.value
+            if isinstance(elt, ast.Slice):
+                step = 1 if elt.step is None else get_bound(elt.step)
+                negative_step = isinstance(step, int) and step < 0
+                if elt.lower is not None:
+                    start = get_bound(elt.lower)
+                else:
+                    # Out of range values are clamped by the Slice op.
+                    start = _INT64_MAX if negative_step else 0
+                if elt.upper is not None:
+                    end = get_bound(elt.upper)
+                else:
+                    end = _INT64_MIN if negative_step else _INT64_MAX
+            elif self.is_constant_expr(elt):
+                # A constant index is replaced by a slice of one element,
+                # and the axis is squeezed.
+                start = self.eval_constant_expr(elt)
+                end = start + 1 if start != -1 else _INT64_MAX
+                step = 1
+                squeezed_axes.append(axis)
+            else:
                 # not a constant, not a slice -> an expression
+                start = to_1d(elt)
+                end = self.generate_unique_name(f"{var_name}_end")
+                self.emit([end], values.Op(self.default_opset, "Add"), [start, get_one()], [])
+                step = 1
                 squeezed_axes.append(axis)
-                index = self.translate_expr(element).name
-                starts.append(index)
-                index_1 = self.generate_unique_name(f"{var_name}_end")
-                self.emit([index_1], values.Op(self.default_opset, "Add"), [index, one], [])
-                ends.append(index_1)
-                axes.append(var_axis.name)
-                steps.append(one.name)
-
+            starts.append(start)
+            ends.append(end)
+            steps.append(step)
+            axes.append(axis)
+
+        def concat(parts, suggested_name) -> str:
+            # Consecutive static values are emitted as a single constant.
+            inputs: list[str] = []
+            static: list[int] = []
+            for part in parts:
+                if isinstance(part, str):
+                    if static:
+                        inputs.append(self.emit_const(static, suggested_name, info).name)
+                        static = []
+                    inputs.append(part)
+                else:
+                    static.append(part)
+            if static:
+                inputs.append(self.emit_const(static, suggested_name, info).name)
+            if len(inputs) == 1:
+                return inputs[0]
+            result = self.generate_unique_name(suggested_name)
             attr = self.ir_builder.make_attr("axis", 0)
-            start_name = self.generate_unique_name(f"{var_name}_start")
-            self.emit([start_name], values.Op(self.default_opset, "Concat"), starts, [attr])
-
-            end_name = self.generate_unique_name(f"{var_name}_end")
-            self.emit([end_name], values.Op(self.default_opset, "Concat"), ends, [attr])
-
-            axes_name = self.generate_unique_name(f"{var_name}_axis")
-            self.emit([axes_name], values.Op(self.default_opset, "Concat"), axes, [attr])
+            self.emit([result], values.Op(self.default_opset, "Concat"), inputs, [attr])
+            return result
 
-            steps_name = self.generate_unique_name(f"{var_name}_step")
-            self.emit([steps_name], values.Op(self.default_opset, "Concat"), steps, [attr])
-            if len(squeezed_axes) > 0:
-                sliced_name = self.generate_unique_name(f"{var_name}sliced")
-                self.emit(
-                    [sliced_name],
-                    values.Op(self.default_opset, "Slice"),
-                    [var_name, start_name, end_name, axes_name, steps_name],
-                    [],
-                )
-                squeezed_axis = self.emit_const(squeezed_axes, f"squeezed_ax{axis}", info)
-                return (
-                    values.Op(self.default_opset, "Squeeze"),
-                    [sliced_name, squeezed_axis],
-                    [],
-                )
+        inputs = [
+            var_name,
+            concat(starts, f"{var_name}_start"),
+            concat(ends, f"{var_name}_end"),
+        ]
+        # Inputs axes and steps are optional, their default values are
+        # [0, 1, ..., len(starts) - 1] and [1, 1, ...].
+        if any(s != 1 for s in steps):
+            inputs.append(concat(axes, f"{var_name}_axis"))
+            inputs.append(concat(steps, f"{var_name}_step"))
+        if len(squeezed_axes) > 0:
+            sliced_name = self.generate_unique_name(f"{var_name}sliced")
+            self.emit([sliced_name], values.Op(self.default_opset, "Slice"), inputs, [])
+            squeezed_axis = self.emit_const(squeezed_axes, f"squeezed_ax{axis}", info)
             return (
-                values.Op(self.default_opset, "Slice"),
-                [var_name, start_name, end_name, axes_name, steps_name],
+                values.Op(self.default_opset, "Squeeze"),
+                [sliced_name, squeezed_axis],
                 [],
             )
-
-        # A[i], i is an expression equivalent to an integer
-        var_index = self.translate_expr(node_slice)
-        tmp = self.generate_unique_name(f"{var_name}_gather")
-        self.emit(
-            [tmp],
-            values.Op(self.default_opset, "Gather"),
-            [var_name, var_index.name],
-            [],
-        )
-        axis = self.emit_const([0], "subscript_axis", info)
-        return values.Op(self.default_opset, "Squeeze"), [tmp, axis.name], []
+        return values.Op(self.default_opset, "Slice"), inputs, []
 
     def translate_call_expr(self, node):
         """Translates a call-expression.
@@ -860,10 +1082,12 @@ class Converter:
             module = self.translate_opset_expr(node.value)
             self.set_default_opset(module, node)
             opname = node.attr
-            if opname in module:
-                return values.Op(module, node.attr)
-            warn(f"'{opname}' is not a known op in '{str(module)}'")
-            return values.Op(module, node.attr)
+            key = id(module), opname
+            if key not in self.shared_ops:
+                if opname not in module:
+                    warn(f"'{opname}' is not a known op in '{str(module)}'")
+                self.shared_ops[key] = values.Op(module, opname)
+            return self.shared_ops[key]
         if isinstance(node, ast.Name):
             function_name = node.id
             found = self.lookup(function_name, self.source_of(node), raise_exception=False)
@@ -1001,11 +1225,27 @@ class Converter:
         return ret(val, 0, "")
 
     def translate_if_stmt(self, stmt: ast.If):
+        static_test = self.eval_static_condition(stmt.test)
+        if static_test is not None:
+            # The branch is selected at translation time, no If is needed.
+            for s in stmt.body if static_test else stmt.orelse:
+                self.translate_stmt(s)
+            return
         if hasattr(stmt, "live_out"):
             live_defs = list(stmt.live_out.intersection(analysis.defs(stmt)))
         else:
             live_defs = list(analysis.defs(stmt))
+        num_stmts = len(self.current_fn.stmts)
         test = self.translate_expr(stmt.test, "cond").name
+        test_value = self.eval_static_value(test)
+        if test_value is not None and test_value.size == 1:
+            # The condition only depends on statically known values (such as the
+            # rank of the inputs): the statements computing it are removed and
+            # the selected branch is translated without an If.
+            del self.current_fn.stmts[num_stmts:]
+            for s in stmt.body if test_value.item() else stmt.orelse:
+                self.translate_stmt(s)
+            return
         lineno = self.source_of(stmt).lineno
         thenGraph, sub_fct_then = self.translate_block(
             stmt.body, f"thenGraph_{lineno}", live_defs, parent_stmt=stmt
@@ -1041,6 +1281,19 @@ class Converter:
             [thenAttr, elseAttr],
             sub_functions=sub_functions,
         )
+        for name, then_output, else_output in zip(renamed, thenGraph.output, elseGraph.output):
+            if then_output.type == else_output.type:
+                self.set_value_type(name, then_output.type)
+            elif (
+                then_output.type.tensor_type.elem_type
+                == else_output.type.tensor_type.elem_type
+            ):
+                self.set_value_type(
+                    name,
+                    helper.make_tensor_type_proto(
+                        then_output.type.tensor_type.elem_type, None
+                    ),
+                )
 
     def translate_loop_stmt(self, loop_stmt: Union[ast.For, ast.While]):
         # loop-variable
@@ -1060,6 +1313,12 @@ class Converter:
             if not iter.args or len(iter.args) != 1:
                 self.fail(loop_stmt, "Unsupported loop bound, it should be 'range(?)'.")
             assert not iter.keywords, "Unsupported loop bound."
+            trip_count = self.get_unrolled_trip_count(loop_stmt)
+            if trip_count is not None:
+                return self.translate_unrolled_loop(loop_stmt, trip_count)
+            scanned = self.get_scanned_tensors(loop_stmt)
+            if scanned and self.translate_scan_loop(loop_stmt, scanned):
+                return None
             o_loop_bound = self.translate_expr(iter.args[0], "loop_bound").name
             o_cond_var = self.generate_unique_name("cond_in")
             i_cond_var = o_cond_var
@@ -1088,6 +1347,14 @@ class Converter:
         scan_outputs = set()  # TODO
         outputs = list(loop_state_vars | scan_outputs)
 
+        # The element type of a loop-state variable is the one of its initial value.
+        # Its shape may change from one iteration to the next.
+        state_types = {}
+        for pv in loop_state_vars:
+            val = self.lookup(pv, self.source_of(loop_stmt), raise_exception=False)
+            if isinstance(val, values.Dynamic):
+                state_types[pv] = self.get_elem_type(val.value)
+
         # loop-condition:
         o_true = self.emit_const(True, "true", self.source_of(loop_stmt))
         # o_loop_bound = self.emit_const(3, "loop_bound")
@@ -1101,6 +1368,7 @@ class Converter:
             onnx_types.INT64,
             self.source_of(loop_stmt),
         )
+        self.set_value_type(o_loop_var, onnx_types.INT64.to_type_proto())
         self.bind(
             p_loop_var,
             values.Dynamic(o_loop_var, values.DynamicKind.Loop, self.source_of(loop_stmt)),
@@ -1112,12 +1380,14 @@ class Converter:
             onnx_types.BOOL,
             self.source_of(loop_stmt),
         )
+        self.set_value_type(i_cond_var, onnx_types.BOOL.to_type_proto())
 
         for pv in loop_state_vars:
             ov = self.generate_unique_name(pv)
-            # TODO: retrieve the annotation for variable pv is any is specified.
-            # typeinfo = self.eval_constant_expr(pv.annotation)
             typeinfo = None
+            if state_types.get(pv) is not None:
+                typeinfo = irbuilder.IRType(state_types[pv])
+                self.set_value_type(ov, state_types[pv])
             self.ir_builder.add_input(self.current_fn, ov, typeinfo, self.source_of(loop_stmt))
             self.bind(
                 pv,
@@ -1188,18 +1458,21 @@ class Converter:
                 # In this case, we create a copy of y, treating the statement as
                 # shorthand for "x = op.Identity(y)".
                 ov = self.emit_copy(ov, pv)
-            # TODO: retrieve variable type for the annotation if any.
             typeinfo = None
+            if state_types.get(pv) is not None:
+                typeinfo = irbuilder.IRType(state_types[pv])
             self.ir_builder.add_output(
                 self.current_fn, ov, typeinfo, self.source_of(loop_stmt)
             )
         body = self.exit_scope()
+        # Statements of the body not depending on the iterations are computed once.
+        optimizer.hoist_loop_invariants(body, self.current_fn)
         inputs = [o_loop_bound, o_true] + [
             self.py_var_to_onnx_var(pv, self.source_of(loop_stmt)) for pv in loop_state_vars
         ]
         graph, sub_functions = body.to_graph_and_functions()
         attrs = [self.ir_builder.make_attr("body", graph)]
-        return self.emit_loop(
+        self.emit_loop(
             outputs,
             "Loop",
             inputs,
@@ -1207,6 +1480,251 @@ class Converter:
             sub_functions=sub_functions,
             info=self.source_of(loop_stmt),
         )
+        for pv in outputs:
+            ov = self.py_var_to_onnx_var(pv, self.source_of(loop_stmt))
+            self.set_value_type(ov, state_types.get(pv))
+
+    def get_unrolled_trip_count(self, loop_stmt: ast.For) -> Optional[int]:
+        """Returns the trip-count of a for-loop to unroll, None if it is not unrolled.
+
+        A loop is unrolled if its bound is marked with `unroll` or if it is a
+        script-time constant not greater than the unroll threshold.
+        """
+        bound = loop_stmt.iter.args[0]
+        marked = False
+        if isinstance(bound, ast.Call) and isinstance(bound.func, ast.Name):
+            func = self.lookup(bound.func.id, self.source_of(bound), raise_exception=False)
+            if func is onnxscript.main.unroll:
+                if len(bound.args) != 1 or bound.keywords:
+                    self.fail(bound, "unroll expects a single argument.")
+                marked = True
+                bound = bound.args[0]
+        trip_count = self.eval_static_expr(bound)
+        has_break = any(isinstance(s, ast.Break) for s in ast.walk(loop_stmt))
+        if marked:
+            if not isinstance(trip_count, int):
+                self.fail(bound, "The trip-count of an unrolled loop must be a constant int.")
+            if has_break:
+                self.fail(loop_stmt, "A loop with a break statement cannot be unrolled.")
+            return trip_count
+        if (
+            isinstance(trip_count, int)
+            and trip_count <= self.unroll_threshold
+            and not has_break
+        ):
+            return trip_count
+        return None
+
+    def translate_unrolled_loop(self, loop_stmt: ast.For, trip_count: int):
+        """Translates the body of a for-loop once per iteration, without any ONNX Loop."""
+        for i in range(trip_count):
+            self.bind(loop_stmt.target.id, i)
+            for s in loop_stmt.body:
+                self.translate_stmt(s)
+
+    def get_scanned_tensors(self, loop_stmt: ast.For) -> List[str]:
+        """Returns the tensors a for-loop can scan over, an empty list if it needs a Loop.
+
+        A loop is scanned when its loop-variable `i` is only used to access the
+        slices `X[i]` of tensors defined outside the loop, and when every iteration
+        only updates loop-state variables. The loop is then a reduction over the
+        leading axis of those tensors and can be expressed with a `Scan`.
+        """
+        p_loop_var = loop_stmt.target.id
+        vars_def_in_loop = analysis.defs(loop_stmt.body)
+        if p_loop_var in vars_def_in_loop or p_loop_var in loop_stmt.live_out:
+            return []
+        exposed_uses = analysis.exposed_uses(loop_stmt.body, self.message)
+        loop_state_vars = vars_def_in_loop.intersection(exposed_uses | loop_stmt.live_out)
+        if not loop_state_vars:
+            return []
+        for pv in loop_state_vars:
+            # The state of a Scan keeps the shape of its initial value.
+            val = self.lookup(pv, self.source_of(loop_stmt), raise_exception=False)
+            if not isinstance(val, values.Dynamic) or self.get_shaped_type(val.value) is None:
+                return []
+        scanned: List[str] = []
+        num_uses = num_slices = 0
+        for s in loop_stmt.body:
+            for node in ast.walk(s):
+                if isinstance(node, (ast.Break, ast.FunctionDef)):
+                    return []
+                if isinstance(node, ast.Name) and node.id == p_loop_var:
+                    num_uses += 1
+                name = _scanned_tensor(node, p_loop_var)
+                if name is None:
+                    continue
+                if name in vars_def_in_loop:
+                    return []
+                val = self.lookup(name, self.source_of(node), raise_exception=False)
+                if not isinstance(val, values.Dynamic):
+                    return []
+                num_slices += 1
+                if name not in scanned:
+                    scanned.append(name)
+        if num_uses != num_slices:
+            return []
+        return scanned
+
+    def translate_scan_loop(self, loop_stmt: ast.For, scanned: List[str]) -> bool:
+        """Translates a for-loop over the slices of some tensors into a Scan.
+
+        The first slices of the tensors are gathered up to the trip-count of the
+        loop, so that the Scan runs exactly as many iterations as the equivalent
+        Loop, and fails like it if a tensor has fewer slices than the trip-count.
+        Nothing is emitted and False is returned if the shape of a loop-state
+        variable cannot be proven constant across iterations.
+        """
+        info = self.source_of(loop_stmt)
+        p_loop_var = loop_stmt.target.id
+        exposed_uses = analysis.exposed_uses(loop_stmt.body, self.message)
+        vars_def_in_loop = analysis.defs(loop_stmt.body)
+        loop_state_vars = sorted(
+            vars_def_in_loop.intersection(exposed_uses | loop_stmt.live_out)
+        )
+        # State restored if the loop falls back to a Loop.
+        num_stmts = len(self.current_fn.stmts)
+        value_types = dict(self.current_fn.value_types)
+        constant_tensors = dict(self.constant_tensors)
+        # The state of a Scan keeps the shape of its initial value.
+        state_types = {
+            pv: self.get_shaped_type(self.py_var_to_onnx_var(pv, info))
+            for pv in loop_state_vars
+        }
+
+        # scan inputs: X[range(max(n, 0))] for every scanned tensor X
+        # Unlike a Slice, a Gather fails as the Loop does if X has fewer than n slices.
+        o_loop_bound = self.translate_expr(loop_stmt.iter.args[0], "loop_bound").name
+        o_zero = self.emit_const(0, "zero", info).name
+        o_trip_count = self.generate_unique_name("trip_count")
+        self.emit(
+            [o_trip_count], values.Op(self.default_opset, "Max"), [o_loop_bound, o_zero], []
+        )
+        o_indices = self.generate_unique_name("indices")
+        self.emit(
+            [o_indices],
+            values.Op(self.default_opset, "Range"),
+            [o_zero, o_trip_count, self.emit_const(1, "one", info).name],
+            [],
+        )
+        scan_inputs = []
+        for x in scanned:
+            o_x = self.py_var_to_onnx_var(x, info)
+            o_sliced = self.generate_unique_name(f"{x}_scanned")
+            self.emit(
+                [o_sliced], values.Op(self.default_opset, "Gather"), [o_x, o_indices], []
+            )
+            scan_inputs.append(o_sliced)
+
+        # build scan_body: the loop-state variables followed by one element per tensor
+        self.enter_scope("scan_body", loop_stmt)
+        for pv in loop_state_vars:
+            ov = self.generate_unique_name(pv)
+            self.ir_builder.add_input(
+                self.current_fn, ov, irbuilder.IRType(state_types[pv]), info
+            )
+            self.set_value_type(ov, state_types[pv])
+            self.bind(pv, values.Dynamic(ov, values.DynamicKind.Loop, info))
+        elements = {}
+        for x in scanned:
+            ov = self.generate_unique_name(f"{x}_{p_loop_var}")
+            o_x = self.py_var_to_onnx_var(x, info)
+            elem_type = self.get_elem_type(o_x)
+            if elem_type is not None and self.get_value_type(o_x).tensor_type.shape.dim:
+                # An element has the shape of the scanned tensor without its first axis.
+                elem_type.CopyFrom(self.get_value_type(o_x))
+                del elem_type.tensor_type.shape.dim[0]
+            typeinfo = None
+            if elem_type is not None:
+                typeinfo = irbuilder.IRType(elem_type)
+                self.set_value_type(ov, elem_type)
+            self.ir_builder.add_input(self.current_fn, ov, typeinfo, info)
+            # Not a valid python identifier, it cannot be shadowed by a variable of the body.
+            elements[x] = f"{x}[{p_loop_var}]"
+            self.bind(elements[x], values.Dynamic(ov, values.DynamicKind.Loop, info))
+        replacer = _ScannedSliceReplacer(p_loop_var, elements)
+        for s in loop_stmt.body:
+            self.translate_stmt(replacer.visit(copy.deepcopy(s)))
+        shapes_preserved = True
+        for pv in loop_state_vars:
+            ov = self.py_var_to_onnx_var(pv, info)
+            if ov not in self.current_fn.assigned_names:
+                ov = self.emit_copy(ov, pv)
+            shapes_preserved = shapes_preserved and self.get_shaped_type(ov) == state_types[pv]
+            self.ir_builder.add_output(
+                self.current_fn, ov, irbuilder.IRType(state_types[pv]), info
+            )
+        body = self.exit_scope()
+        if not shapes_preserved:
+            # The shape of a state may change from one iteration to the next, it needs a Loop.
+            self.current_fn.stmts = self.current_fn.stmts[:num_stmts]
+            self.current_fn.value_types = value_types
+            self.constant_tensors = constant_tensors
+            return False
+        optimizer.hoist_loop_invariants(body, self.current_fn)
+        initial_states = [self.py_var_to_onnx_var(pv, info) for pv in loop_state_vars]
+        graph, sub_functions = body.to_graph_and_functions()
+        attrs = [
+            self.ir_builder.make_attr("body", graph),
+            self.ir_builder.make_attr("num_scan_inputs", len(scan_inputs)),
+        ]
+        trip_count = self.eval_static_value(o_trip_count)
+        if trip_count is not None and trip_count.size == 1 and trip_count.item() > 0:
+            self.emit_loop(
+                loop_state_vars,
+                "Scan",
+                initial_states + scan_inputs,
+                attrs,
+                sub_functions=sub_functions,
+                info=info,
+            )
+        else:
+            # onnxruntime rejects empty scan inputs, the Scan only runs if the loop does.
+            o_has_iterations = self.generate_unique_name("has_iterations")
+            self.emit(
+                [o_has_iterations],
+                values.Op(self.default_opset, "Greater"),
+                [o_trip_count, o_zero],
+                [],
+            )
+            self.enter_scope("then_branch", loop_stmt)
+            o_finals = [self.generate_unique_name(pv) for pv in loop_state_vars]
+            self.emit(
+                o_finals,
+                values.Op(self.default_opset, "Scan"),
+                initial_states + scan_inputs,
+                attrs,
+                sub_functions=sub_functions,
+            )
+            for pv, ov in zip(loop_state_vars, o_finals):
+                self.ir_builder.add_output(
+                    self.current_fn, ov, irbuilder.IRType(state_types[pv]), info
+                )
+            then_graph, then_functions = self.exit_scope().to_graph_and_functions()
+            self.enter_scope("else_branch", loop_stmt)
+            for pv, ov in zip(loop_state_vars, initial_states):
+                self.ir_builder.add_output(
+                    self.current_fn,
+                    self.emit_copy(ov, pv),
+                    irbuilder.IRType(state_types[pv]),
+                    info,
+                )
+            else_graph, _ = self.exit_scope().to_graph_and_functions()
+            self.emit_loop(
+                loop_state_vars,
+                "If",
+                [o_has_iterations],
+                [
+                    self.ir_builder.make_attr("then_branch", then_graph),
+                    self.ir_builder.make_attr("else_branch", else_graph),
+                ],
+                sub_functions=then_functions,
+                info=info,
+            )
+        for pv in loop_state_vars:
+            ov = self.py_var_to_onnx_var(pv, info)
+            self.set_value_type(ov, state_types[pv])
+        return True
 
     def translate_block(self, stmts, name, live_defs, parent_stmt=None):
         """Translation of a statement-block to GraphProto attribute."""
@@ -1222,10 +1740,13 @@ class Converter:
                     # To return an outer-scope variable, an ONNX Graph has to
                     # use an explicit copy via Identity.
                     output = self.emit_copy(output, pvar)
+                typeinfo = pv_val.typeinfo
+                if typeinfo is None and self.get_value_type(output) is not None:
+                    typeinfo = irbuilder.IRType(self.get_value_type(output))
                 self.ir_builder.add_output(
                     self.current_fn,
                     output,
-                    pv_val.typeinfo,
+                    typeinfo,
                     self.source_of(info_stmt),
                 )
             else:
@@ -1248,8 +1769,9 @@ class Converter:
                     [self.to_onnx_var(pv_val, pvar)],
                     [],
                 )
-                # TODO: retrieve the annotation if any.
                 typeinfo = None
+                if self.get_value_type(ovar) is not None:
+                    typeinfo = irbuilder.IRType(self.get_value_type(ovar))
                 self.ir_builder.add_output(
                     self.current_fn, ovar, typeinfo, self.source_of(info_stmt)
                 )
@@ -1258,9 +1780,12 @@ class Converter:
 
     def translate_nested_function_def(self, fn: ast.FunctionDef):
         """Translate a nested function definition."""
+        # The return types of the nested function do not apply to the enclosing one.
+        returntype = self.returntype
         self.enter_scope(fn.name, fn)
         self.translate_function_def(fn)
         function_ir = self.exit_scope()
+        self.returntype = returntype
         outer_scope_vars = analysis.outer_scope_variables(fn, self.message)
         function_ir.outer_scope_variables = [
             (var, self.lookup(var, self.source_of(fn))) for var in outer_scope_vars
@@ -1275,7 +1800,18 @@ class Converter:
         if args.vararg or args.kwonlyargs or args.kw_defaults or args.kwarg:
             warn(f"{fn.name}: Unsupported feature in function signature.")
         domain = self.this_module.domain
-        self.current_fn = self.ir_builder.new_function(fn.name, domain, True)
+        # Attribute values and input ranks only apply to the top-level function.
+        attribute_values = {} if self.outer else self.attribute_values
+        input_ranks = {} if self.outer else self.input_ranks
+        name = fn.name
+        if attribute_values or input_ranks:
+            # Specialized variants are named after the attribute values and input ranks.
+            suffix = "_".join(
+                [f"{k}_{v}" for k, v in sorted(attribute_values.items())]
+                + [f"{k}_rank{r}" for k, r in sorted(input_ranks.items())]
+            )
+            name = re.sub(r"\W", "_", f"{name}_{suffix}")
+        self.current_fn = self.ir_builder.new_function(name, domain, True)
         for i, x in enumerate(args.args):
             arg_with_default_start_index = len(args.args) - len(args.defaults)
             if args.defaults and i >= arg_with_default_start_index:
@@ -1295,7 +1831,12 @@ class Converter:
             else:
                 # The code can only be exported as a function.
                 typeinfo = None
-            if typeinfo and ta.is_attr_type(typeinfo):
+            if typeinfo and ta.is_attr_type(typeinfo) and x.arg in attribute_values:
+                value = attribute_values[x.arg]
+                if typeinfo in {bool, int, float, str}:
+                    value = typeinfo(value)
+                self.bind(x.arg, value)
+            elif typeinfo and ta.is_attr_type(typeinfo):
                 self.ir_builder.add_attr_parameter(
                     self.current_fn,
                     x.arg,
@@ -1304,6 +1845,17 @@ class Converter:
                 self.bind(x.arg, values.AttrRef(x.arg, typeinfo, self.source_of(x)))
             else:
                 self.ir_builder.add_input(self.current_fn, x.arg, typeinfo, self.source_of(x))
+                if ta.is_value_type(typeinfo):
+                    self.set_value_type(x.arg, typeinfo.to_type_proto())
+                if x.arg in input_ranks:
+                    elem_type = self.get_elem_type(x.arg)
+                    self.set_value_type(
+                        x.arg,
+                        helper.make_tensor_type_proto(
+                            elem_type.tensor_type.elem_type if elem_type else 0,
+                            [None] * input_ranks[x.arg],
+                        ),
+                    )
                 self.used_vars.add(x.arg)
                 self.bind(
                     x.arg,
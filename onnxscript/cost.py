@@ -0,0 +1,442 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+"""A static cost model of functions: floating-point operations and memory traffic.
+
+The cost of a node is computed from the shapes of its inputs and outputs, inferred
+for given input types, with a formula depending on its op:
+
+* elementwise ops perform one operation per output element and per input beyond the
+  first one, transcendental functions such as `Exp` or `Tanh` being counted as one
+  operation,
+* `MatMul` and `Gemm` perform a multiplication and an addition per term of each dot
+  product, `Conv` per term of each convolution window,
+* reductions perform one operation per input element, `Softmax` and the
+  normalizations a few operations per element,
+* ops moving data, such as `Reshape`, `Transpose` or `Gather`, perform no operation.
+
+Each node reads its inputs and writes its outputs once. The cost of the nodes of a
+`Loop` body is multiplied by its trip count, and the branch of an `If` with the
+largest cost is counted.
+"""
+from __future__ import annotations
+
+import dataclasses
+import math
+from typing import Callable, Mapping, Optional, Sequence
+
+import numpy as np
+import onnx
+from onnx import numpy_helper
+
+from onnxscript import irbuilder, memory, utils, values
+
+ELEMENTWISE_OPS = frozenset(
+    [
+        "Abs",
+        "Acos",
+        "Acosh",
+        "Add",
+        "And",
+        "Asin",
+        "Asinh",
+        "Atan",
+        "Atanh",
+        "BitShift",
+        "BitwiseAnd",
+        "BitwiseNot",
+        "BitwiseOr",
+        "BitwiseXor",
+        "Ceil",
+        "Celu",
+        "Clip",
+        "Cos",
+        "Cosh",
+        "Div",
+        "Elu",
+        "Equal",
+        "Erf",
+        "Exp",
+        "Floor",
+        "Gelu",
+        "Greater",
+        "GreaterOrEqual",
+        "HardSigmoid",
+        "HardSwish",
+        "IsInf",
+        "IsNaN",
+        "LeakyRelu",
+        "Less",
+        "LessOrEqual",
+        "Log",
+        "Max",
+        "Mean",
+        "Min",
+        "Mish",
+        "Mod",
+        "Mul",
+        "Neg",
+        "Not",
+        "Or",
+        "PRelu",
+        "Pow",
+        "Reciprocal",
+        "Relu",
+        "Round",
+        "Selu",
+        "Sigmoid",
+        "Sign",
+        "Sin",
+        "Sinh",
+        "Softplus",
+        "Softsign",
+        "Sqrt",
+        "Sub",
+        "Sum",
+        "Tan",
+        "Tanh",
+        "ThresholdedRelu",
+        "Where",
+        "Xor",
+    ]
+)
+
+_REDUCTION_OPS = frozenset(
+    [
+        "ArgMax",
+        "ArgMin",
+        "CumSum",
+        "GlobalAveragePool",
+        "GlobalMaxPool",
+        "ReduceL1",
+        "ReduceL2",
+        "ReduceLogSum",
+        "ReduceLogSumExp",
+        "ReduceMax",
+        "ReduceMean",
+        "ReduceMin",
+        "ReduceProd",
+        "ReduceSum",
+        "ReduceSumSquare",
+    ]
+)
+
+# The number of operations per element of the input of ops computing statistics:
+# for example, Softmax computes a maximum, a difference, an exponential, a sum and a
+# division for each element.
+_OPERATIONS_PER_ELEMENT = {
+    "BatchNormalization": 4,
+    "GroupNormalization": 8,
+    "InstanceNormalization": 8,
+    "LayerNormalization": 8,
+    "LogSoftmax": 5,
+    "LpNormalization": 3,
+    "MeanVarianceNormalization": 8,
+    "Softmax": 5,
+}
+
+_DATA_MOVEMENT_OPS = frozenset(
+    [
+        "Cast",
+        "CastLike",
+        "Compress",
+        "Concat",
+        "Constant",
+        "ConstantOfShape",
+        "DepthToSpace",
+        "Expand",
+        "EyeLike",
+        "Flatten",
+        "Gather",
+        "GatherElements",
+        "GatherND",
+        "Identity",
+        "NonZero",
+        "OneHot",
+        "Pad",
+        "Range",
+        "Reshape",
+        "ScatterElements",
+        "ScatterND",
+        "Shape",
+        "Size",
+        "Slice",
+        "SpaceToDepth",
+        "Split",
+        "Squeeze",
+        "Tile",
+        "Transpose",
+        "Trilu",
+        "Unsqueeze",
+    ]
+)
+
+
+@dataclasses.dataclass
+class NodeCost:
+    """The cost of a node."""
+
+    # The name of the first output of the node, prefixed by the names of the outputs
+    # of the nodes owning its graph for a node of a subgraph.
+    name: str
+    op_type: str
+    flops: int
+    bytes_read: int
+    bytes_written: int
+    # False if the cost is a lower bound: the shape of a value, the cost formula of the
+    # op or the trip count of an enclosing loop is unknown.
+    exact: bool = True
+
+    @property
+    def arithmetic_intensity(self) -> float:
+        """The number of operations per byte read or written."""
+        traffic = self.bytes_read + self.bytes_written
+        return self.flops / traffic if traffic else 0.0
+
+
+@dataclasses.dataclass
+class CostReport:
+    """The cost of the nodes of a function, most expensive first."""
+
+    nodes: list[NodeCost]
+
+    @property
+    def flops(self) -> int:
+        return sum(n.flops for n in self.nodes)
+
+    @property
+    def bytes_read(self) -> int:
+        return sum(n.bytes_read for n in self.nodes)
+
+    @property
+    def bytes_written(self) -> int:
+        return sum(n.bytes_written for n in self.nodes)
+
+    @property
+    def arithmetic_intensity(self) -> float:
+        traffic = self.bytes_read + self.bytes_written
+        return self.flops / traffic if traffic else 0.0
+
+    @property
+    def exact(self) -> bool:
+        return all(n.exact for n in self.nodes)
+
+    def __str__(self) -> str:
+        total = NodeCost(
+            "total", "", self.flops, self.bytes_read, self.bytes_written, self.exact
+        )
+        lines = [
+            f"{'node':<32} {'op':<20} {'flops':>14} {'read':>12} {'written':>12} "
+            f"{'intensity':>9}"
+        ]
+        for n in [*self.nodes, total]:
+            inexact = "" if n.exact else " *"
+            lines.append(
+                f"{n.name:<32} {n.op_type:<20} {n.flops:>14} {n.bytes_read:>12} "
+                f"{n.bytes_written:>12} {n.arithmetic_intensity:>9.2f}{inexact}"
+            )
+        if not self.exact:
+            lines.append("* lower bound: some shapes or costs are unknown")
+        return "\n".join(lines)
+
+
+def _shape(type_proto: Optional[onnx.TypeProto]) -> Optional[list[int]]:
+    if type_proto is None or not type_proto.HasField("tensor_type"):
+        return None
+    tensor_type = type_proto.tensor_type
+    if not tensor_type.HasField("shape"):
+        return None
+    if not all(d.HasField("dim_value") for d in tensor_type.shape.dim):
+        return None
+    return [d.dim_value for d in tensor_type.shape.dim]
+
+
+def _attribute(node: onnx.NodeProto, name: str, default):
+    for attr in node.attribute:
+        if attr.name == name:
+            return onnx.helper.get_attribute_value(attr)
+    return default
+
+
+FlopsFormula = Callable[
+    [onnx.NodeProto, Sequence[Optional[list[int]]], Sequence[Optional[list[int]]]],
+    Optional[int],
+]
+
+
+def _matmul_flops(node, inputs, outputs) -> Optional[int]:
+    if inputs[0] is None or outputs[0] is None or not inputs[0]:
+        return None
+    # The length of the dot products, A being transposed by Gemm if transA is set.
+    length = inputs[0][0] if _attribute(node, "transA", 0) else inputs[0][-1]
+    flops = 2 * math.prod(outputs[0]) * length
+    if len(inputs) > 2 and node.input[2]:
+        # The bias of Gemm is added to each output element.
+        flops += math.prod(outputs[0])
+    return flops
+
+
+def _conv_flops(node, inputs, outputs) -> Optional[int]:
+    if inputs[1] is None or outputs[0] is None:
+        return None
+    # The weight has a shape [M, C / group, k1, k2, ...].
+    window = math.prod(inputs[1][1:])
+    flops = 2 * math.prod(outputs[0]) * window
+    if len(inputs) > 2 and node.input[2]:
+        flops += math.prod(outputs[0])
+    return flops
+
+
+def _elementwise_flops(node, inputs, outputs) -> Optional[int]:
+    if outputs[0] is None:
+        return None
+    return math.prod(outputs[0]) * max(len(inputs) - 1, 1)
+
+
+def _reduction_flops(node, inputs, outputs) -> Optional[int]:
+    if inputs[0] is None:
+        return None
+    return math.prod(inputs[0])
+
+
+_FLOPS_FORMULAS: dict[str, FlopsFormula] = {
+    "Conv": _conv_flops,
+    "Gemm": _matmul_flops,
+    "MatMul": _matmul_flops,
+    **{op: _elementwise_flops for op in ELEMENTWISE_OPS},
+    **{op: _reduction_flops for op in _REDUCTION_OPS},
+    **{op: (lambda node, inputs, outputs: 0) for op in _DATA_MOVEMENT_OPS},
+}
+
+
+def _flops(
+    node: onnx.NodeProto,
+    inputs: Sequence[Optional[list[int]]],
+    outputs: Sequence[Optional[list[int]]],
+) -> Optional[int]:
+    if node.op_type in _OPERATIONS_PER_ELEMENT:
+        if inputs[0] is None:
+            return None
+        return _OPERATIONS_PER_ELEMENT[node.op_type] * math.prod(inputs[0])
+    formula = _FLOPS_FORMULAS.get(node.op_type)
+    if formula is None or node.domain not in ("", "ai.onnx"):
+        return None
+    return formula(node, inputs, outputs)
+
+
+class _GraphCost:
+    """Computes the cost of the nodes of a graph and of its subgraphs."""
+
+    def __init__(
+        self, types: Mapping[str, onnx.TypeProto], constants: Mapping[str, np.ndarray]
+    ):
+        self.types = types
+        self.constants = constants
+
+    def _size(self, name: str) -> Optional[int]:
+        if not name:
+            return 0
+        type_proto = self.types.get(name)
+        return None if type_proto is None else memory.tensor_size(type_proto)
+
+    def _trip_count(self, node: onnx.NodeProto, body: onnx.GraphProto) -> Optional[int]:
+        if node.op_type == "Loop":
+            if node.input[0] and node.input[0] in self.constants:
+                return int(self.constants[node.input[0]])
+            return None
+        if node.op_type == "Scan":
+            num_scan_inputs = _attribute(node, "num_scan_inputs", 0)
+            scan_input = node.input[len(node.input) - num_scan_inputs]
+            axes = _attribute(node, "scan_input_axes", [0])
+            shape = _shape(self.types.get(scan_input))
+            return None if shape is None else shape[axes[0]]
+        return 1
+
+    def node_costs(self, node: onnx.NodeProto, prefix: str) -> list[NodeCost]:
+        read = [self._size(x) for x in node.input]
+        written = [self._size(y) for y in node.output]
+        name = f"{prefix}{node.output[0] if node.output else node.op_type}"
+        subgraphs = [g for a in node.attribute for g in utils.subgraphs(a)]
+        flops: Optional[int]
+        if subgraphs:
+            flops = 0
+        else:
+            flops = _flops(
+                node,
+                [_shape(self.types.get(x)) for x in node.input],
+                [_shape(self.types.get(y)) for y in node.output],
+            )
+        cost = NodeCost(
+            name,
+            node.op_type,
+            flops or 0,
+            sum(s or 0 for s in read),
+            sum(s or 0 for s in written),
+            flops is not None and None not in read and None not in written,
+        )
+        costs = [cost]
+        branches = []
+        for subgraph in subgraphs:
+            trip_count = self._trip_count(node, subgraph)
+            inner = _GraphCost(
+                memory.value_types(subgraph, self.types),
+                {**self.constants, **_constants(subgraph)},
+            ).graph_costs(subgraph, f"{name}/")
+            # An unknown number of iterations is counted as one, and makes the cost inexact.
+            count = 1 if trip_count is None else max(trip_count, 0)
+            for c in inner:
+                c.flops *= count
+                c.bytes_read *= count
+                c.bytes_written *= count
+                c.exact = c.exact and trip_count is not None
+            branches.append(inner)
+        if node.op_type == "If" and branches:
+            # Only one of the branches runs: the most expensive one is counted.
+            costs.extend(max(branches, key=lambda b: sum(c.flops for c in b)))
+        else:
+            for branch in branches:
+                costs.extend(branch)
+        return costs
+
+    def graph_costs(self, graph: onnx.GraphProto, prefix: str = "") -> list[NodeCost]:
+        costs = []
+        for node in graph.node:
+            costs.extend(self.node_costs(node, prefix))
+        return costs
+
+
+def _constants(graph: onnx.GraphProto) -> dict[str, np.ndarray]:
+    constants = {t.name: numpy_helper.to_array(t) for t in graph.initializer}
+    for node in graph.node:
+        if node.op_type == "Constant" and len(node.attribute) == 1:
+            value = utils.constant_attribute_value(node.attribute[0])
+            if value is not None:
+                constants[node.output[0]] = value
+    return constants
+
+
+def estimate(
+    fn: values.OnnxFunction | irbuilder.IRFunction | onnx.ModelProto,
+    input_types: Optional[memory.InputTypes] = None,
+) -> CostReport:
+    """Estimates the floating-point operations and the memory traffic of a function.
+
+    The calls to other functions are inlined, and the nodes of subgraphs are reported
+    with the nodes owning them. Costs depending on shapes not fully known after shape
+    inference, or on ops without a cost formula, are counted as zero and the nodes are
+    marked as not exact.
+
+    Args:
+        fn: the function or the model to analyze
+        input_types: the types of the inputs of fn, as a sequence or as a mapping from
+            input names to types; by default, the declared types are used
+
+    Returns:
+        the cost of each node, sorted by decreasing number of operations
+    """
+    model = memory.infer_shapes(fn, input_types)
+    graph = model.graph
+    costs = _GraphCost(memory.value_types(graph, {}), _constants(graph)).graph_costs(graph)
+    costs.sort(key=lambda c: (c.flops, c.bytes_read + c.bytes_written), reverse=True)
+    return CostReport(costs)
@@ -56,7 +56,8 @@ class Evaluator(abc.ABC):
                     for pyvar, onnxvar in v.function_ir.outer_scope_variables:
                         closure[onnxvar.value] = v.frame.f_locals[pyvar]
                 else:
-                    attributes[k] = v.function
+                    # The closure calls the python function, keeping its graph at hand.
+                    attributes[k] = v
             elif callable(v):
                 raise ValueError(
                     f"Error: function-valued attribute {v.__name__} has no graph_proto"
@@ -270,10 +271,96 @@ class ORTMixedEvaluator(ORTEvaluator):
 ort_mixed_evaluator = ORTMixedEvaluator()
 
 
+# Bodies of SequenceMap vectorized by vmap, by body and types of the inputs of the body,
+# None for the bodies which cannot be vectorized.
+_cache_vectorized_bodies: dict[Any, tuple[irbuilder.IRFunction, Optional[Any]]] = {}
+
+
+def _vectorized_body(body: values.OnnxClosure, mapped: list[bool], elements: list):
+    """Returns the body of a SequenceMap computing all the elements at once, or None.
+
+    The outer-scope variables of the body become inputs shared by all the elements.
+    """
+    from onnxscript import batching  # pylint: disable=import-outside-toplevel
+
+    function_ir = body.function_ir
+    signature = tuple((x.dtype, x.shape) for x in elements)
+    key = id(function_ir), tuple(mapped), signature
+    if key in _cache_vectorized_bodies:
+        return _cache_vectorized_bodies[key][1]
+    wrapper_ir = irbuilder.IRFunction(function_ir.name, function_ir.domain)
+    for x in function_ir.inputs:
+        wrapper_ir.append_input(x)
+    for _, onnxvar in function_ir.outer_scope_variables:
+        wrapper_ir.append_input(irbuilder.IRVar(onnxvar.value, None, onnxvar.info))
+    for y in function_ir.outputs:
+        wrapper_ir.append_output(y)
+    for stmt in function_ir.stmts:
+        wrapper_ir.append_stmt(stmt)
+    wrapper_ir.called_functions = dict(function_ir.called_functions)
+    wrapper_ir.value_types = dict(function_ir.value_types)
+    wrapper = values.OnnxFunction(None, body.function, wrapper_ir, None, {})
+    try:
+        # pylint: disable-next=protected-access
+        vectorized = batching._vmap(
+            wrapper,
+            [0 if m else None for m in mapped],
+            0,
+            [utils.value_to_type_proto(x) for x in elements],
+            {},
+        )
+    except ValueError:
+        vectorized = None
+    _cache_vectorized_bodies[key] = function_ir, vectorized
+    return vectorized
+
+
+def _sequence_map_vectorized(inputs, body: values.OnnxClosure):
+    """Evaluates a SequenceMap whose sequences hold tensors of the same type and shape.
+
+    The elements of each sequence are stacked, and the body runs once on the stacks.
+    Returns None if the elements differ or if the body cannot be vectorized.
+    """
+    mapped = [isinstance(x, list) for x in inputs]
+    outer_values = [
+        body.frame.f_locals[pyvar] for pyvar, _ in body.function_ir.outer_scope_variables
+    ]
+    mapped += [False] * len(outer_values)
+    args = []
+    elements = []
+    for x, is_mapped in zip(list(inputs) + outer_values, mapped):
+        samples = x if is_mapped else [x]
+        # The elements of sequences computed by onnxruntime are numpy arrays.
+        samples = [v.value if isinstance(v, tensor.Tensor) else v for v in samples]
+        if not samples or not all(isinstance(v, np.ndarray) for v in samples):
+            return None
+        first = samples[0]
+        if any(v.dtype != first.dtype or v.shape != first.shape for v in samples[1:]):
+            return None
+        args.append(tensor.Tensor(np.stack(samples) if is_mapped else first))
+        elements.append(first)
+    vectorized = _vectorized_body(body, mapped, elements)
+    if vectorized is None:
+        return None
+    outputs = vectorized.function(*args)
+    if not isinstance(outputs, tuple):
+        outputs = (outputs,)
+    return [[tensor.Tensor(v) for v in y.value] for y in outputs]
+
+
 @ort_mixed_evaluator.register()
 def SequenceMap(inputs, attributes):
-    """Evaluates a SequenceMap op."""
+    """Evaluates a SequenceMap op.
+
+    When the sequences hold tensors of the same type and shape, the body is vectorized
+    by :func:`onnxscript.batching.vmap` and runs once for all the elements. Otherwise,
+    it runs once per element.
+    """
     fun = attributes["body"]
+    if isinstance(fun, values.OnnxClosure) and len(inputs[0]) > 1:
+        outputs = _sequence_map_vectorized(inputs, fun)
+        if outputs is not None:
+            return outputs
 
     def get_input_of(input_index, iter_num):
         input = inputs[input_index]
@@ -284,7 +371,151 @@ def SequenceMap(inputs, attributes):
     def get_input(iter_num):
         return [get_input_of(input_index, iter_num) for input_index in range(len(inputs))]
 
-    return [fun(*(get_input(i))) for i in range(len(inputs[0]))]
+    results = [fun(*(get_input(i))) for i in range(len(inputs[0]))]
+    if results and isinstance(results[0], tuple):
+        # One sequence per output of the body.
+        return [list(output) for output in zip(*results)]
+    return [results]
+
+
+# Sessions running the graphs of closures given to Loop, Scan and If, by graph and types
+# of the inputs of the graph.
+_cache_body_sessions: dict[Any, tuple[irbuilder.IRFunction, ort.InferenceSession]] = {}
+
+
+def _generic_type(value) -> onnx.TypeProto:
+    """Returns the type of a value, without the shape of tensors."""
+    type_proto = utils.value_to_type_proto(value)
+    if type_proto.HasField("tensor_type"):
+        type_proto.tensor_type.ClearField("shape")
+    return type_proto
+
+
+def _run_body(body: values.OnnxClosure, args) -> list:
+    """Runs the graph of a closure on the given inputs with onnxruntime.
+
+    The session is created once for each graph and types of its inputs, and reused by
+    all the iterations and calls. The outer-scope variables of the graph are inputs of
+    the session.
+    """
+    function_ir = body.function_ir
+    feeds = {x.name: os_to_ort_value(arg) for x, arg in zip(function_ir.inputs, args)}
+    for pyvar, onnxvar in function_ir.outer_scope_variables:
+        feeds[onnxvar.value] = os_to_ort_value(body.frame.f_locals[pyvar])
+    types = [_generic_type(value) for value in feeds.values()]
+    key = id(function_ir), tuple(t.SerializeToString() for t in types)
+    if key not in _cache_body_sessions:
+        num_inputs = len(function_ir.inputs)
+        model = function_ir.to_model_proto()
+        for value_info, type_proto in zip(model.graph.input, types[:num_inputs]):
+            value_info.type.CopyFrom(type_proto)
+        model.graph.input.extend(
+            onnx.helper.make_value_info(name, t)
+            for name, t in zip(list(feeds)[num_inputs:], types[num_inputs:])
+        )
+        _cache_body_sessions[key] = function_ir, _cache_(model, ["CPUExecutionProvider"])
+    session = _cache_body_sessions[key][1]
+    return [ort_to_os_value(x) for x in session.run(None, feeds)]
+
+
+def stack_scan_output(
+    values_: list, type_proto: Optional[onnx.TypeProto], axis: int = 0
+) -> np.ndarray:
+    """Stacks the values of a scan output of a Loop or Scan body along the given axis.
+
+    When the body was not run, the empty stack gets the element type and, if it is fully
+    known, the shape declared for the output of the body by type_proto. Without a known
+    shape, the empty stack has a single dimension.
+    """
+    if values_:
+        return np.moveaxis(np.stack(values_), 0, axis)
+    dtype: Any = np.float32
+    shape = [0]
+    if type_proto is not None and type_proto.HasField("tensor_type"):
+        tensor_type = type_proto.tensor_type
+        if tensor_type.elem_type:
+            dtype = onnx.helper.tensor_dtype_to_np_dtype(tensor_type.elem_type)
+        dims = tensor_type.shape.dim
+        if tensor_type.HasField("shape") and all(d.HasField("dim_value") for d in dims):
+            shape.extend(d.dim_value for d in dims)
+    empty = np.zeros(shape, dtype)
+    return np.moveaxis(empty, 0, axis) if empty.ndim > 1 else empty
+
+
+def _output_type(output: irbuilder.IRVar) -> Optional[onnx.TypeProto]:
+    return None if output.typeinfo is None else output.typeinfo.to_type_proto()
+
+
+@ort_mixed_evaluator.register()
+def If(inputs, attributes):
+    """Evaluates an If op, running the selected branch with a cached session."""
+    branch = "then_branch" if bool(inputs[0].value) else "else_branch"
+    return _run_body(attributes[branch], [])
+
+
+@ort_mixed_evaluator.register()
+def Loop(inputs, attributes):
+    """Evaluates a Loop op, running each iteration of the body with a cached session."""
+    body = attributes["body"]
+    trip_count = None if inputs[0] is None else int(inputs[0].value)
+    condition = True if len(inputs) < 2 or inputs[1] is None else bool(inputs[1].value)
+    states = list(inputs[2:])
+    num_scan_outputs = len(body.function_ir.outputs) - 1 - len(states)
+    scan_outputs: list[list[Any]] = [[] for _ in range(num_scan_outputs)]
+    iteration = 0
+    while condition and (trip_count is None or iteration < trip_count):
+        outputs = _run_body(
+            body,
+            [
+                tensor.Tensor(np.array(iteration, dtype=np.int64)),
+                tensor.Tensor(np.array(condition)),
+                *states,
+            ],
+        )
+        condition = bool(outputs[0].value)
+        states = outputs[1 : 1 + len(states)]
+        for values_, value in zip(scan_outputs, outputs[1 + len(states) :]):
+            values_.append(value.value)
+        iteration += 1
+    outputs = body.function_ir.outputs[1 + len(states) :]
+    return states + [
+        tensor.Tensor(stack_scan_output(values_, _output_type(output)))
+        for values_, output in zip(scan_outputs, outputs)
+    ]
+
+
+@ort_mixed_evaluator.register()
+def Scan(inputs, attributes):
+    """Evaluates a Scan op, running each iteration of the body with a cached session."""
+    body = attributes["body"]
+    num_scan_inputs = attributes["num_scan_inputs"]
+    num_states = len(inputs) - num_scan_inputs
+    scan_inputs = [x.value for x in inputs[num_states:]]
+    input_axes = attributes.get("scan_input_axes") or [0] * num_scan_inputs
+    input_directions = attributes.get("scan_input_directions") or [0] * num_scan_inputs
+    scan_inputs = [
+        np.flip(np.moveaxis(x, axis, 0), 0) if reverse else np.moveaxis(x, axis, 0)
+        for x, axis, reverse in zip(scan_inputs, input_axes, input_directions)
+    ]
+    states = list(inputs[:num_states])
+    num_scan_outputs = len(body.function_ir.outputs) - num_states
+    scan_outputs: list[list[Any]] = [[] for _ in range(num_scan_outputs)]
+    for i in range(scan_inputs[0].shape[0] if scan_inputs else 0):
+        outputs = _run_body(body, states + [tensor.Tensor(x[i]) for x in scan_inputs])
+        states = outputs[:num_states]
+        for values_, value in zip(scan_outputs, outputs[num_states:]):
+            values_.append(value.value)
+    output_axes = attributes.get("scan_output_axes") or [0] * num_scan_outputs
+    output_directions = attributes.get("scan_output_directions") or [0] * num_scan_outputs
+    results = []
+    for values_, output, axis, reverse in zip(
+        scan_outputs, body.function_ir.outputs[num_states:], output_axes, output_directions
+    ):
+        stacked = stack_scan_output(
+            values_[::-1] if reverse else values_, _output_type(output), axis
+        )
+        results.append(tensor.Tensor(stacked))
+    return states + results
 
 
 # Used to control the default evaluator instance. A simple approach for now.
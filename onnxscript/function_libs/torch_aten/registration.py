@@ -2,9 +2,23 @@
 
 from __future__ import annotations
 
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Mapping, Optional
+
+import onnx
 
 import onnxscript
+from onnxscript import onnx_types
+
+
+def _rank(input_type: Any) -> Optional[int]:
+    """Returns the rank described by an input type, None if it is unknown."""
+    if isinstance(input_type, int):
+        return input_type
+    if isinstance(input_type, type) and issubclass(input_type, onnx_types.TensorType):
+        input_type = input_type.to_type_proto()
+    if isinstance(input_type, onnx.TypeProto) and input_type.tensor_type.HasField("shape"):
+        return len(input_type.tensor_type.shape.dim)
+    return None
 
 
 class OverloadedFunction:
@@ -15,6 +29,27 @@ class OverloadedFunction:
         self.default: Optional[Any] = None
         self.overloads: list[Any] = []
 
+    def dispatch(self, input_types: Mapping[str, Any]) -> Any:
+        """Returns the default function specialized for the static types of its inputs.
+
+        Scripted functions are compiled again for the known ranks of the inputs,
+        so that the conditions on these ranks (such as the handling of unbatched
+        inputs or scalars) are resolved without an If. The variants are cached.
+        Traced functions are returned unchanged.
+
+        Args:
+            input_types: types of (a subset of) the inputs, by name, given as a rank,
+                an :class:`onnx.TypeProto` or a tensor type such as `FLOAT[None, 3]`.
+        """
+        input_ranks = {}
+        for name, input_type in input_types.items():
+            rank = _rank(input_type)
+            if rank is not None:
+                input_ranks[name] = rank
+        if not isinstance(self.default, onnxscript.OnnxFunction) or not input_ranks:
+            return self.default
+        return self.default.specialize(input_ranks=input_ranks)
+
 
 class Registry:
     """Registry for aten functions."""
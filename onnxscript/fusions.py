@@ -0,0 +1,191 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+"""Substitution of fused ops for their known decompositions.
+
+Recent opsets provide ops, such as `LayerNormalization` or `Mish`, which were
+previously expressed as a composition of simpler ops. Runtimes usually implement
+them with faster kernels. The rules in this module replace such compositions by
+the fused op when the opset targeted by a model provides it, and keep the
+composition otherwise.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+import onnx
+
+from onnxscript import irbuilder, optimizer, values
+from onnxscript.main import script
+from onnxscript.onnx_opset import opset1, opset14, opset17, opset18
+
+# A pattern matches its decomposition whatever the element types of its values.
+# Its ops are taken from opsets without typed signatures, which would otherwise
+# reject chains such as Sqrt(Add(...)) since Add also accepts integer tensors.
+_op13 = values.Opset("", 13)
+_op17 = values.Opset("", 17)
+_op18 = values.Opset("", 18)
+
+# Softplus(x) = log(exp(x) + 1)
+
+
+@script()
+def _softplus_pattern(x):
+    return _op13.Log(_op13.Add(_op13.Exp(x), _op13.Constant(value_float=1.0)))
+
+
+@script()
+def _softplus(x):
+    return opset1.Softplus(x)
+
+
+# HardSwish(x) = x * HardSigmoid(x) with alpha = 1/6 and beta = 0.5
+
+
+@script()
+def _hard_swish_pattern(x):
+    return opset14.Mul(x, opset14.HardSigmoid(x, alpha=1.0 / 6, beta=0.5))
+
+
+@script()
+def _hard_swish(x):
+    return opset14.HardSwish(x)
+
+
+# Mish(x) = x * tanh(softplus(x))
+
+
+@script()
+def _mish_pattern(x):
+    return opset18.Mul(x, opset18.Tanh(opset18.Softplus(x)))
+
+
+@script()
+def _mish(x):
+    return opset18.Mish(x)
+
+
+# LayerNormalization over the last axis: (x - mean) / sqrt(variance + epsilon) * scale + bias
+
+
+@script()
+def _layer_norm_pattern(x, scale, bias, epsilon):
+    mean = _op17.ReduceMean(x, axes=[-1])
+    deviation = _op17.Sub(x, mean)
+    variance = _op17.ReduceMean(_op17.Mul(deviation, deviation), axes=[-1])
+    normalized = _op17.Div(deviation, _op17.Sqrt(_op17.Add(variance, epsilon)))
+    return _op17.Add(_op17.Mul(normalized, scale), bias)
+
+
+@script()
+def _layer_norm_pattern_axes_input(x, scale, bias, epsilon):
+    # Since opset 18, the axes of ReduceMean are an input.
+    axes = _op18.Constant(value_ints=[-1])
+    mean = _op18.ReduceMean(x, axes)
+    deviation = _op18.Sub(x, mean)
+    variance = _op18.ReduceMean(_op18.Mul(deviation, deviation), axes)
+    normalized = _op18.Div(deviation, _op18.Sqrt(_op18.Add(variance, epsilon)))
+    return _op18.Add(_op18.Mul(normalized, scale), bias)
+
+
+@script()
+def _layer_norm(x, scale, bias, epsilon: float):
+    return opset17.LayerNormalization(x, scale, bias, axis=-1, epsilon=epsilon)
+
+
+def _static_shape(type_proto: Optional[onnx.TypeProto]) -> Optional[list[int | str | None]]:
+    """Returns the dimensions of a tensor type (None if unknown), None if its rank is unknown."""
+    if type_proto is None or not type_proto.tensor_type.HasField("shape"):
+        return None
+    return [
+        d.dim_value if d.HasField("dim_value") else d.dim_param or None
+        for d in type_proto.tensor_type.shape.dim
+    ]
+
+
+def _normalizes_last_axis(types: dict[str, Optional[onnx.TypeProto]]) -> bool:
+    """Checks that scale and bias broadcast like the operands of LayerNormalization.
+
+    LayerNormalization requires scale and bias to have as many elements as the
+    normalized axis, while the decomposition broadcasts them. They must be known to
+    have a shape [D] or [1, ..., 1, D], not greater than the rank of x, and D must be
+    the last dimension of x when both are known.
+    """
+    x_shape = _static_shape(types.get("x"))
+    for name in ["scale", "bias"]:
+        shape = _static_shape(types.get(name))
+        if not shape or any(d != 1 for d in shape[:-1]):
+            return False
+        if len(shape) > 1 and (x_shape is None or len(shape) > len(x_shape)):
+            return False
+        if x_shape and isinstance(x_shape[-1], int) and isinstance(shape[-1], int):
+            if x_shape[-1] != shape[-1]:
+                return False
+    return True
+
+
+# Each rule comes with the first version of the standard opset providing its fused op.
+# The Softplus substituted for log(exp(x) + 1) is computed before the Mul of a Mish:
+# it is already fused when the Mish pattern is matched.
+_FUSIONS = [
+    (1, optimizer.RewriteRule(_softplus_pattern, _softplus)),
+    (14, optimizer.RewriteRule(_hard_swish_pattern, _hard_swish)),
+    (
+        17,
+        optimizer.RewriteRule(
+            _layer_norm_pattern, _layer_norm, condition=_normalizes_last_axis
+        ),
+    ),
+    (
+        17,
+        optimizer.RewriteRule(
+            _layer_norm_pattern_axes_input, _layer_norm, condition=_normalizes_last_axis
+        ),
+    ),
+    (18, optimizer.RewriteRule(_mish_pattern, _mish)),
+]
+
+
+def _standard_opset_version(target: irbuilder.IRFunction | onnx.ModelProto) -> Optional[int]:
+    """Returns the version of the standard opset used by a model or a function.
+
+    For a model, the smallest version imported by the model or its functions is
+    returned, since the same rules are applied to all of them.
+    """
+    if isinstance(target, irbuilder.IRFunction):
+        versions = [
+            s.callee.opset.version
+            for s in target.stmts
+            if s.callee.opset.domain in ("", "ai.onnx")
+        ]
+        return versions[0] if versions else None
+    imports = [*target.opset_import]
+    for f in target.functions:
+        imports.extend(f.opset_import)
+    versions = [o.version for o in imports if o.domain in ("", "ai.onnx")]
+    return min(versions) if versions else None
+
+
+def fuse_ops(
+    target: irbuilder.IRFunction | onnx.ModelProto, opset_version: Optional[int] = None
+) -> int:
+    """Replaces in-place the known decompositions of ops by the ops themselves.
+
+    Only the ops available in the targeted version of the standard opset are
+    introduced; the decompositions of the other ops are kept unchanged.
+
+    Args:
+        target: the function or the model to rewrite
+        opset_version: the targeted version of the standard opset, by default the
+            version used by target
+
+    Returns:
+        the number of substituted decompositions
+    """
+    if opset_version is None:
+        opset_version = _standard_opset_version(target)
+    if opset_version is None:
+        return 0
+    rules = [rule for since_version, rule in _FUSIONS if since_version <= opset_version]
+    return optimizer.rewrite(target, rules)
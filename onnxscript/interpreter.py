@@ -0,0 +1,665 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+"""A dataflow interpreter running functions graph by graph.
+
+Eager mode executes a script op by op, in the order of its statements. The interpreter
+instead executes the graph of a function: a node runs as soon as the values it uses are
+computed, on a pool of threads, so that independent nodes of a wide graph run
+concurrently (ONNX Runtime and NumPy release the GIL while they compute).
+
+Primitive ops are evaluated by an :class:`onnxscript.evaluator.Evaluator`, except a few
+elementwise ops on floating-point tensors, computed by NumPy directly. Calls to other
+functions are interpreted recursively, as are the bodies of the control-flow ops `If`,
+`Loop`, `Scan` and `SequenceMap`, which can use the values of the enclosing graph.
+"""
+from __future__ import annotations
+
+import collections
+import concurrent.futures
+import dataclasses
+import math
+import os
+import sys
+import threading
+from typing import Any, Callable, Mapping, MutableMapping, Optional, Sequence, Union
+
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper
+
+from onnxscript import irbuilder, tensor, utils, values
+from onnxscript.evaluator import Evaluator
+from onnxscript.evaluator import default as default_evaluator
+from onnxscript.evaluator import stack_scan_output
+
+Function = Union[irbuilder.IRFunction, values.OnnxFunction, onnx.FunctionProto]
+
+_STANDARD_DOMAINS = frozenset(["", "ai.onnx"])
+
+# Number of free arrays of a given size and type kept for reuse.
+_MAX_BUFFERS = 4
+
+# Ops whose subgraphs are run by the interpreter itself.
+_CONTROL_FLOW_OPS = frozenset(["If", "Loop", "Scan", "SequenceMap"])
+
+# Ops computed by NumPy when their inputs are floating-point tensors of the same type.
+_NUMPY_KERNELS: dict[str, np.ufunc] = {
+    "Abs": np.absolute,
+    "Add": np.add,
+    "Cos": np.cos,
+    "Div": np.divide,
+    "Exp": np.exp,
+    "Log": np.log,
+    "MatMul": np.matmul,
+    "Max": np.maximum,
+    "Min": np.minimum,
+    "Mul": np.multiply,
+    "Neg": np.negative,
+    "Pow": np.power,
+    "Reciprocal": np.reciprocal,
+    "Sin": np.sin,
+    "Sqrt": np.sqrt,
+    "Sub": np.subtract,
+    "Tanh": np.tanh,
+}
+
+
+@dataclasses.dataclass
+class _Node:
+    name: str
+    op_type: str
+    domain: str
+    inputs: list[str]
+    outputs: list[str]
+    attributes: dict[str, Any]
+    # Attributes referring to an attribute of the enclosing function.
+    references: dict[str, str]
+    schema: Optional[onnx.defs.OpSchema]
+    # The function called by the node, if it is not a primitive op.
+    function: Optional[Union[values.OnnxFunction, onnx.FunctionProto]]
+    # Names used by the subgraphs of the node, some of them from the enclosing graph.
+    captured: set[str]
+    # Names of the values used by the node, as inputs or by its subgraphs.
+    uses: set[str] = dataclasses.field(init=False)
+
+    def __post_init__(self) -> None:
+        self.uses = {name for name in self.inputs if name} | self.captured
+
+
+@dataclasses.dataclass
+class _Graph:
+    inputs: list[str]
+    outputs: list[str]
+    nodes: list[_Node]
+    constants: dict[str, tensor.Tensor]
+    opsets: Mapping[str, int]
+    functions: Mapping[tuple[str, str], onnx.FunctionProto]
+    # Default values of the attributes of the function.
+    defaults: dict[str, Any]
+    # Number of nodes using each value: a value dies when they have all run.
+    use_counts: collections.Counter = dataclasses.field(init=False)
+
+    def __post_init__(self) -> None:
+        self.use_counts = collections.Counter(
+            name for node in self.nodes for name in node.uses
+        )
+
+
+def _attributes(
+    attrs: Sequence[onnx.AttributeProto],
+) -> tuple[dict[str, Any], dict[str, str], set[str]]:
+    attributes: dict[str, Any] = {}
+    references: dict[str, str] = {}
+    captured: set[str] = set()
+    for attr in attrs:
+        if attr.ref_attr_name:
+            references[attr.name] = attr.ref_attr_name
+        else:
+            attributes[attr.name] = helper.get_attribute_value(attr)
+        for subgraph in utils.subgraphs(attr):
+            captured |= utils.referenced_names(subgraph)
+    return attributes, references, captured
+
+
+def _from_function_ir(function_ir: irbuilder.IRFunction) -> _Graph:
+    called_functions = dict(function_ir.called_functions)
+    for stmt in function_ir.stmts:
+        # Functions called by the subgraphs of the statement.
+        called_functions.update(stmt.functions)
+    functions = {(f.domain, f.name): f for f in called_functions.values()}
+    nodes = []
+    for i, stmt in enumerate(function_ir.stmts):
+        attributes, references, captured = _attributes([a.attr_proto for a in stmt.attrs])
+        callee = stmt.callee
+        function: Optional[Union[values.OnnxFunction, onnx.FunctionProto]]
+        if isinstance(callee, values.OnnxFunction):
+            function = callee
+        else:
+            function = functions.get((callee.opset.domain, callee.opname))
+        nodes.append(
+            _Node(
+                f"n{i}",
+                callee.opname,
+                callee.opset.domain,
+                ["" if x is None else str(x) for x in stmt.args],
+                list(stmt.output_names),
+                attributes,
+                references,
+                callee.get_schema() if function is None else None,
+                function,
+                captured,
+            )
+        )
+    return _Graph(
+        [x.name for x in function_ir.inputs],
+        [y.name for y in function_ir.outputs],
+        nodes,
+        {},
+        function_ir.get_opset_import(),
+        functions,
+        {
+            a.attr_proto.name: helper.get_attribute_value(a.attr_proto)
+            for a in function_ir.attr_protos
+        },
+    )
+
+
+def _from_nodes(
+    node_protos: Sequence[onnx.NodeProto],
+    inputs: list[str],
+    outputs: list[str],
+    constants: dict[str, tensor.Tensor],
+    opsets: Mapping[str, int],
+    functions: Mapping[tuple[str, str], onnx.FunctionProto],
+    defaults: dict[str, Any],
+) -> _Graph:
+    nodes = []
+    for i, node in enumerate(node_protos):
+        attributes, references, captured = _attributes(node.attribute)
+        function = functions.get((node.domain, node.op_type))
+        schema = None
+        if function is None:
+            schema = values.Opset(node.domain, opsets.get(node.domain, 1))[node.op_type]
+        nodes.append(
+            _Node(
+                node.name or f"n{i}",
+                node.op_type,
+                node.domain,
+                list(node.input),
+                list(node.output),
+                attributes,
+                references,
+                schema,
+                function,
+                captured,
+            )
+        )
+    return _Graph(inputs, outputs, nodes, constants, opsets, functions, defaults)
+
+
+def _from_function_proto(
+    function: onnx.FunctionProto, functions: Mapping[tuple[str, str], onnx.FunctionProto]
+) -> _Graph:
+    defaults = {
+        attr.name: helper.get_attribute_value(attr)
+        for attr in getattr(function, "attribute_proto", [])
+    }
+    return _from_nodes(
+        function.node,
+        list(function.input),
+        list(function.output),
+        {},
+        {opset.domain: opset.version for opset in function.opset_import},
+        functions,
+        defaults,
+    )
+
+
+def _from_graph_proto(graph: onnx.GraphProto, enclosing: _Graph) -> _Graph:
+    constants = {
+        initializer.name: tensor.Tensor(numpy_helper.to_array(initializer))
+        for initializer in graph.initializer
+    }
+    return _from_nodes(
+        graph.node,
+        [x.name for x in graph.input],
+        [y.name for y in graph.output],
+        constants,
+        enclosing.opsets,
+        enclosing.functions,
+        enclosing.defaults,
+    )
+
+
+def _declared_type(value_info: onnx.ValueInfoProto) -> Optional[onnx.TypeProto]:
+    return value_info.type if value_info.HasField("type") else None
+
+
+def _output_shape(kernel: np.ufunc, arrays: Sequence[np.ndarray]) -> Optional[tuple[int, ...]]:
+    if kernel is np.matmul:
+        a, b = arrays
+        if a.ndim < 2 or b.ndim < 2:
+            return None
+        return np.broadcast_shapes(a.shape[:-2], b.shape[:-2]) + (a.shape[-2], b.shape[-1])
+    return np.broadcast_shapes(*(array.shape for array in arrays))
+
+
+class _BufferPool:
+    """Arrays of dead values, kept to hold the outputs of NumPy kernels."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._buffers: dict[tuple[np.dtype, int], list[np.ndarray]] = collections.defaultdict(
+            list
+        )
+
+    def release(self, value: Any) -> None:
+        """Keeps the array of a dead tensor, unless something else references it."""
+        # The tensor is referenced by the argument and by getrefcount, its array by the
+        # tensor, the local variable and getrefcount: other references come from
+        # aliases of the value (such as an If returning a value of the enclosing graph).
+        if not isinstance(value, tensor.Tensor) or sys.getrefcount(value) > 2:
+            return
+        array = value.value
+        if sys.getrefcount(array) > 3 or array.ndim == 0:
+            return
+        if array.base is not None:
+            # Only buffers reshaped by acquire are reused, not views of other arrays.
+            base = array.base
+            if not isinstance(base, np.ndarray) or base.size != array.size:
+                return
+            if sys.getrefcount(base) > 3:
+                return
+            array = base
+        if not (array.flags.owndata and array.flags.c_contiguous and array.flags.writeable):
+            return
+        with self._lock:
+            buffers = self._buffers[array.dtype, array.size]
+            if len(buffers) < _MAX_BUFFERS:
+                buffers.append(array)
+
+    def acquire(self, shape: tuple[int, ...], dtype: np.dtype) -> Optional[np.ndarray]:
+        """Returns a free array of the given shape and type, if there is one."""
+        with self._lock:
+            buffers = self._buffers.get((dtype, math.prod(shape)))
+            if not buffers:
+                return None
+            return buffers.pop().reshape(shape)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buffers.clear()
+
+
+def _numpy_kernel(node: _Node, args: Sequence[Any]) -> Optional[np.ufunc]:
+    """Returns the NumPy implementation of the node if it applies to the arguments."""
+    kernel = _NUMPY_KERNELS.get(node.op_type)
+    if kernel is None or node.attributes or node.references or len(args) != kernel.nin:
+        return None
+    if not all(isinstance(arg, tensor.Tensor) for arg in args):
+        return None
+    dtype = args[0].value.dtype
+    if not np.issubdtype(dtype, np.floating):
+        return None
+    if any(arg.value.dtype != dtype for arg in args):
+        return None
+    return kernel
+
+
+class Interpreter:
+    """Runs functions by executing their graph, independent nodes in parallel.
+
+    A node is dispatched to the thread pool when all the values it uses are computed.
+    When all the workers are busy, the thread scheduling the graph runs the node
+    itself, which also lets the subgraphs of control-flow ops be scheduled from
+    worker threads without waiting for a free worker.
+
+    The interpreter drops its reference to a value as soon as all the nodes using it
+    have run, rather than when the function returns. Optionally, the arrays of these
+    dead values are reused to hold the outputs of NumPy kernels of the same size and
+    type, saving allocations.
+
+    Args:
+        max_workers: number of threads running nodes, the number of CPUs by default
+        evaluator: evaluator of the primitive ops, the default evaluator when None
+        use_numpy: whether to compute elementwise ops on floating-point tensors,
+            and `MatMul`, with NumPy rather than with the evaluator
+        functions: the functions which FunctionProtos run by the interpreter may call,
+            such as the functions of a model
+        reuse_buffers: whether to reuse the arrays of dead values for the outputs of
+            NumPy kernels
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        evaluator: Optional[Evaluator] = None,
+        use_numpy: bool = True,
+        functions: Sequence[onnx.FunctionProto] = (),
+        reuse_buffers: bool = False,
+    ) -> None:
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.evaluator = evaluator
+        self.use_numpy = use_numpy
+        self.functions = {(f.domain, f.name): f for f in functions}
+        self._buffers = _BufferPool() if reuse_buffers else None
+        self._pool = concurrent.futures.ThreadPoolExecutor(self.max_workers)
+        self._slots = threading.Semaphore(self.max_workers)
+        # Graphs of the functions and subgraphs already run, by id of their definition,
+        # along with the definition itself to keep the id in use and its version.
+        self._graphs: dict[int, tuple[Any, int, _Graph]] = {}
+
+    def __enter__(self) -> Interpreter:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Shuts the thread pool down."""
+        self._pool.shutdown()
+
+    def run(self, function: Function, *args, **attributes):
+        """Runs a function on the given inputs.
+
+        Args:
+            function: the function to run, an :class:`OnnxFunction`, its
+                :class:`IRFunction` or a FunctionProto
+            args: the inputs of the function, as in eager mode
+            attributes: the values of the attributes of the function
+
+        Returns:
+            the output of the function, or a tuple of outputs if it has several of
+            them; outputs are numpy arrays if an input is a numpy array, tensors
+            otherwise, as in eager mode
+        """
+        inputs, has_array = values._adapt_to_eager_mode(  # pylint: disable=protected-access
+            list(args)
+        )
+        try:
+            outputs = self._call(function, inputs, dict(attributes), self.functions)
+        finally:
+            if self._buffers is not None:
+                self._buffers.clear()
+        result = outputs[0] if len(outputs) == 1 else tuple(outputs)
+        if has_array:
+            return values._adapt_to_user_mode(result)  # pylint: disable=protected-access
+        return result
+
+    def _graph(self, key: Any, build: Callable[[], _Graph], version: int = 0) -> _Graph:
+        entry = self._graphs.get(id(key))
+        if entry is None or entry[0] is not key or entry[1] != version:
+            entry = (key, version, build())
+            self._graphs[id(key)] = entry
+        return entry[2]
+
+    def _call(
+        self,
+        function: Any,
+        args: Sequence[Any],
+        attributes: dict[str, Any],
+        functions: Mapping[tuple[str, str], onnx.FunctionProto],
+    ) -> list[Any]:
+        if isinstance(function, values.OnnxFunction):
+            function = function.function_ir
+        if isinstance(function, irbuilder.IRFunction):
+            # An IRFunction may still be modified: its graph is rebuilt for each version.
+            graph = self._graph(
+                function, lambda: _from_function_ir(function), function.version
+            )
+        elif isinstance(function, onnx.FunctionProto):
+            graph = self._graph(function, lambda: _from_function_proto(function, functions))
+        else:
+            raise TypeError(f"Unexpected type {type(function)} for a function.")
+        return self._run_graph(graph, args, {}, {**graph.defaults, **attributes})
+
+    def _run_subgraph(
+        self,
+        subgraph: onnx.GraphProto,
+        enclosing: _Graph,
+        args: Sequence[Any],
+        env: MutableMapping[str, Any],
+        attributes: Mapping[str, Any],
+    ) -> list[Any]:
+        graph = self._graph(subgraph, lambda: _from_graph_proto(subgraph, enclosing))
+        return self._run_graph(graph, args, env, attributes)
+
+    def _run_graph(
+        self,
+        graph: _Graph,
+        args: Sequence[Any],
+        outer: MutableMapping[str, Any],
+        attributes: Mapping[str, Any],
+    ) -> list[Any]:
+        if len(args) > len(graph.inputs):
+            raise ValueError(
+                f"Expected at most {len(graph.inputs)} inputs but {len(args)} were given."
+            )
+        local: dict[str, Any] = dict(graph.constants)
+        local.update(zip(graph.inputs, args))
+        local.update((name, None) for name in graph.inputs[len(args) :])
+        env = collections.ChainMap(local, outer)
+
+        # Number of the values used by each node which are still to be computed.
+        produced = {name for node in graph.nodes for name in node.outputs}
+        pending = []
+        consumers: dict[str, list[int]] = collections.defaultdict(list)
+        for i, node in enumerate(graph.nodes):
+            dependencies = (set(node.inputs) | node.captured) & produced
+            pending.append(len(dependencies))
+            for name in dependencies:
+                consumers[name].append(i)
+        ready = collections.deque(i for i, count in enumerate(pending) if count == 0)
+        running: dict[concurrent.futures.Future, int] = {}
+        remaining = len(graph.nodes)
+        use_counts = graph.use_counts.copy()
+        kept = set(graph.outputs)
+
+        def release(name: str) -> None:
+            if name in kept or name not in local:
+                return
+            if self._buffers is not None and name in produced:
+                self._buffers.release(local.pop(name))
+            else:
+                del local[name]
+
+        def complete(i: int, outputs: Sequence[Any]) -> None:
+            node = graph.nodes[i]
+            local.update((name, value) for name, value in zip(node.outputs, outputs) if name)
+            # From here on, the environment holds the only references to the outputs.
+            del outputs
+            for name in node.outputs:
+                for consumer in consumers.pop(name, ()):
+                    pending[consumer] -= 1
+                    if pending[consumer] == 0:
+                        ready.append(consumer)
+            for name in node.uses:
+                use_counts[name] -= 1
+                if use_counts[name] == 0:
+                    release(name)
+            for name in node.outputs:
+                if name and use_counts[name] == 0:
+                    release(name)
+
+        def arguments(node: _Node) -> list[Any]:
+            undefined = [name for name in node.inputs if name and name not in env]
+            if undefined:
+                raise ValueError(f"Node {node.name} uses undefined values {undefined}.")
+            return [env[name] if name else None for name in node.inputs]
+
+        # Only this thread updates the environment: nodes read it, possibly in workers.
+        while remaining:
+            while ready:
+                i = ready.popleft()
+                node = graph.nodes[i]
+                # The arguments are not held here, to let their values be released.
+                if self._slots.acquire(blocking=False):
+                    future = self._pool.submit(
+                        self._execute_in_worker, graph, node, arguments(node), env, attributes
+                    )
+                    running[future] = i
+                else:
+                    complete(i, self._execute(graph, node, arguments(node), env, attributes))
+                    remaining -= 1
+            if not remaining:
+                break
+            if not running:
+                blocked = [node.name for node, count in zip(graph.nodes, pending) if count]
+                raise ValueError(f"Nodes {blocked} depend on each other.")
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                complete(running.pop(future), future.result())
+                remaining -= 1
+            # The futures hold the outputs of their nodes.
+            del done, future
+        return [env[name] if name else None for name in graph.outputs]
+
+    def _execute_in_worker(self, *args) -> list[Any]:
+        try:
+            return self._execute(*args)
+        finally:
+            self._slots.release()
+
+    def _execute(
+        self,
+        graph: _Graph,
+        node: _Node,
+        args: list[Any],
+        env: MutableMapping[str, Any],
+        attributes: Mapping[str, Any],
+    ) -> list[Any]:
+        node_attributes = dict(node.attributes)
+        for name, reference in node.references.items():
+            if reference in attributes:
+                node_attributes[name] = attributes[reference]
+        if node.function is not None:
+            return self._call(node.function, args, node_attributes, graph.functions)
+        if node.domain in _STANDARD_DOMAINS:
+            if node.op_type in _CONTROL_FLOW_OPS:
+                run_control_flow = getattr(self, f"_run_{node.op_type.lower()}")
+                return run_control_flow(graph, node, args, node_attributes, env, attributes)
+            if self.use_numpy:
+                kernel = _numpy_kernel(node, args)
+                if kernel is not None:
+                    return [self._run_kernel(kernel, [arg.value for arg in args])]
+        if node.schema is None:
+            raise ValueError(
+                f"No schema or function found for op {node.domain!r}.{node.op_type}."
+            )
+        evaluator = self.evaluator or default_evaluator()
+        closure = evaluator.adapt_attributes(node.schema, node_attributes)
+        closure.update({name: env[name] for name in node.captured if name in env})
+        inputs = evaluator.adapt_inputs(node.schema, args)
+        outputs = evaluator._eval(  # pylint: disable=protected-access
+            node.schema, inputs, node_attributes, closure
+        )
+        return list(outputs)
+
+    def _run_kernel(self, kernel: np.ufunc, arrays: list[np.ndarray]) -> tensor.Tensor:
+        out = None
+        if self._buffers is not None:
+            shape = _output_shape(kernel, arrays)
+            if shape:
+                out = self._buffers.acquire(shape, arrays[0].dtype)
+        if out is None:
+            return tensor.Tensor(np.asarray(kernel(*arrays)))
+        return tensor.Tensor(kernel(*arrays, out=out))
+
+    def _run_if(self, graph, node, args, node_attributes, env, attributes) -> list[Any]:
+        branch = "then_branch" if bool(args[0].value) else "else_branch"
+        return self._run_subgraph(node_attributes[branch], graph, [], env, attributes)
+
+    def _run_loop(self, graph, node, args, node_attributes, env, attributes) -> list[Any]:
+        body = node_attributes["body"]
+        trip_count = None if args[0] is None else int(args[0].value)
+        condition = True if len(args) < 2 or args[1] is None else bool(args[1].value)
+        states = list(args[2:])
+        scan_outputs: list[list[Any]] = [[] for _ in range(len(body.output) - 1 - len(states))]
+        iteration = 0
+        while condition and (trip_count is None or iteration < trip_count):
+            outputs = self._run_subgraph(
+                body,
+                graph,
+                [
+                    tensor.Tensor(np.array(iteration, dtype=np.int64)),
+                    tensor.Tensor(np.array(condition)),
+                    *states,
+                ],
+                env,
+                attributes,
+            )
+            condition = bool(outputs[0].value)
+            states = outputs[1 : 1 + len(states)]
+            for values_, value in zip(scan_outputs, outputs[1 + len(states) :]):
+                values_.append(value.value)
+            iteration += 1
+        return states + [
+            tensor.Tensor(stack_scan_output(values_, _declared_type(output)))
+            for values_, output in zip(scan_outputs, body.output[1 + len(states) :])
+        ]
+
+    def _run_scan(self, graph, node, args, node_attributes, env, attributes) -> list[Any]:
+        body = node_attributes["body"]
+        num_scan_inputs = node_attributes["num_scan_inputs"]
+        num_states = len(args) - num_scan_inputs
+        scan_inputs = [arg.value for arg in args[num_states:]]
+        input_axes = node_attributes.get("scan_input_axes", [0] * num_scan_inputs)
+        input_directions = node_attributes.get("scan_input_directions", [0] * num_scan_inputs)
+        scan_inputs = [
+            np.flip(np.moveaxis(x, axis, 0), 0) if reverse else np.moveaxis(x, axis, 0)
+            for x, axis, reverse in zip(scan_inputs, input_axes, input_directions)
+        ]
+        states = list(args[:num_states])
+        num_scan_outputs = len(body.output) - num_states
+        scan_outputs: list[list[Any]] = [[] for _ in range(num_scan_outputs)]
+        for i in range(scan_inputs[0].shape[0] if scan_inputs else 0):
+            outputs = self._run_subgraph(
+                body,
+                graph,
+                states + [tensor.Tensor(x[i]) for x in scan_inputs],
+                env,
+                attributes,
+            )
+            states = outputs[:num_states]
+            for values_, value in zip(scan_outputs, outputs[num_states:]):
+                values_.append(value.value)
+        output_axes = node_attributes.get("scan_output_axes", [0] * num_scan_outputs)
+        output_directions = node_attributes.get(
+            "scan_output_directions", [0] * num_scan_outputs
+        )
+        results = []
+        for values_, output, axis, reverse in zip(
+            scan_outputs, body.output[num_states:], output_axes, output_directions
+        ):
+            stacked = stack_scan_output(
+                values_[::-1] if reverse else values_, _declared_type(output), axis
+            )
+            results.append(tensor.Tensor(stacked))
+        return states + results
+
+    def _run_sequencemap(
+        self, graph, node, args, node_attributes, env, attributes
+    ) -> list[Any]:
+        body = node_attributes["body"]
+        results: list[list[Any]] = [[] for _ in body.output]
+        for i in range(len(args[0])):
+            outputs = self._run_subgraph(
+                body,
+                graph,
+                [arg[i] if isinstance(arg, list) else arg for arg in args],
+                env,
+                attributes,
+            )
+            for sequence, value in zip(results, outputs):
+                sequence.append(value)
+        return results
+
+
+def run(function: Function, *args, max_workers: Optional[int] = None, **attributes):
+    """Runs a function with a new :class:`Interpreter`, see :meth:`Interpreter.run`."""
+    with Interpreter(max_workers) as interpreter:
+        return interpreter.run(function, *args, **attributes)
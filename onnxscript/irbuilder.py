@@ -7,7 +7,7 @@ from __future__ import annotations
 import io
 import logging
 import warnings
-from typing import Any, Optional, Sequence
+from typing import Any, Collection, Optional, Sequence, Union
 
 import onnx
 from onnx import ValueInfoProto, helper
@@ -40,8 +40,12 @@ def select_ir_version(version: int, domain: str = ""):
 
 
 class IRType:
-    def __init__(self):
+    __slots__ = ("onnx_type",)
+
+    def __init__(self, type_proto: Optional[onnx.TypeProto] = None):
         self.onnx_type = onnx.TypeProto()
+        if type_proto is not None:
+            self.onnx_type.CopyFrom(type_proto)
 
     def to_type_proto(self):
         return self.onnx_type
@@ -51,6 +55,8 @@ class IRType:
 
 
 class IRTensorType(IRType):
+    __slots__ = ()
+
     def __init__(self, elem_type: onnx.TensorProto.DataType) -> None:
         super().__init__()
         self.onnx_type.tensor_type.elem_type = elem_type
@@ -67,12 +73,16 @@ class IRTypeLike(Protocol):
 class IRVar:
     """A variable (representing a formal parameter)."""
 
-    def __init__(self, varname: str, typeinfo: IRTypeLike, sourceinfo: SourceInfo) -> None:
+    __slots__ = ("name", "info", "typeinfo")
+
+    def __init__(
+        self, varname: str, typeinfo: Optional[IRTypeLike], sourceinfo: Optional[SourceInfo]
+    ) -> None:
         if not isinstance(varname, str):
             raise ValueError(f"varname must be a string not {type(varname)!r}.")
         self.name = varname
-        self.info = sourceinfo
-        self.typeinfo = typeinfo
+        self.info: Optional[SourceInfo] = sourceinfo
+        self.typeinfo: Optional[IRTypeLike] = typeinfo
 
     def __str__(self):
         return self.name
@@ -94,7 +104,8 @@ class IRVar:
             an instance of :class:`onnx.ValueInfoProto`
         """
         if self.name is None:
-            raise ValueError(self.info.msg("name cannot be None."))
+            message = "name cannot be None."
+            raise ValueError(self.info.msg(message) if self.info else message)
         value_info_proto = ValueInfoProto()
         value_info_proto.name = self.name
         if self.typeinfo is not None:
@@ -104,6 +115,11 @@ class IRVar:
         return value_info_proto
 
 
+def _is_partial_tensor_type(type_proto: onnx.TypeProto) -> bool:
+    """Returns True for a tensor type whose element type is unknown."""
+    return type_proto.HasField("tensor_type") and type_proto.tensor_type.elem_type == 0
+
+
 def _opt_var_to_str(x):
     return "" if x is None else str(x)
 
@@ -111,6 +127,8 @@ def _opt_var_to_str(x):
 class IRAttributeValue:
     """An attribute value (representing an actual parameter)."""
 
+    __slots__ = ("attr_proto",)
+
     def __init__(self, attrproto) -> None:
         self.attr_proto = attrproto
 
@@ -122,6 +140,8 @@ class IRAttributeValue:
 
 
 class IRStmt:
+    __slots__ = ("result", "callee", "args", "attrs", "functions")
+
     def __init__(
         self,
         result: Sequence[str],
@@ -174,6 +194,24 @@ class IRStmt:
         return [str(x) for x in self.result]
 
 
+def _model_key(
+    functions, io_types, input_types, output_types, inline, fuse_ops, mixed_precision
+) -> Optional[tuple]:
+    """Returns the key of a model in the cache of IRFunction.to_model_proto, if any."""
+    if functions is not None:
+        # The functions may be modified after the call.
+        return None
+    return (
+        "model",
+        io_types,
+        None if input_types is None else tuple(input_types),
+        None if output_types is None else tuple(output_types),
+        inline if isinstance(inline, bool) else tuple(sorted(inline)),
+        fuse_ops,
+        mixed_precision,
+    )
+
+
 class IRFunction:
     """Represents a function in the IR."""
 
@@ -182,7 +220,11 @@ class IRFunction:
         self.name = name
         self.inputs: list[IRVar] = []
         self.outputs: list[IRVar] = []
-        self.stmts: list[IRStmt] = []
+        self._stmts: list[IRStmt] = []
+        # incremented by each modification of the function, see invalidate
+        self.version = 0
+        # protos converted from this function, by kind and conversion parameters
+        self._protos: dict[Any, Any] = {}
         # attribute parameters
         self.attrs: list[str] = []
         # attribute parameters with default value
@@ -191,7 +233,32 @@ class IRFunction:
         self.docstring: str = ""
         # a dictionary of nested function-definitions
         self.nested_functions: dict[str, IRFunction] = {}
-        self.outer_scope_variables: dict[Any, Any] = {}
+        # the python variables of enclosing scopes used by this function, with their values
+        self.outer_scope_variables: list[
+            tuple[str, Union[values.AttrRef, values.Dynamic]]
+        ] = []
+        # statically inferred types of the variables assigned in this function
+        self.value_types: dict[str, onnx.TypeProto] = {}
+
+    @property
+    def stmts(self) -> list[IRStmt]:
+        return self._stmts
+
+    @stmts.setter
+    def stmts(self, stmts: list[IRStmt]) -> None:
+        self._stmts = stmts
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """Records a modification of the function.
+
+        The version of the function is incremented and the protos converted from it are
+        discarded. The methods modifying the function call it. Code modifying the
+        statements, inputs, outputs or attributes of the function in place should call
+        it too.
+        """
+        self.version += 1
+        self._protos.clear()
 
     @property
     def assigned_names(self) -> Sequence[str]:
@@ -208,21 +275,26 @@ class IRFunction:
 
     def append_docstring(self, docstring):
         self.docstring += docstring
+        self.invalidate()
 
     def append_stmt(self, stmt: IRStmt) -> None:
         self.stmts.append(stmt)
+        self.invalidate()
 
     def append_input(self, name: IRVar) -> None:
         self.inputs.append(name)
+        self.invalidate()
 
     def append_output(self, name: IRVar) -> None:
         self.outputs.append(name)
+        self.invalidate()
 
     def add_attr_parameter(self, attr: str | IRAttributeValue) -> None:
         if isinstance(attr, IRAttributeValue):
             self.attr_protos.append(attr)
         else:
             self.attrs.append(attr)
+        self.invalidate()
 
     def debug_print(self):
         if logger.isEnabledFor(logging.DEBUG):
@@ -246,16 +318,33 @@ class IRFunction:
         except (TypeError, AttributeError) as e:
             raise TypeError(f"Issue with type f{type(fun)}.") from e
         self.called_functions[fun.name] = proto
+        self.invalidate()
 
     def add_nested_function(self, fun: "IRFunction") -> None:
         self.nested_functions[fun.name] = fun
 
+    def drop_source_info(self) -> None:
+        """Drops the source locations of the variables of this function.
+
+        They are used by the diagnostic messages of the translation only, and keep the
+        source code and parts of its syntax tree alive.
+        """
+        for x in [*self.inputs, *self.outputs]:
+            x.info = None
+        for _, value in self.outer_scope_variables:
+            value.info = None
+        for fun in self.nested_functions.values():
+            fun.drop_source_info()
+
     def to_model_proto(
         self,
         functions=None,
         io_types: Optional[ONNXType] = None,
         input_types: Optional[Sequence[ONNXType]] = None,
         output_types: Optional[Sequence[ONNXType]] = None,
+        inline: bool | Collection[str] = False,
+        fuse_ops: bool = False,
+        mixed_precision: Optional[type] = None,
         **kwargs,
     ) -> onnx.ModelProto:
         """Converts this instance into a `onnx.ModelProto`.
@@ -269,11 +358,62 @@ class IRFunction:
                 are set to be of the corresponding type in this list.
             output_types: When specified, all the outputs of the model
                 are set to be of the corresponding type in this list.
+            inline: If True, calls to all functions are replaced by the body of the
+                function. If a collection of function names, only the calls to these
+                functions are inlined and the other functions are kept in the model.
+            fuse_ops: If True, the known decompositions of ops available in the opset
+                imported by the model, such as `LayerNormalization` since opset 17,
+                are replaced by these ops.
+            mixed_precision: When set to `FLOAT16` or `BFLOAT16`, the float32
+                computations of the model are converted to this type, except for
+                numerically sensitive ops. The inputs and outputs keep their type.
             kwargs: Additional parameters given to function :func:`onnx.helper.make_model`.
 
         Returns:
             An instance of :class:`onnx.ModelProto`.
         """
+        key = _model_key(
+            functions, io_types, input_types, output_types, inline, fuse_ops, mixed_precision
+        )
+        if key is not None:
+            try:
+                key += tuple(sorted(kwargs.items()))
+                cached = self._protos.get(key)
+            except TypeError:
+                # Parameters which cannot be compared.
+                key = None
+                cached = None
+            if cached is not None:
+                model = onnx.ModelProto()
+                model.CopyFrom(cached)
+                return model
+        model = self._make_model_proto(
+            functions,
+            io_types,
+            input_types,
+            output_types,
+            inline,
+            fuse_ops,
+            mixed_precision,
+            **kwargs,
+        )
+        if key is not None:
+            cached = onnx.ModelProto()
+            cached.CopyFrom(model)
+            self._protos[key] = cached
+        return model
+
+    def _make_model_proto(
+        self,
+        functions,
+        io_types: Optional[ONNXType],
+        input_types: Optional[Sequence[ONNXType]],
+        output_types: Optional[Sequence[ONNXType]],
+        inline: bool | Collection[str],
+        fuse_ops: bool,
+        mixed_precision: Optional[type],
+        **kwargs,
+    ) -> onnx.ModelProto:
         graph, sub_functions = self.to_graph_and_functions(use_default_type=False)
         if io_types is not None:
             for input in graph.input:
@@ -319,9 +459,24 @@ class IRFunction:
             onnx.helper.make_opsetid(domain, version) for domain, version in opsets.items()
         ]
 
-        return helper.make_model(
+        model = helper.make_model(
             graph, opset_imports=opset_imports, functions=functions, **kwargs
         )
+        if inline:
+            from onnxscript import optimizer  # pylint: disable=import-outside-toplevel
+
+            optimizer.inline_functions(model, None if inline is True else inline)
+        if fuse_ops:
+            from onnxscript import fusions  # pylint: disable=import-outside-toplevel
+
+            fusions.fuse_ops(model)
+        if mixed_precision is not None:
+            from onnxscript import (  # pylint: disable=import-outside-toplevel
+                mixed_precision as precision,
+            )
+
+            precision.convert_to_mixed_precision(model, mixed_precision)
+        return model
 
     def to_graph_and_functions(
         self, use_default_type: bool = True
@@ -340,11 +495,20 @@ class IRFunction:
         for s in self.stmts:
             called_functions.update(s.functions)
         called_functions.update(self.called_functions)
+        outputs = {y.name for y in self.outputs}
+        value_info = [
+            helper.make_value_info(name, self.value_types[name])
+            for name in self.assigned_names
+            if name in self.value_types
+            and name not in outputs
+            and not _is_partial_tensor_type(self.value_types[name])
+        ]
         graph = helper.make_graph(
             [s.to_node_proto(f"n{i}") for i, s in enumerate(self.stmts)],
             self.name,
             [x.to_value_info(use_default_type) for x in self.inputs],
             [y.to_value_info(use_default_type) for y in self.outputs],
+            value_info=value_info,
         )
         return graph, called_functions
 
@@ -356,10 +520,14 @@ class IRFunction:
                 for inputs and outputs that do not have a type
 
         Returns:
-            an instance of :class:`onnx.GraphProto`
+            an instance of :class:`onnx.GraphProto`, shared by the calls until the
+            function is modified: copy it before modifying it
         """
-        graph, _ = self.to_graph_and_functions(use_default_type=use_default_type)
-        return graph
+        key = "graph", use_default_type
+        if key not in self._protos:
+            graph, _ = self.to_graph_and_functions(use_default_type=use_default_type)
+            self._protos[key] = graph
+        return self._protos[key]
 
     def get_opset_import(self) -> dict[str, int]:
         func_opset_imports = {}
@@ -380,7 +548,15 @@ class IRFunction:
         Note: Default values for attributes are an experimental feature in ONNX.
         Conversion ignores default values for attributes if the ONNX version installed
         doesn't support it.
+
+        The returned proto is shared by the calls until the function is modified: copy
+        it before modifying it.
         """
+        if "function" not in self._protos:
+            self._protos["function"] = self._make_function_proto()
+        return self._protos["function"]
+
+    def _make_function_proto(self) -> onnx.FunctionProto:
         opsets = self.get_opset_import()
         nodes = [s.to_node_proto(f"n{i}") for i, s in enumerate(self.stmts)]
         for n in nodes:
@@ -39,7 +39,16 @@ def get_ast(f):
     return ast
 
 
-def script_check(f: ast.FunctionDef, opset, global_names, source, default_opset=None):
+def script_check(
+    f: ast.FunctionDef,
+    opset,
+    global_names,
+    source,
+    default_opset=None,
+    attribute_values=None,
+    input_ranks=None,
+    unroll_threshold=0,
+):
     """Check that a function falls into the ONNXScript subset of Python."""
     # See if conversion succeeds.
     # TODO: cleanup Converter interface/API, separating checker from
@@ -49,19 +58,43 @@ def script_check(f: ast.FunctionDef, opset, global_names, source, default_opset=
         global_names=global_names,
         source=source,
         default_opset=default_opset,
+        attribute_values=attribute_values,
+        input_ranks=input_ranks,
+        unroll_threshold=unroll_threshold,
     )
     return convert.top_level_stmt(f)
 
 
+def get_globals(f) -> dict[str, Any]:
+    """Returns the names visible from the definition site of a python function."""
+    # The script should be compiled using the globals/locals at the definition site.
+    # This allows the script to reference names defined outside the script,
+    # which is used for a few different purposes.
+    # The following is an approximate solution that works for normal use.
+    module = inspect.getmodule(f)
+    closure = inspect.getclosurevars(f)
+    env = module.__dict__.copy()
+    env.update(closure.nonlocals)
+    return env
+
+
 def script(
     opset: Optional[values.Opset] = None,
     default_opset: Optional[values.Opset] = None,
+    unroll_threshold: int = 0,
+    source_info: bool = True,
     **kwargs: Any,
 ) -> Callable[[Callable[..., Any]], onnxscript.OnnxFunction]:
     """Main decorator. Declares a function as an onnx function.
 
     Args:
         opset: opset the function belongs to (see :ref:`l-api-opsets`)
+        default_opset: opset used for the operators (such as `+`) of the function
+        unroll_threshold: for-loops whose trip-count is a script-time constant
+            not greater than this threshold are unrolled (see :func:`unroll`)
+        source_info: if False, the source code of the function and the source
+            locations of its variables are dropped once it is translated, which
+            saves memory for large generated functions
 
     Returns:
         an instance of :class:`onnxscript.values.OnnxFunction`
@@ -96,22 +129,46 @@ def script(
     def transform(f):
         if inspect.isfunction(f):
             src, ast = get_src_and_ast(f)  # pylint: disable=redefined-outer-name
-            # The script should be compiled using the globals/locals at the definition site.
-            # This allows the script to reference names defined outside the script,
-            # which is used for a few different purposes.
-            # The following is an approximate solution that works for normal use.
-            module = inspect.getmodule(f)
-            closure = inspect.getclosurevars(f)
-            env = module.__dict__.copy()
-            env.update(closure.nonlocals)
-            result = script_check(ast, opset, env, src, default_opset=default_opset)
+            env = get_globals(f)
+            result = script_check(
+                ast,
+                opset,
+                env,
+                src,
+                default_opset=default_opset,
+                unroll_threshold=unroll_threshold,
+            )
             # TODO: add transformations.
-            return onnxscript.OnnxFunction(opset, f, result, src, kwargs)
+            if not source_info:
+                result.drop_source_info()
+                src = None
+            return onnxscript.OnnxFunction(opset, f, result, src, kwargs, unroll_threshold)
         raise TypeError("The ONNXScript decorator should be applied to functions only.")
 
     return transform
 
 
+def unroll(trip_count: int) -> int:
+    """Marks a for-loop to be unrolled by the converter.
+
+    The body of a loop `for i in range(unroll(n))` is translated `n` times,
+    with `i` bound to a constant, instead of being translated into an ONNX Loop.
+    `n` must be a script-time constant. In eager mode, it returns `n` unchanged.
+
+    Example:
+
+    ::
+
+        @script()
+        def power4(X):
+            result = X
+            for i in range(unroll(3)):
+                result = result * X
+            return result
+    """
+    return trip_count
+
+
 def graph():
     """A parametric decorator used to annotate nested-functions that are used
     as graph-attributes.
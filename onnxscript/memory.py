@@ -0,0 +1,346 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+"""Estimation of the peak memory used by the intermediate values of a function.
+
+The estimation relies on the shapes inferred by ONNX shape inference for given input
+types. A value is live from the node computing it to its last use, or to the end of
+the graph for an output. The memory used while a node runs is the total size of the
+live values, plus the peak memory of the subgraphs of the node, such as the body of
+a `Loop` or the branches of an `If`. Constants (initializers and `Constant` nodes)
+are weights rather than activations: their total size is reported separately.
+"""
+from __future__ import annotations
+
+import copy
+import dataclasses
+from typing import Any, Mapping, Optional, Sequence, Union
+
+import onnx
+
+from onnxscript import irbuilder, utils, values
+
+InputTypes = Union[Sequence[Any], Mapping[str, Any]]
+
+# Bound on the nesting depth of the loops whose loop-carried values are given a shape.
+_MAX_LOOP_DEPTH = 8
+
+
+def _itemsize(elem_type: int) -> Optional[int]:
+    if elem_type in (onnx.TensorProto.BFLOAT16, onnx.TensorProto.FLOAT16):
+        return 2
+    if elem_type in (onnx.TensorProto.STRING, onnx.TensorProto.UNDEFINED):
+        return None
+    return onnx.helper.tensor_dtype_to_np_dtype(elem_type).itemsize
+
+
+def tensor_size(type_proto: onnx.TypeProto) -> Optional[int]:
+    """Returns the size in bytes of a tensor of the given type, or None if it is unknown."""
+    if not type_proto.HasField("tensor_type"):
+        return None
+    tensor_type = type_proto.tensor_type
+    if not tensor_type.HasField("shape"):
+        return None
+    size = _itemsize(tensor_type.elem_type)
+    if size is None:
+        return None
+    for dim in tensor_type.shape.dim:
+        if not dim.HasField("dim_value"):
+            return None
+        size *= dim.dim_value
+    return size
+
+
+def _to_type_proto(type_: Any) -> onnx.TypeProto:
+    if isinstance(type_, onnx.TypeProto):
+        return type_
+    return type_.to_type_proto()
+
+
+def infer_shapes(
+    target: values.OnnxFunction | irbuilder.IRFunction | onnx.ModelProto,
+    input_types: Optional[InputTypes] = None,
+) -> onnx.ModelProto:
+    """Returns a model computing target, annotated with the inferred types of its values.
+
+    The calls to model-local functions are inlined, so that the values computed by
+    the functions are annotated as well. The loop-carried values of a `Loop` are
+    assumed to keep their initial shape, unless the shape inferred for their value
+    at the end of an iteration is different.
+
+    Args:
+        target: the function or the model to annotate
+        input_types: the types of the inputs of target, as a sequence or as a mapping
+            from input names to types, each type being an ONNX type such as
+            `FLOAT[2, 3]` or an `onnx.TypeProto`; by default, the declared types are used
+
+    Returns:
+        a new model
+    """
+    from onnxscript import optimizer  # pylint: disable=import-outside-toplevel
+
+    if isinstance(target, values.OnnxFunction):
+        target = target.function_ir
+    if isinstance(target, irbuilder.IRFunction):
+        model = target.to_model_proto()
+    else:
+        model = copy.deepcopy(target)
+    if input_types is not None:
+        if isinstance(input_types, Mapping):
+            types = {
+                x.name: input_types[x.name] for x in model.graph.input if x.name in input_types
+            }
+        else:
+            types = {x.name: t for x, t in zip(model.graph.input, input_types)}
+        for x in model.graph.input:
+            if x.name in types:
+                x.type.CopyFrom(_to_type_proto(types[x.name]))
+    if model.functions:
+        optimizer.inline_functions(model)
+    inferred = onnx.shape_inference.infer_shapes(model, data_prop=True)
+    excluded: set[str] = set()
+    # Each pass specializes the loops nested in the loops specialized by the previous one.
+    for _ in range(_MAX_LOOP_DEPTH):
+        specialized = _specialize_loop_states(model.graph, inferred.graph, {}, excluded)
+        if not specialized:
+            break
+        inferred = onnx.shape_inference.infer_shapes(model, data_prop=True)
+        changing = _changing_loop_states(inferred.graph)
+        for x in specialized:
+            if x.name in changing:
+                x.type.tensor_type.ClearField("shape")
+                excluded.add(x.name)
+        if excluded & changing:
+            inferred = onnx.shape_inference.infer_shapes(model, data_prop=True)
+    return inferred
+
+
+def _has_shape(type_proto: onnx.TypeProto) -> bool:
+    return type_proto.HasField("tensor_type") and type_proto.tensor_type.HasField("shape")
+
+
+def _specialize_loop_states(
+    graph: onnx.GraphProto,
+    inferred: onnx.GraphProto,
+    outer_types: Mapping[str, onnx.TypeProto],
+    excluded: set[str],
+) -> list[onnx.ValueInfoProto]:
+    """Gives their initial shape to the loop-carried values of the Loop bodies of graph.
+
+    Args:
+        graph: the graph to modify
+        inferred: the same graph, annotated by shape inference
+        outer_types: the types of the values of the outer scopes of graph
+        excluded: the names of the loop-carried values whose shape changes
+
+    Returns:
+        the inputs of the bodies which are given a shape
+    """
+    types = value_types(inferred, outer_types)
+    specialized = []
+    for node, inferred_node in zip(graph.node, inferred.node):
+        for attr, inferred_attr in zip(node.attribute, inferred_node.attribute):
+            for subgraph, inferred_subgraph in zip(
+                utils.subgraphs(attr), utils.subgraphs(inferred_attr)
+            ):
+                if node.op_type == "Loop":
+                    for x, initial in zip(subgraph.input[2:], node.input[2:]):
+                        if (
+                            x.name not in excluded
+                            and not _has_shape(x.type)
+                            and initial in types
+                            and tensor_size(types[initial]) is not None
+                        ):
+                            x.type.CopyFrom(types[initial])
+                            specialized.append(x)
+                specialized.extend(
+                    _specialize_loop_states(subgraph, inferred_subgraph, types, excluded)
+                )
+    return specialized
+
+
+def _changing_loop_states(graph: onnx.GraphProto) -> set[str]:
+    """Returns the loop-carried values whose shape is not the same after an iteration."""
+    changing = set()
+    for node in graph.node:
+        for attr in node.attribute:
+            for subgraph in utils.subgraphs(attr):
+                if node.op_type == "Loop":
+                    for x, y in zip(subgraph.input[2:], subgraph.output[1:]):
+                        if _has_shape(x.type) and x.type != y.type:
+                            changing.add(x.name)
+                changing |= _changing_loop_states(subgraph)
+    return changing
+
+
+@dataclasses.dataclass
+class LiveValue:
+    """A value live when the peak memory is reached."""
+
+    name: str
+    # The size of the value in bytes.
+    size: int
+    # The op computing the value, or None for an input.
+    op_type: Optional[str]
+    # The index of the node computing the value in its graph, -1 for an input.
+    index: int
+
+
+@dataclasses.dataclass
+class MemoryEstimate:
+    """The peak memory used by the values of a graph."""
+
+    # The peak memory in bytes, including the peak memory of the subgraphs of peak_node.
+    peak: int
+    # The node running when the peak is reached, or None if the graph has no node.
+    peak_node: Optional[onnx.NodeProto]
+    # The values of the graph live at the peak, largest first.
+    live_values: list[LiveValue]
+    # The part of the peak used by the subgraphs of peak_node.
+    subgraph_peak: int
+    # The total size of the constants.
+    constant_size: int
+    # The lifetime of each value, as the indices of the first and last nodes it is live.
+    lifetimes: dict[str, tuple[int, int]]
+    # The values whose size is unknown, counted as empty.
+    unknown_sizes: list[str]
+
+    def top(self, count: int = 5) -> list[LiveValue]:
+        """Returns the values contributing most to the peak."""
+        return self.live_values[:count]
+
+    def __str__(self) -> str:
+        node = self.peak_node
+        where = "" if node is None else f" at {node.op_type} -> {', '.join(node.output)}"
+        lines = [f"peak memory: {self.peak} bytes{where}"]
+        if self.subgraph_peak:
+            lines.append(f"  subgraphs: {self.subgraph_peak} bytes")
+        for value in self.top():
+            producer = "input" if value.op_type is None else value.op_type
+            lines.append(f"  {value.name} ({producer}): {value.size} bytes")
+        lines.append(f"constants: {self.constant_size} bytes")
+        if self.unknown_sizes:
+            lines.append(f"unknown sizes: {', '.join(self.unknown_sizes)}")
+        return "\n".join(lines)
+
+
+def value_types(
+    graph: onnx.GraphProto, outer: Mapping[str, onnx.TypeProto]
+) -> dict[str, onnx.TypeProto]:
+    """Returns the types of the values of a graph, given the types of the outer scope."""
+    types = dict(outer)
+    for info in [*graph.input, *graph.value_info, *graph.output]:
+        if info.type.WhichOneof("value") is not None:
+            types[info.name] = info.type
+    return types
+
+
+def _estimate_graph(
+    graph: onnx.GraphProto, outer_types: Mapping[str, onnx.TypeProto]
+) -> MemoryEstimate:
+    types = value_types(graph, outer_types)
+    nodes = list(graph.node)
+    last = max(len(nodes) - 1, 0)
+    constant_size = sum(tensor_size(_tensor_type(t)) or 0 for t in graph.initializer)
+    constants = {t.name for t in graph.initializer}
+    producers: dict[str, int] = {x.name: -1 for x in graph.input if x.name not in constants}
+    lifetimes: dict[str, tuple[int, int]] = {name: (0, 0) for name in producers}
+    subgraph_peaks = [0] * len(nodes)
+    unknown_sizes: list[str] = []
+    for i, node in enumerate(nodes):
+        used = set(node.input)
+        for attr in node.attribute:
+            for subgraph in utils.subgraphs(attr):
+                estimate = _estimate_graph(subgraph, types)
+                subgraph_peaks[i] = max(subgraph_peaks[i], estimate.peak)
+                constant_size += estimate.constant_size
+                unknown_sizes.extend(estimate.unknown_sizes)
+                used.update(_outer_scope_names(subgraph))
+        for name in used:
+            if name in lifetimes:
+                lifetimes[name] = (lifetimes[name][0], i)
+        for name in node.output:
+            if not name:
+                continue
+            if node.op_type == "Constant":
+                constants.add(name)
+                constant_size += (tensor_size(types[name]) if name in types else None) or 0
+                continue
+            producers[name] = i
+            lifetimes[name] = (i, i)
+    for y in graph.output:
+        if y.name in lifetimes:
+            lifetimes[y.name] = (lifetimes[y.name][0], last)
+    sizes = {}
+    for name in lifetimes:
+        size = tensor_size(types[name]) if name in types else None
+        if size is None:
+            unknown_sizes.append(name)
+        sizes[name] = size or 0
+    usage = list(subgraph_peaks) or [0]
+    for name, (start, end) in lifetimes.items():
+        for i in range(start, end + 1):
+            usage[i] += sizes[name]
+    peak_index = max(range(len(usage)), key=usage.__getitem__)
+    live_values = [
+        LiveValue(
+            name,
+            sizes[name],
+            None if producers[name] < 0 else nodes[producers[name]].op_type,
+            producers[name],
+        )
+        for name, (start, end) in lifetimes.items()
+        if start <= peak_index <= end
+    ]
+    live_values.sort(key=lambda v: v.size, reverse=True)
+    return MemoryEstimate(
+        usage[peak_index],
+        nodes[peak_index] if nodes else None,
+        live_values,
+        subgraph_peaks[peak_index] if nodes else 0,
+        constant_size,
+        lifetimes,
+        unknown_sizes,
+    )
+
+
+def _tensor_type(tensor: onnx.TensorProto) -> onnx.TypeProto:
+    return onnx.helper.make_tensor_type_proto(tensor.data_type, tensor.dims)
+
+
+def _outer_scope_names(graph: onnx.GraphProto) -> set[str]:
+    """Returns the names used by a graph (or its subgraphs) and defined outside of it."""
+    defined = {x.name for x in graph.input} | {t.name for t in graph.initializer}
+    used = {y.name for y in graph.output}
+    for node in graph.node:
+        used.update(node.input)
+        for attr in node.attribute:
+            for subgraph in utils.subgraphs(attr):
+                used |= _outer_scope_names(subgraph)
+        defined.update(node.output)
+    return used - defined - {""}
+
+
+def estimate_peak_memory(
+    target: values.OnnxFunction | irbuilder.IRFunction | onnx.ModelProto,
+    input_types: Optional[InputTypes] = None,
+) -> MemoryEstimate:
+    """Estimates the peak memory used by the values computed by a function or a model.
+
+    The values of a graph are assumed to be freed after their last use, and the nodes
+    to run in the order of the graph. The size of a value is only known if its shape
+    is fully known after shape inference: the other values are reported in
+    `unknown_sizes` and counted as empty.
+
+    Args:
+        target: the function or the model to analyze
+        input_types: the types of the inputs of target, as a sequence or as a mapping
+            from input names to types; by default, the declared types are used
+
+    Returns:
+        the estimate for the main graph, the peak memory of subgraphs being included
+        in the memory used by the node owning them
+    """
+    model = infer_shapes(target, input_types)
+    return _estimate_graph(model.graph, {})
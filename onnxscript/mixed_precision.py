@@ -0,0 +1,382 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+"""Conversion of float32 computations to float16 or bfloat16.
+
+The conversion keeps the inputs and the outputs of a model or a function in float32:
+the computation switches to the lower precision type through `Cast` nodes inserted
+where a float32 value is first used by a converted op, and switches back where a
+converted value is used by an op kept in float32 or is an output. Ops known to be
+numerically sensitive, such as reductions or `Softmax`, are kept in float32.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Collection, Optional, Sequence, Type
+
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper
+
+from onnxscript import irbuilder, onnx_types, utils, values
+
+logger = logging.getLogger("onnx-script")
+
+# Ops whose accuracy suffers from a lower precision: reductions accumulate rounding
+# errors, exponentials and powers overflow the range of float16, and normalizations
+# compute statistics (a mean, a variance) over a whole axis.
+DEFAULT_FLOAT32_OPS = frozenset(
+    [
+        "BatchNormalization",
+        "CumSum",
+        "Exp",
+        "GroupNormalization",
+        "InstanceNormalization",
+        "LayerNormalization",
+        "Log",
+        "LogSoftmax",
+        "LpNormalization",
+        "MeanVarianceNormalization",
+        "NegativeLogLikelihoodLoss",
+        "Pow",
+        "Range",
+        "ReduceL1",
+        "ReduceL2",
+        "ReduceLogSum",
+        "ReduceLogSumExp",
+        "ReduceMean",
+        "ReduceProd",
+        "ReduceSum",
+        "ReduceSumSquare",
+        "Softmax",
+        "SoftmaxCrossEntropyLoss",
+        "Softplus",
+    ]
+)
+
+_FLOAT = onnx.TensorProto.FLOAT
+
+_SUFFIXES: dict[int, str] = {
+    onnx.TensorProto.FLOAT16: "fp16",
+    onnx.TensorProto.BFLOAT16: "bf16",
+}
+
+_TYPE_STRS: dict[int, str] = {
+    onnx.TensorProto.FLOAT16: "tensor(float16)",
+    onnx.TensorProto.BFLOAT16: "tensor(bfloat16)",
+}
+
+
+def _allowed_types(schema: onnx.defs.OpSchema, type_str: str) -> Collection[str]:
+    for constraint in schema.type_constraints:
+        if constraint.type_param_str == type_str:
+            return constraint.allowed_type_strs
+    return [type_str]
+
+
+def _formal_type_strs(
+    formal_parameters: Sequence[onnx.defs.OpSchema.FormalParameter], count: int
+) -> list[str]:
+    """Returns the type of each actual parameter, repeating the last one if it is variadic."""
+    if not formal_parameters:
+        return []
+    type_strs = [p.typeStr for p in formal_parameters[:count]]
+    type_strs.extend([formal_parameters[-1].typeStr] * (count - len(type_strs)))
+    return type_strs
+
+
+def _is_convertible(
+    node: onnx.NodeProto,
+    elem_types: dict[str, int],
+    opset_version: int,
+    to: int,
+    float32_ops: Collection[str],
+) -> bool:
+    """Returns True if the float32 inputs and outputs of a node can all be converted.
+
+    The float32 outputs of a converted node must have the type of one of its converted
+    inputs: the type of an output defined by an attribute, as for `Cast` or
+    `ConstantOfShape`, is not changed by converting the inputs.
+    """
+    if node.domain not in ("", "ai.onnx") or node.op_type in float32_ops:
+        return False
+    if node.op_type == "Constant":
+        return False
+    if any(utils.subgraphs(a) for a in node.attribute):
+        return False
+    try:
+        schema = onnx.defs.get_schema(node.op_type, opset_version, "")
+    except onnx.defs.SchemaError:
+        return False
+    low_type_str = _TYPE_STRS[to]
+    input_type_strs = _formal_type_strs(schema.inputs, len(node.input))
+    output_type_strs = _formal_type_strs(schema.outputs, len(node.output))
+    converted_type_strs = set()
+    for names, type_strs, is_input in [
+        (node.input, input_type_strs, True),
+        (node.output, output_type_strs, False),
+    ]:
+        for name, type_str in zip(names, type_strs):
+            if not name:
+                continue
+            if name not in elem_types:
+                return False
+            if elem_types[name] != _FLOAT:
+                continue
+            if low_type_str not in _allowed_types(schema, type_str):
+                return False
+            if is_input:
+                converted_type_strs.add(type_str)
+            elif type_str not in converted_type_strs:
+                return False
+    return bool(converted_type_strs)
+
+
+def _convert_constant(value: np.ndarray, name: str, to: int) -> onnx.TensorProto:
+    if to == onnx.TensorProto.FLOAT16:
+        return numpy_helper.from_array(value.astype(np.float16), name)
+    return helper.make_tensor(name, to, value.shape, value.flatten().tolist())
+
+
+class _Converter:
+    """Converts a topologically sorted list of nodes, creating the required casts."""
+
+    def __init__(
+        self,
+        elem_types: dict[str, int],
+        constants: dict[str, np.ndarray],
+        used_names: set[str],
+        float32_names: Collection[str],
+        to: int,
+        use_initializers: bool,
+    ):
+        self.elem_types = elem_types
+        self.constants = constants
+        self.used_names = used_names
+        # The values which must remain available in float32.
+        self.float32_names = float32_names
+        self.to = to
+        # Converted constants are stored as initializers in a graph and as nodes in a function.
+        self.use_initializers = use_initializers
+        self.nodes: list[onnx.NodeProto] = []
+        self.initializers: list[onnx.TensorProto] = []
+        # Maps a float32 value to the name of the same value converted to the lower precision.
+        self.converted: dict[str, str] = {}
+
+    def _unique_name(self, name: str) -> str:
+        candidate = f"{name}_{_SUFFIXES[self.to]}"
+        while candidate in self.used_names:
+            candidate = "_" + candidate
+        self.used_names.add(candidate)
+        return candidate
+
+    def _converted_input(self, name: str) -> str:
+        if name in self.converted:
+            return self.converted[name]
+        low_name = self._unique_name(name)
+        if name in self.constants:
+            # The cast of a constant is computed now instead of at inference time.
+            tensor = _convert_constant(self.constants[name], low_name, self.to)
+            if self.use_initializers:
+                self.initializers.append(tensor)
+            else:
+                self.nodes.append(helper.make_node("Constant", [], [low_name], value=tensor))
+        else:
+            self.nodes.append(helper.make_node("Cast", [name], [low_name], to=self.to))
+        self.converted[name] = low_name
+        return low_name
+
+    def convert(self, node: onnx.NodeProto) -> None:
+        for i, name in enumerate(node.input):
+            if name and self.elem_types[name] == _FLOAT:
+                node.input[i] = self._converted_input(name)
+        casts = []
+        for i, name in enumerate(node.output):
+            if name and self.elem_types[name] == _FLOAT:
+                low_name = self._unique_name(name)
+                node.output[i] = low_name
+                self.converted[name] = low_name
+                if name in self.float32_names:
+                    casts.append(helper.make_node("Cast", [low_name], [name], to=_FLOAT))
+        self.nodes.append(node)
+        self.nodes.extend(casts)
+
+    def keep(self, node: onnx.NodeProto) -> None:
+        self.nodes.append(node)
+
+
+def _convert_nodes(
+    nodes: Sequence[onnx.NodeProto],
+    outputs: Collection[str],
+    initializers: Optional[dict[str, onnx.TensorProto]],
+    elem_types: dict[str, int],
+    opset_version: int,
+    to: int,
+    float32_ops: Collection[str],
+    used_names: set[str],
+) -> tuple[list[onnx.NodeProto], list[onnx.TensorProto], dict[str, str], int]:
+    """Converts a topologically sorted list of nodes.
+
+    Returns:
+        the new list of nodes, the converted constants to add as initializers (if
+        initializers is not None), the map from the converted float32 values to
+        their new names and the number of converted nodes
+    """
+    convertible = [
+        _is_convertible(n, elem_types, opset_version, to, float32_ops) for n in nodes
+    ]
+    float32_names = set(outputs)
+    constants = {}
+    for name, tensor in (initializers or {}).items():
+        if tensor.data_type == _FLOAT:
+            constants[name] = numpy_helper.to_array(tensor)
+    for node, is_convertible in zip(nodes, convertible):
+        if not is_convertible:
+            float32_names |= utils.used_names(node)
+        if node.op_type == "Constant" and len(node.attribute) == 1:
+            value = utils.constant_attribute_value(node.attribute[0])
+            if value is not None and value.dtype == np.float32:
+                constants[node.output[0]] = value
+    converter = _Converter(
+        elem_types, constants, used_names, float32_names, to, initializers is not None
+    )
+    for node, is_convertible in zip(nodes, convertible):
+        if is_convertible:
+            converter.convert(node)
+        else:
+            converter.keep(node)
+    # The float32 constants replaced by their converted value may no longer be used.
+    used = set(outputs)
+    for node in converter.nodes:
+        used |= utils.used_names(node)
+    new_nodes = [
+        n
+        for n in converter.nodes
+        if n.op_type != "Constant"
+        or n.output[0] not in converter.converted
+        or n.output[0] in used
+    ]
+    return new_nodes, converter.initializers, converter.converted, sum(convertible)
+
+
+def _check_type(dtype: Type[onnx_types.TensorType]) -> int:
+    if dtype not in (onnx_types.FLOAT16, onnx_types.BFLOAT16):
+        raise ValueError(f"Expected FLOAT16 or BFLOAT16, got {dtype!r}.")
+    return dtype.dtype
+
+
+def _convert_model(model: onnx.ModelProto, to: int, float32_ops: Collection[str]) -> int:
+    graph = model.graph
+    graph_inputs = {x.name for x in graph.input}
+    # Initializers which are also inputs can be overridden, they are not constants.
+    initializers = {t.name: t for t in graph.initializer if t.name not in graph_inputs}
+    used_names = {t.name for t in graph.initializer} | graph_inputs
+    for node in graph.node:
+        used_names |= utils.used_names(node)
+        used_names.update(node.output)
+    outputs = [y.name for y in graph.output]
+    nodes, new_initializers, converted, count = _convert_nodes(
+        list(graph.node),
+        outputs,
+        initializers,
+        utils.elem_types(model),
+        utils.standard_opset_version(model.opset_import),
+        to,
+        float32_ops,
+        used_names,
+    )
+    used = set(outputs)
+    for node in nodes:
+        used |= utils.used_names(node)
+    kept = [t for t in graph.initializer if t.name not in converted or t.name in used]
+    utils.replace_all(graph.initializer, kept + new_initializers)
+    utils.replace_all(graph.node, nodes)
+    return count
+
+
+def _convert_function(
+    function: irbuilder.IRFunction, to: int, float32_ops: Collection[str]
+) -> int:
+    standard_opsets = [
+        s.callee.opset for s in function.stmts if s.callee.opset.domain in ("", "ai.onnx")
+    ]
+    if not standard_opsets:
+        return 0
+    opset = standard_opsets[0]
+    model = function.to_model_proto()
+    elem_types = utils.elem_types(model)
+    used_names = {x.name for x in function.inputs}
+    for stmt in function.stmts:
+        used_names.update(x for x in stmt.args if x is not None)
+        used_names.update(stmt.output_names)
+    # Nodes are matched with the statements they come from by their name.
+    stmts = {f"n{i}": stmt for i, stmt in enumerate(function.stmts)}
+    nodes, _, converted, count = _convert_nodes(
+        list(model.graph.node),
+        [y.name for y in function.outputs],
+        None,
+        elem_types,
+        opset.version,
+        to,
+        float32_ops,
+        used_names,
+    )
+    new_stmts = []
+    for node in nodes:
+        if node.name in stmts:
+            stmt = stmts[node.name]
+            stmt.args = [x or None for x in node.input]
+            stmt.result = list(node.output)
+        else:
+            stmt = irbuilder.IRStmt(
+                list(node.output),
+                values.Op(opset, node.op_type),
+                list(node.input),
+                [irbuilder.IRAttributeValue(a) for a in node.attribute],
+            )
+        new_stmts.append(stmt)
+    function.stmts = new_stmts
+    for name, low_name in converted.items():
+        if name in function.value_types:
+            type_proto = onnx.TypeProto()
+            type_proto.CopyFrom(function.value_types[name])
+            type_proto.tensor_type.elem_type = to
+            function.value_types[low_name] = type_proto
+    return count
+
+
+def convert_to_mixed_precision(
+    target: irbuilder.IRFunction | onnx.ModelProto,
+    dtype: Type[onnx_types.TensorType] = onnx_types.FLOAT16,
+    float32_ops: Optional[Collection[str]] = None,
+) -> int:
+    """Converts in-place the float32 computations of a model or a function to a lower precision.
+
+    An op is converted when it supports the lower precision type and the types of all
+    its float32 inputs and outputs are known. The constants used by converted ops are
+    converted by the pass rather than by `Cast` nodes. The inputs and outputs of the
+    target keep their type.
+
+    For a model, only the nodes of the main graph are converted; subgraphs and
+    model-local functions are kept in float32. For an IRFunction, only its top-level
+    statements are converted.
+
+    Args:
+        target: the function or the model to convert
+        dtype: the lower precision type, `FLOAT16` or `BFLOAT16`
+        float32_ops: the op types to keep in float32, by default DEFAULT_FLOAT32_OPS
+
+    Returns:
+        the number of converted nodes
+    """
+    to = _check_type(dtype)
+    if float32_ops is None:
+        float32_ops = DEFAULT_FLOAT32_OPS
+    if isinstance(target, irbuilder.IRFunction):
+        count = _convert_function(target, to, float32_ops)
+    else:
+        count = _convert_model(target, to, float32_ops)
+    if count:
+        logger.debug("mixed_precision:%d nodes converted to %s", count, _SUFFIXES[to])
+    return count
@@ -0,0 +1,1163 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+"""Optimization passes over the onnxscript IR.
+
+The passes in this module operate in-place on an :class:`onnxscript.irbuilder.IRFunction`
+produced by the converter. They are optional and are not applied by default.
+"""
+from __future__ import annotations
+
+import dataclasses
+import logging
+import warnings
+from typing import Any, Callable, Collection, Iterable, Mapping, Optional, Sequence
+
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper
+
+from onnxscript import evaluator as evaluator_module
+from onnxscript import irbuilder, tensor, utils, values
+
+logger = logging.getLogger("onnx-script")
+
+# Ops whose outputs are not a function of their inputs and must never be folded.
+_NON_DETERMINISTIC_OPS = frozenset(
+    [
+        "Bernoulli",
+        "Multinomial",
+        "RandomNormal",
+        "RandomNormalLike",
+        "RandomUniform",
+        "RandomUniformLike",
+    ]
+)
+
+# Maximum number of elements of a tensor produced by constant folding. Folding ops
+# such as Expand or ConstantOfShape could otherwise embed very large tensors in the model.
+DEFAULT_SIZE_LIMIT = 1024
+
+
+def _is_standard_op(stmt: irbuilder.IRStmt) -> bool:
+    return stmt.callee.opset.domain in ("", "ai.onnx") and not isinstance(
+        stmt.callee, values.OnnxFunction
+    )
+
+
+def arg_names(stmt: irbuilder.IRStmt) -> list[str]:
+    """Returns the names of the inputs of a statement, using "" for missing inputs."""
+    return ["" if x is None else str(x) for x in stmt.args]
+
+
+def _has_ref_attr(stmt: irbuilder.IRStmt) -> bool:
+    return any(a.attr_proto.HasField("ref_attr_name") for a in stmt.attrs)
+
+
+def _has_graph_attr(stmt: irbuilder.IRStmt) -> bool:
+    return any(
+        a.attr_proto.type in (onnx.AttributeProto.GRAPH, onnx.AttributeProto.GRAPHS)
+        for a in stmt.attrs
+    )
+
+
+def is_foldable(stmt: irbuilder.IRStmt) -> bool:
+    """Returns True if the outputs of a statement only depend on the values of its inputs."""
+    return (
+        _is_standard_op(stmt)
+        and stmt.callee.opname not in _NON_DETERMINISTIC_OPS
+        and len(stmt.args) > 0
+        and not _has_ref_attr(stmt)
+        and not _has_graph_attr(stmt)
+    )
+
+
+def constant_value(stmt: irbuilder.IRStmt) -> Optional[np.ndarray]:
+    """Returns the value computed by a `Constant` statement, or None.
+
+    None is returned if the statement is not a `Constant` or if its value is not
+    known at translation time (for example, when it refers to an attribute-parameter
+    of the enclosing function through `ref_attr_name`).
+    """
+    if stmt.callee.opname != "Constant" or not _is_standard_op(stmt):
+        return None
+    if len(stmt.attrs) != 1 or _has_ref_attr(stmt):
+        return None
+    return utils.constant_attribute_value(stmt.attrs[0].attr_proto)
+
+
+def make_constant_stmt(name: str, value: np.ndarray, opset: values.Opset) -> irbuilder.IRStmt:
+    """Creates a statement `name = Constant <value=...>()`."""
+    attr = irbuilder.IRAttributeValue(
+        helper.make_attribute("value", numpy_helper.from_array(value, name))
+    )
+    return irbuilder.IRStmt([name], values.Op(opset, "Constant"), [], [attr])
+
+
+def evaluate_statement(
+    stmt: irbuilder.IRStmt,
+    inputs: list[Optional[np.ndarray]],
+    evaluator: Optional[evaluator_module.Evaluator] = None,
+) -> Optional[list[np.ndarray]]:
+    """Computes the outputs of a statement for the given input values.
+
+    Returns None if the statement cannot be evaluated.
+    """
+    evaluator = evaluator or evaluator_module.default()
+    schema = stmt.callee.get_schema()
+    if schema is None:
+        return None
+    args = [None if x is None else tensor.Tensor(x) for x in inputs]
+    attributes: dict[str, Any] = {
+        a.attr_proto.name: helper.get_attribute_value(a.attr_proto) for a in stmt.attrs
+    }
+    try:
+        outputs = evaluator.eval(schema, args, attributes)
+    except Exception as e:  # pylint: disable=broad-except
+        logger.debug("Unable to fold %s: %s", stmt, e)
+        return None
+    if isinstance(outputs, tensor.Tensor):
+        outputs = [outputs]
+    if not all(isinstance(x, tensor.Tensor) for x in outputs):
+        return None
+    return [x.value for x in outputs]
+
+
+def fold_constants(
+    function: irbuilder.IRFunction,
+    evaluator: Optional[evaluator_module.Evaluator] = None,
+    size_limit: int = DEFAULT_SIZE_LIMIT,
+) -> int:
+    """Replaces statements whose inputs are all constants by `Constant` statements.
+
+    Statements calling an op of the standard ONNX domain are evaluated at translation
+    time when all of their inputs are produced by `Constant` statements. Statements
+    using an attribute-reference (`ref_attr_name`), a graph-valued attribute or a
+    non-deterministic op are left unchanged, since their value is only known at runtime.
+    The statements producing the original inputs are kept; they can be removed by
+    :func:`eliminate_dead_code`.
+
+    Args:
+        function: the function to optimize, modified in-place
+        evaluator: evaluator used to compute the values, the default evaluator
+            is used if not specified
+        size_limit: statements producing a tensor with more elements are not folded
+
+    Returns:
+        the number of statements folded
+    """
+    evaluator = evaluator or evaluator_module.default()
+    known: dict[str, np.ndarray] = {}
+    new_stmts = []
+    num_folded = 0
+    for stmt in function.stmts:
+        value = constant_value(stmt)
+        if value is not None:
+            known[stmt.result[0]] = value
+            new_stmts.append(stmt)
+            continue
+        if is_foldable(stmt) and all(x in known for x in arg_names(stmt) if x):
+            inputs = [known[x] if x else None for x in arg_names(stmt)]
+            outputs = evaluate_statement(stmt, inputs, evaluator)
+            if (
+                outputs is not None
+                and len(outputs) == len(stmt.result)
+                and all(x.size <= size_limit for x in outputs)
+            ):
+                for name, output in zip(stmt.result, outputs):
+                    known[name] = output
+                    new_stmts.append(make_constant_stmt(name, output, stmt.callee.opset))
+                num_folded += 1
+                continue
+        new_stmts.append(stmt)
+    function.stmts = new_stmts
+    return num_folded
+
+
+# Dead-code and Identity elimination:
+
+
+@dataclasses.dataclass
+class _NodeInfo:
+    op_type: str
+    inputs: Sequence[str]
+    outputs: Sequence[str]
+    # Names referenced by subgraphs of the node (as implicit outer-scope inputs).
+    captured: set[str]
+
+
+def _plan_elimination(
+    nodes: Sequence[_NodeInfo], graph_outputs: Sequence[str]
+) -> tuple[list[int], dict[str, str]]:
+    """Computes the nodes to keep and the renaming to apply to the remaining nodes.
+
+    An Identity node `y = Identity(x)` is removed by replacing all uses of `y` by `x`.
+    If `y` is a graph output, whose name cannot change, the node computing `x` is
+    renamed to produce `y` directly instead. This is only possible if `x` is computed
+    by a node of the same graph and is not itself a graph output. Since ONNX does not
+    allow a subgraph to redefine an outer-scope name, the renaming can also be applied
+    to the outer-scope references of subgraphs.
+    """
+    graph_outputs_set = set(graph_outputs)
+    produced = {y for n in nodes for y in n.outputs if y}
+    renaming: dict[str, str] = {}
+
+    def resolve(name):
+        while name in renaming:
+            name = renaming[name]
+        return name
+
+    removed = set()
+    for i, node in enumerate(nodes):
+        if node.op_type != "Identity" or len(node.inputs) != 1 or len(node.outputs) != 1:
+            continue
+        x, y = resolve(node.inputs[0]), node.outputs[0]
+        if x == y:
+            continue
+        if y not in graph_outputs_set:
+            renaming[y] = x
+            removed.add(i)
+        elif x in produced and x not in graph_outputs_set and x not in renaming.values():
+            renaming[x] = y
+            removed.add(i)
+    renaming = {k: resolve(k) for k in renaming}
+
+    live = set(graph_outputs)
+    keep = []
+    for i in reversed(range(len(nodes))):
+        if i in removed:
+            continue
+        node = nodes[i]
+        if any(renaming.get(y, y) in live for y in node.outputs if y):
+            live.update(renaming.get(x, x) for x in node.inputs)
+            live.update(renaming.get(x, x) for x in node.captured)
+            keep.append(i)
+    keep.reverse()
+    return keep, renaming
+
+
+def _eliminate_dead_code_in_graph(graph: onnx.GraphProto) -> None:
+    for node in graph.node:
+        for attr in node.attribute:
+            for subgraph in utils.subgraphs(attr):
+                _eliminate_dead_code_in_graph(subgraph)
+    infos = [
+        _NodeInfo(
+            n.op_type,
+            list(n.input),
+            list(n.output),
+            set().union(
+                *(utils.referenced_names(g) for a in n.attribute for g in utils.subgraphs(a))
+            ),
+        )
+        for n in graph.node
+    ]
+    keep, renaming = _plan_elimination(infos, [o.name for o in graph.output])
+    nodes = []
+    for i in keep:
+        node = onnx.NodeProto()
+        node.CopyFrom(graph.node[i])
+        node.input[:] = [renaming.get(x, x) for x in node.input]
+        node.output[:] = [renaming.get(y, y) for y in node.output]
+        for attr in node.attribute:
+            for subgraph in utils.subgraphs(attr):
+                utils.rename_outer_scope_references(subgraph, renaming)
+        nodes.append(node)
+    del graph.node[:]
+    graph.node.extend(nodes)
+
+
+def _called_function_names(nodes: Iterable[onnx.NodeProto]) -> set[tuple[str, str]]:
+    result = set()
+    for node in nodes:
+        result.add((node.domain, node.op_type))
+        for attr in node.attribute:
+            for subgraph in utils.subgraphs(attr):
+                result |= _called_function_names(subgraph.node)
+    return result
+
+
+def eliminate_dead_code(function: irbuilder.IRFunction) -> int:
+    """Removes statements whose results are not used and forwards Identity copies.
+
+    The converter inserts `Identity` statements to copy loop-carried values and the
+    outputs of conditional branches. This pass removes such copies whenever the
+    naming rules of ONNX graphs allow it, removes statements whose results are never
+    used, and removes the called functions no longer referenced. Subgraphs (bodies
+    of `If`, `Loop` and `Scan`) are processed recursively.
+
+    Nested functions are left unchanged since eager-mode execution looks them up
+    by name.
+
+    Args:
+        function: the function to optimize, modified in-place
+
+    Returns:
+        the number of statements removed from the function (not including
+        statements removed from subgraphs)
+    """
+    for stmt in function.stmts:
+        for attr in stmt.attrs:
+            for subgraph in utils.subgraphs(attr.attr_proto):
+                _eliminate_dead_code_in_graph(subgraph)
+    infos = [
+        _NodeInfo(
+            s.callee.opname,
+            arg_names(s),
+            s.output_names,
+            set().union(
+                *(
+                    utils.referenced_names(g)
+                    for a in s.attrs
+                    for g in utils.subgraphs(a.attr_proto)
+                )
+            ),
+        )
+        for s in function.stmts
+    ]
+    keep, renaming = _plan_elimination(infos, [y.name for y in function.outputs])
+    num_removed = len(function.stmts) - len(keep)
+    stmts = [function.stmts[i] for i in keep]
+    for stmt in stmts:
+        stmt.args = [renaming.get(x, x) for x in arg_names(stmt)]
+        stmt.result = [renaming.get(y, y) for y in stmt.output_names]
+        for attr in stmt.attrs:
+            for subgraph in utils.subgraphs(attr.attr_proto):
+                utils.rename_outer_scope_references(subgraph, renaming)
+    function.stmts = stmts
+
+    # Remove the called functions that are no longer referenced.
+    used = set()
+    for stmt in stmts:
+        used.add((stmt.callee.opset.domain, stmt.callee.opname))
+        for attr in stmt.attrs:
+            for subgraph in utils.subgraphs(attr.attr_proto):
+                used |= _called_function_names(subgraph.node)
+    by_key = {(f.domain, f.name): name for name, f in function.called_functions.items()}
+    pending = [key for key in used if key in by_key]
+    reachable = set()
+    while pending:
+        key = pending.pop()
+        if key in reachable:
+            continue
+        reachable.add(key)
+        callees = _called_function_names(function.called_functions[by_key[key]].node)
+        pending.extend(k for k in callees if k in by_key)
+    function.called_functions = {
+        name: f
+        for name, f in function.called_functions.items()
+        if (f.domain, f.name) in reachable
+    }
+    return num_removed
+
+
+# Loop-invariant code motion:
+
+# Ops which cannot fail at run time whatever the shapes of their inputs. Hoisting
+# a statement out of a loop makes it run even when the loop runs zero times, so
+# an op which may fail (e.g. Gather with an out-of-range index, or Add with
+# incompatible shapes) must not be hoisted.
+_INFALLIBLE_OPS = frozenset(
+    [
+        "Abs",
+        "Cast",
+        "CastLike",
+        "Ceil",
+        "Constant",
+        "Cos",
+        "Erf",
+        "Exp",
+        "Floor",
+        "Identity",
+        "IsInf",
+        "IsNaN",
+        "Neg",
+        "Not",
+        "Relu",
+        "Shape",
+        "Sigmoid",
+        "Sign",
+        "Sin",
+        "Size",
+        "Softplus",
+        "Softsign",
+        "Tanh",
+    ]
+)
+
+
+def hoist_loop_invariants(body: irbuilder.IRFunction, enclosing: irbuilder.IRFunction) -> int:
+    """Moves the loop-invariant statements of a loop body to the enclosing scope.
+
+    A statement of the body is invariant if all its inputs are computed outside
+    the loop or by other invariant statements. Invariant statements calling an op
+    of the standard ONNX domain which cannot fail at run time (such as Shape,
+    Cast or unary elementwise ops) are appended to `enclosing`, so that they are
+    computed once before the loop instead of at each iteration, and the body
+    refers to their results as outer-scope values. Since they are then computed
+    even when the loop runs zero times, the other invariant statements are kept
+    in the body, as well as the statements computing an output of the body.
+
+    Args:
+        body: the loop body, modified in-place
+        enclosing: the function or graph containing the loop, the hoisted
+            statements are appended to it
+
+    Returns:
+        the number of statements hoisted
+    """
+    outputs = {y.name for y in body.outputs}
+    variant = {x.name for x in body.inputs}
+    kept = []
+    num_hoisted = 0
+    for stmt in body.stmts:
+        invariant = (
+            _is_standard_op(stmt)
+            and stmt.callee.opname in _INFALLIBLE_OPS
+            and not any(x in variant for x in arg_names(stmt))
+            and not any(y in outputs for y in stmt.output_names)
+        )
+        if invariant:
+            enclosing.append_stmt(stmt)
+            for name in stmt.output_names:
+                if name in body.value_types:
+                    enclosing.value_types[name] = body.value_types.pop(name)
+            num_hoisted += 1
+        else:
+            variant.update(stmt.output_names)
+            kept.append(stmt)
+    body.stmts = kept
+    return num_hoisted
+
+
+# Function inlining:
+
+# Bound on the nesting depth of inlined calls, used to detect recursive functions.
+_MAX_INLINING_DEPTH = 64
+
+
+def _all_names(graph: onnx.GraphProto | onnx.FunctionProto) -> set[str]:
+    """Returns all value-names used or defined in a graph or function, including subgraphs."""
+    names: set[str] = set()
+    if isinstance(graph, onnx.GraphProto):
+        names.update(x.name for x in graph.input)
+        names.update(x.name for x in graph.output)
+    else:
+        names.update(graph.input)
+        names.update(graph.output)
+    for node in graph.node:
+        names.update(node.input)
+        names.update(node.output)
+        for attr in node.attribute:
+            for subgraph in utils.subgraphs(attr):
+                names |= _all_names(subgraph)
+    return names
+
+
+class _CallSiteInliner:
+    """Instantiates the body of a function for a given call-site (a NodeProto).
+
+    Formal inputs and outputs are replaced by the actual inputs and outputs of the
+    call-site, and all other names are prefixed to keep them unique. Attribute
+    references (`ref_attr_name`) are replaced by the attribute values of the call-site,
+    or by the default value of the attribute if the call-site does not specify it.
+    """
+
+    def __init__(self, node: onnx.NodeProto, function: onnx.FunctionProto, prefix: str):
+        self.prefix = prefix
+        self.mapping: dict[str, str] = {}
+        for i, formal in enumerate(function.input):
+            self.mapping[formal] = node.input[i] if i < len(node.input) else ""
+        for i, formal in enumerate(function.output):
+            if i < len(node.output) and node.output[i]:
+                self.mapping[formal] = node.output[i]
+        self.attributes = {a.name: a for a in getattr(function, "attribute_proto", [])}
+        self.attributes.update({a.name: a for a in node.attribute})
+
+    def rename(self, name: str) -> str:
+        if name == "":
+            return name
+        return self.mapping.get(name, self.prefix + name)
+
+    def instantiate_attribute(
+        self, attr: onnx.AttributeProto
+    ) -> Optional[onnx.AttributeProto]:
+        result = onnx.AttributeProto()
+        if attr.ref_attr_name:
+            actual = self.attributes.get(attr.ref_attr_name)
+            if actual is None:
+                # The attribute is not specified: the op uses its own default value.
+                return None
+            result.CopyFrom(actual)
+            result.name = attr.name
+            return result
+        result.CopyFrom(attr)
+        for subgraph in utils.subgraphs(result):
+            self.instantiate_graph(subgraph)
+        return result
+
+    def instantiate_node(self, node: onnx.NodeProto) -> onnx.NodeProto:
+        result = onnx.NodeProto()
+        result.CopyFrom(node)
+        result.input[:] = [self.rename(x) for x in node.input]
+        result.output[:] = [self.rename(y) for y in node.output]
+        if node.name:
+            result.name = self.prefix + node.name
+        attrs = [self.instantiate_attribute(a) for a in node.attribute]
+        del result.attribute[:]
+        result.attribute.extend(a for a in attrs if a is not None)
+        return result
+
+    def instantiate_graph(self, graph: onnx.GraphProto) -> None:
+        for value_info in [*graph.input, *graph.output, *graph.value_info]:
+            value_info.name = self.rename(value_info.name)
+        for initializer in graph.initializer:
+            initializer.name = self.rename(initializer.name)
+        nodes = [self.instantiate_node(n) for n in graph.node]
+        del graph.node[:]
+        graph.node.extend(nodes)
+
+
+def _merge_opset_imports(
+    model: onnx.ModelProto, opset_imports: Iterable[onnx.OperatorSetIdProto]
+) -> None:
+    versions = {o.domain: o.version for o in model.opset_import}
+    for opset in opset_imports:
+        if opset.domain not in versions:
+            model.opset_import.append(onnx.helper.make_opsetid(opset.domain, opset.version))
+            versions[opset.domain] = opset.version
+        elif versions[opset.domain] != opset.version:
+            warnings.warn(
+                f"An inlined function imports version {opset.version} of domain "
+                f"{opset.domain!r} but the model imports version {versions[opset.domain]}.",
+                category=UserWarning,
+            )
+
+
+def inline_functions(
+    model: onnx.ModelProto, names: Optional[Collection[str]] = None
+) -> onnx.ModelProto:
+    """Inlines calls to the model-local functions of a model.
+
+    Every call to an inlined function, including calls in subgraphs and in the
+    functions kept in the model, is replaced by the body of the function. Functions
+    that are no longer called are removed from the model. The opset imports of the
+    inlined functions are merged into those of the model.
+
+    Args:
+        model: the model to modify in-place
+        names: names of the functions to inline, all model-local functions are inlined
+            if not specified. Calls to the other functions are kept.
+
+    Returns:
+        the modified model
+    """
+    inlined = {
+        (f.domain, f.name): f for f in model.functions if names is None or f.name in names
+    }
+    if not inlined:
+        return model
+    used_names = _all_names(model.graph)
+    for f in model.functions:
+        used_names |= _all_names(f)
+    counter = 0
+
+    def new_prefix(function: onnx.FunctionProto) -> str:
+        nonlocal counter
+        while True:
+            prefix = f"{function.name}_{counter}_"
+            counter += 1
+            if not any(name.startswith(prefix) for name in used_names):
+                return prefix
+
+    def expand(node: onnx.NodeProto, depth: int, result: list[onnx.NodeProto]) -> None:
+        function = inlined.get((node.domain, node.op_type))
+        if function is None:
+            for attr in node.attribute:
+                for subgraph in utils.subgraphs(attr):
+                    inline_in(subgraph, depth)
+            result.append(node)
+            return
+        if depth >= _MAX_INLINING_DEPTH:
+            raise ValueError(f"Unable to inline recursive function {function.name!r}.")
+        inliner = _CallSiteInliner(node, function, new_prefix(function))
+        for body_node in function.node:
+            expand(inliner.instantiate_node(body_node), depth + 1, result)
+
+    def inline_in(graph: onnx.GraphProto | onnx.FunctionProto, depth: int = 0) -> None:
+        result: list[onnx.NodeProto] = []
+        for node in graph.node:
+            copy = onnx.NodeProto()
+            copy.CopyFrom(node)
+            expand(copy, depth, result)
+        del graph.node[:]
+        graph.node.extend(result)
+
+    kept = [f for f in model.functions if (f.domain, f.name) not in inlined]
+    inline_in(model.graph)
+    for f in kept:
+        inline_in(f)
+    for f in inlined.values():
+        _merge_opset_imports(model, f.opset_import)
+
+    # Keep only the functions still called from the main graph.
+    by_key = {(f.domain, f.name): f for f in kept}
+    pending = [k for k in _called_function_names(model.graph.node) if k in by_key]
+    reachable: dict[tuple[str, str], onnx.FunctionProto] = {}
+    while pending:
+        key = pending.pop()
+        if key in reachable:
+            continue
+        reachable[key] = by_key[key]
+        pending.extend(k for k in _called_function_names(by_key[key].node) if k in by_key)
+    functions = []
+    for f in kept:
+        if (f.domain, f.name) in reachable:
+            function = onnx.FunctionProto()
+            function.CopyFrom(f)
+            functions.append(function)
+    del model.functions[:]
+    model.functions.extend(functions)
+    return model
+
+
+# Pattern-based rewriting:
+
+# Binary ops whose inputs can be swapped without changing the result.
+_COMMUTATIVE_OPS = frozenset(
+    [
+        "Add",
+        "And",
+        "BitwiseAnd",
+        "BitwiseOr",
+        "BitwiseXor",
+        "Equal",
+        "Max",
+        "Min",
+        "Mul",
+        "Or",
+        "Xor",
+    ]
+)
+
+
+@dataclasses.dataclass
+class _RewriteNode:
+    """A node of a graph, a function or a pattern, as seen by the pattern matcher."""
+
+    op_type: str
+    domain: str
+    inputs: list[str]
+    outputs: list[str]
+    attributes: dict[str, onnx.AttributeProto]
+    # Names referenced by subgraphs of the node (as implicit outer-scope inputs).
+    captured: set[str]
+    # The statement or the NodeProto this node was created from.
+    source: Any = None
+    # False for the nodes created by a rewrite.
+    rewritable: bool = True
+    # For the nodes created by a rewrite, the statement of the replacement they come from.
+    stmt: Optional[irbuilder.IRStmt] = None
+
+    @classmethod
+    def from_proto(cls, node: onnx.NodeProto) -> _RewriteNode:
+        captured: set[str] = set()
+        for attr in node.attribute:
+            for subgraph in utils.subgraphs(attr):
+                captured |= utils.referenced_names(subgraph)
+        return cls(
+            node.op_type,
+            "" if node.domain == "ai.onnx" else node.domain,
+            list(node.input),
+            list(node.output),
+            {a.name: a for a in node.attribute},
+            captured,
+            node,
+        )
+
+    @classmethod
+    def from_stmt(cls, stmt: irbuilder.IRStmt) -> _RewriteNode:
+        node = cls.from_proto(stmt.to_node_proto(""))
+        node.source = stmt
+        return node
+
+
+class _MatchedGraph:
+    """Indexes the producers and the consumers of the values of a list of nodes."""
+
+    def __init__(
+        self,
+        nodes: Sequence[_RewriteNode],
+        outputs: Collection[str],
+        initializers: dict[str, onnx.TensorProto],
+        types: Optional[Mapping[str, onnx.TypeProto]] = None,
+    ):
+        self.nodes = nodes
+        self.outputs = set(outputs)
+        self.initializers = initializers
+        self.types = types or {}
+        self.producers: dict[str, tuple[int, int]] = {}
+        self.consumers: dict[str, set[int]] = {}
+        for i, node in enumerate(nodes):
+            for k, y in enumerate(node.outputs):
+                if y:
+                    self.producers[y] = (i, k)
+            for x in [*node.inputs, *node.captured]:
+                self.consumers.setdefault(x, set()).add(i)
+
+    def constant_value(self, name: str) -> Optional[np.ndarray]:
+        if name in self.initializers:
+            return numpy_helper.to_array(self.initializers[name])
+        if name not in self.producers:
+            return None
+        node = self.nodes[self.producers[name][0]]
+        if node.op_type != "Constant" or node.domain != "" or len(node.attributes) != 1:
+            return None
+        return utils.constant_attribute_value(next(iter(node.attributes.values())))
+
+    def value_type(self, name: str) -> Optional[onnx.TypeProto]:
+        """Returns the statically known type of a value, None if unknown."""
+        if name in self.types:
+            return self.types[name]
+        value = self.constant_value(name)
+        if value is None:
+            return None
+        return helper.make_tensor_type_proto(
+            helper.np_dtype_to_tensor_dtype(value.dtype), value.shape
+        )
+
+    def is_used_outside(self, name: str, nodes: Collection[int]) -> bool:
+        return name in self.outputs or not self.consumers.get(name, set()) <= set(nodes)
+
+
+@dataclasses.dataclass
+class _MatchState:
+    # pattern value -> graph value
+    values: dict[str, str] = dataclasses.field(default_factory=dict)
+    # pattern attribute-parameter -> attribute of the graph
+    attributes: dict[str, onnx.AttributeProto] = dataclasses.field(default_factory=dict)
+    # index of a pattern node -> index of the matched graph node
+    nodes: dict[int, int] = dataclasses.field(default_factory=dict)
+    # indices of the Constant nodes of the graph matched by constants of the pattern
+    constants: set[int] = dataclasses.field(default_factory=set)
+
+    def copy(self) -> _MatchState:
+        return _MatchState(
+            dict(self.values), dict(self.attributes), dict(self.nodes), set(self.constants)
+        )
+
+
+class RewriteRule:
+    """Replaces the subgraphs matching a pattern by the body of a replacement function.
+
+    The pattern and the replacement are onnxscript functions with a single output.
+    A node matches a statement of the pattern if it has the same op type, domain,
+    attributes and inputs. The inputs of the pattern match any value, its constants
+    match constants (Constant nodes or initializers) with the same value, and its
+    attribute-parameters match any value of the attribute. The replacement is called
+    with the values and attributes bound to the inputs and attribute-parameters of
+    the pattern with the same names. An attribute-parameter of the replacement may
+    also have the name of an input of the pattern: the input then only matches
+    constants of one element, whose value is given to the attribute.
+
+    Intermediate values of a match must not be used outside of it, otherwise the
+    rewrite would duplicate their computation and the match is rejected.
+
+    Args:
+        pattern: the function describing the subgraph to replace
+        replacement: the function computing the same output
+        commute: if True, the two inputs of commutative ops such as Add or Mul match
+            in either order
+        condition: if given, called with the statically known types of the values
+            bound to the inputs of the pattern (None when unknown), by input name;
+            a match is rejected unless it returns True
+    """
+
+    def __init__(
+        self,
+        pattern: values.OnnxFunction,
+        replacement: values.OnnxFunction,
+        commute: bool = True,
+        condition: Optional[Callable[[dict[str, Optional[onnx.TypeProto]]], bool]] = None,
+    ):
+        self.pattern = pattern
+        self.replacement = replacement
+        self.commute = commute
+        self.condition = condition
+        pattern_proto = pattern.to_function_proto()
+        self._replacement_proto = replacement.to_function_proto()
+        if len(pattern_proto.output) != 1 or len(self._replacement_proto.output) != 1:
+            raise ValueError("The pattern and the replacement must have a single output.")
+        self._inputs = set(pattern_proto.input)
+        self._nodes = [_RewriteNode.from_proto(n) for n in pattern_proto.node]
+        if any(n.captured for n in self._nodes):
+            raise ValueError(f"Pattern {pattern.name!r} cannot contain subgraphs.")
+        self._producers = _MatchedGraph(self._nodes, [], {}).producers
+        output = pattern_proto.output[0]
+        if output not in self._producers:
+            raise ValueError(f"The output of pattern {pattern.name!r} must be computed.")
+        self._root, self._output_index = self._producers[output]
+        unknown = set(self._replacement_proto.input) - self._inputs
+        attributes = set(self._replacement_proto.attribute) - set(pattern_proto.attribute)
+        self._constant_inputs = attributes & self._inputs
+        unknown |= attributes - self._inputs
+        if unknown:
+            raise ValueError(
+                f"Replacement {replacement.name!r} uses inputs or attributes {sorted(unknown)} "
+                f"not defined by pattern {pattern.name!r}."
+            )
+
+    @property
+    def root_op(self) -> tuple[str, str]:
+        """The domain and the op type of the node computing the output of the pattern."""
+        root = self._nodes[self._root]
+        return root.domain, root.op_type
+
+    def _match_value(
+        self, graph: _MatchedGraph, p_value: str, g_value: str, state: _MatchState
+    ) -> Optional[_MatchState]:
+        if p_value == "" or g_value == "":
+            return state if p_value == g_value else None
+        if p_value in state.values:
+            return state if state.values[p_value] == g_value else None
+        state = state.copy()
+        state.values[p_value] = g_value
+        if p_value in self._inputs:
+            return state
+        p_index, p_output = self._producers[p_value]
+        p_node = self._nodes[p_index]
+        if p_node.op_type == "Constant" and p_node.domain == "":
+            expected = utils.constant_attribute_value(next(iter(p_node.attributes.values())))
+            actual = graph.constant_value(g_value)
+            if (
+                expected is None
+                or actual is None
+                or expected.dtype != actual.dtype
+                or not np.array_equal(expected, actual)
+            ):
+                return None
+            if g_value in graph.producers:
+                state.constants.add(graph.producers[g_value][0])
+            return state
+        if g_value not in graph.producers:
+            return None
+        g_index, g_output = graph.producers[g_value]
+        if g_output != p_output:
+            return None
+        return self._match_node(graph, p_index, g_index, state)
+
+    def _match_attributes(
+        self, p_node: _RewriteNode, g_node: _RewriteNode, state: _MatchState
+    ) -> bool:
+        if set(p_node.attributes) != set(g_node.attributes):
+            return False
+        for name, p_attr in p_node.attributes.items():
+            g_attr = g_node.attributes[name]
+            if not p_attr.ref_attr_name:
+                if helper.get_attribute_value(p_attr) != helper.get_attribute_value(g_attr):
+                    return False
+                continue
+            bound = state.attributes.get(p_attr.ref_attr_name)
+            if bound is None:
+                bound = onnx.AttributeProto()
+                bound.CopyFrom(g_attr)
+                bound.name = p_attr.ref_attr_name
+                state.attributes[p_attr.ref_attr_name] = bound
+            elif helper.get_attribute_value(bound) != helper.get_attribute_value(g_attr):
+                return False
+        return True
+
+    def _match_node(
+        self, graph: _MatchedGraph, p_index: int, g_index: int, state: _MatchState
+    ) -> Optional[_MatchState]:
+        p_node = self._nodes[p_index]
+        g_node = graph.nodes[g_index]
+        if (p_node.domain, p_node.op_type) != (g_node.domain, g_node.op_type):
+            return None
+        if len(p_node.outputs) != len(g_node.outputs) or g_node.captured:
+            return None
+        if g_index in state.nodes.values():
+            return None
+        state = state.copy()
+        if not self._match_attributes(p_node, g_node, state):
+            return None
+        state.nodes[p_index] = g_index
+        orders = [p_node.inputs]
+        if self.commute and p_node.op_type in _COMMUTATIVE_OPS and len(p_node.inputs) == 2:
+            orders.append(p_node.inputs[::-1])
+        for p_inputs in orders:
+            if len(p_inputs) != len(g_node.inputs):
+                continue
+            result = state
+            for p_value, g_value in zip(p_inputs, g_node.inputs):
+                matched = self._match_value(graph, p_value, g_value, result)
+                if matched is None:
+                    break
+                result = matched
+            else:
+                return result
+        return None
+
+    def match(self, graph: _MatchedGraph, index: int) -> Optional[_MatchState]:
+        """Matches the pattern with the subgraph computing the outputs of a node."""
+        state = self._match_node(graph, self._root, index, _MatchState())
+        if state is None:
+            return None
+        root = graph.nodes[index]
+        matched = set(state.nodes.values())
+        for k, y in enumerate(root.outputs):
+            if k != self._output_index and y and graph.is_used_outside(y, []):
+                return None
+        for g_index in matched - {index}:
+            if any(graph.is_used_outside(y, matched) for y in graph.nodes[g_index].outputs):
+                return None
+        for name in self._constant_inputs:
+            value = graph.constant_value(state.values.get(name, ""))
+            if value is None or value.size != 1:
+                return None
+            state.attributes[name] = helper.make_attribute(name, value.item())
+            if state.values[name] in graph.producers:
+                state.constants.add(graph.producers[state.values[name]][0])
+        if self.condition is not None:
+            types = {
+                name: graph.value_type(state.values[name])
+                for name in self._inputs
+                if name in state.values
+            }
+            if not self.condition(types):
+                return None
+        return state
+
+    def instantiate(
+        self, state: _MatchState, root: _RewriteNode, prefix: str
+    ) -> list[_RewriteNode]:
+        """Returns the nodes of the replacement of a match, computing the output of root.
+
+        Names of the intermediate values of the replacement start with prefix.
+        """
+        call = helper.make_node(
+            self._replacement_proto.name,
+            [state.values.get(x, "") for x in self._replacement_proto.input],
+            [root.outputs[self._output_index]],
+        )
+        call.attribute.extend(
+            state.attributes[a]
+            for a in self._replacement_proto.attribute
+            if a in state.attributes
+        )
+        inliner = _CallSiteInliner(call, self._replacement_proto, prefix)
+        nodes = []
+        for n, stmt in zip(self._replacement_proto.node, self.replacement.function_ir.stmts):
+            node = _RewriteNode.from_proto(inliner.instantiate_node(n))
+            # The replacement is not rewritten again, which could never terminate.
+            node.rewritable = False
+            node.stmt = stmt
+            nodes.append(node)
+        return nodes
+
+
+def _rewrite_nodes(
+    nodes: list[_RewriteNode],
+    outputs: Collection[str],
+    initializers: dict[str, onnx.TensorProto],
+    types: Mapping[str, onnx.TypeProto],
+    rules: dict[tuple[str, str], list[RewriteRule]],
+    used_names: set[str],
+) -> tuple[list[_RewriteNode], int]:
+    """Applies rewrite rules to a topologically sorted list of nodes."""
+    count = 0
+    graph = _MatchedGraph(nodes, outputs, initializers, types)
+    i = 0
+    while i < len(nodes):
+        node = nodes[i]
+        candidates = rules.get((node.domain, node.op_type), []) if node.rewritable else []
+        state = None
+        for rule in candidates:
+            state = rule.match(graph, i)
+            if state is not None:
+                break
+        if state is None:
+            i += 1
+            continue
+        prefix = f"{rule.replacement.name}_{count}_"
+        while any(name.startswith(prefix) for name in used_names):
+            prefix = "_" + prefix
+        replacement = rule.instantiate(state, node, prefix)
+        for n in replacement:
+            used_names.update(n.outputs)
+        removed = set(state.nodes.values())
+        removed |= {
+            c
+            for c in state.constants
+            if not any(graph.is_used_outside(y, removed) for y in nodes[c].outputs)
+        }
+        # The matched nodes compute the inputs of node i, they all come before it.
+        kept = [n for k, n in enumerate(nodes[:i]) if k not in removed]
+        nodes = kept + replacement + nodes[i + 1 :]
+        graph = _MatchedGraph(nodes, outputs, initializers, types)
+        i = len(kept) + len(replacement)
+        count += 1
+    return nodes, count
+
+
+def _index_rules(rules: Iterable[RewriteRule]) -> dict[tuple[str, str], list[RewriteRule]]:
+    index: dict[tuple[str, str], list[RewriteRule]] = {}
+    for rule in rules:
+        index.setdefault(rule.root_op, []).append(rule)
+    return index
+
+
+def _rewrite_function(
+    function: irbuilder.IRFunction, rules: dict[tuple[str, str], list[RewriteRule]]
+) -> int:
+    used_names = {x.name for x in function.inputs}
+    for stmt in function.stmts:
+        used_names.update(stmt.output_names)
+    opsets: dict[str, values.Opset] = {}
+    for stmt in function.stmts:
+        opsets.setdefault(stmt.callee.opset.domain, stmt.callee.opset)
+    types = dict(function.value_types)
+    for x in function.inputs:
+        if x.typeinfo is not None:
+            types.setdefault(x.name, x.typeinfo.to_type_proto())
+    nodes, count = _rewrite_nodes(
+        [_RewriteNode.from_stmt(s) for s in function.stmts],
+        [y.name for y in function.outputs],
+        {},
+        types,
+        rules,
+        used_names,
+    )
+    stmts = []
+    for node in nodes:
+        origin = node.stmt
+        if origin is None:
+            # The node was not created by a rewrite.
+            stmts.append(node.source)
+            continue
+        callee = origin.callee
+        if not isinstance(callee, values.OnnxFunction) and callee.opset.domain in opsets:
+            # Like in a model, the op is taken from the opset imported by the function.
+            callee = values.Op(opsets[callee.opset.domain], callee.opname)
+        stmts.append(
+            irbuilder.IRStmt(
+                node.outputs,
+                callee,
+                [x or None for x in node.inputs],
+                [irbuilder.IRAttributeValue(a) for a in node.attributes.values()],
+                sub_functions=origin.functions,
+            )
+        )
+        if isinstance(origin.callee, values.OnnxFunction):
+            function.add_called_function(origin.callee)
+    function.stmts = stmts
+    return count
+
+
+def _rewrite_graph(
+    graph: onnx.GraphProto | onnx.FunctionProto,
+    rules: dict[tuple[str, str], list[RewriteRule]],
+    used_names: set[str],
+    outer_types: Optional[Mapping[str, onnx.TypeProto]] = None,
+) -> tuple[int, list[irbuilder.IRStmt]]:
+    """Rewrites a graph and its subgraphs, returns the statements the new nodes come from.
+
+    outer_types are the types of the values of the enclosing graphs.
+    """
+    types = dict(outer_types or {})
+    if isinstance(graph, onnx.GraphProto):
+        outputs = [y.name for y in graph.output]
+        initializers = {t.name: t for t in graph.initializer}
+        for v in [*graph.input, *graph.value_info, *graph.output]:
+            if v.HasField("type"):
+                types[v.name] = v.type
+    else:
+        outputs = list(graph.output)
+        initializers = {}
+    count = 0
+    created = []
+    for node in graph.node:
+        for attr in node.attribute:
+            for subgraph in utils.subgraphs(attr):
+                num_rewrites, stmts = _rewrite_graph(subgraph, rules, used_names, types)
+                count += num_rewrites
+                created.extend(stmts)
+    nodes, num_rewrites = _rewrite_nodes(
+        [_RewriteNode.from_proto(n) for n in graph.node],
+        outputs,
+        initializers,
+        types,
+        rules,
+        used_names,
+    )
+    new_nodes = [n.source for n in nodes]
+    del graph.node[:]
+    graph.node.extend(new_nodes)
+    created.extend(n.stmt for n in nodes if n.stmt is not None)
+    return count + num_rewrites, created
+
+
+def _add_dependencies(
+    target: onnx.ModelProto | onnx.FunctionProto,
+    stmts: Iterable[irbuilder.IRStmt],
+    functions: dict[tuple[str, str], onnx.FunctionProto],
+) -> None:
+    """Imports the opsets and collects the functions called by statements."""
+    domains = {o.domain for o in target.opset_import}
+    for stmt in stmts:
+        callee = stmt.callee
+        if isinstance(callee, values.OnnxFunction):
+            for proto in callee.function_ir.called_functions.values():
+                functions.setdefault((proto.domain, proto.name), proto)
+            proto = callee.to_function_proto()
+            functions.setdefault((proto.domain, proto.name), proto)
+        if callee.opset.domain not in domains:
+            version = 1 if isinstance(callee, values.OnnxFunction) else callee.opset.version
+            target.opset_import.append(helper.make_opsetid(callee.opset.domain, version))
+            domains.add(callee.opset.domain)
+
+
+def rewrite(
+    target: irbuilder.IRFunction | onnx.ModelProto, rules: Iterable[RewriteRule]
+) -> int:
+    """Replaces in-place the subgraphs matching the patterns of rules.
+
+    Rules are indexed by the op type of the root of their pattern: each node is
+    only matched against the rules whose pattern computes its output with the same
+    op. When several rules match a node, the first one is applied.
+
+    For a model, the main graph, its subgraphs and the model-local functions are
+    rewritten, and the opsets and functions used by the replacements are added to
+    the model. For an IRFunction, only its top-level statements are rewritten. In
+    both cases, the ops of a replacement are taken from the version of their opset
+    already used by the target, if any.
+
+    Args:
+        target: the function or the model to rewrite
+        rules: the rules to apply
+
+    Returns:
+        the number of rewritten subgraphs
+    """
+    index = _index_rules(rules)
+    if isinstance(target, irbuilder.IRFunction):
+        return _rewrite_function(target, index)
+    used_names = _all_names(target.graph)
+    for f in target.functions:
+        used_names |= _all_names(f)
+    functions = {(f.domain, f.name): f for f in target.functions}
+    count, created = _rewrite_graph(target.graph, index, used_names)
+    _add_dependencies(target, created, functions)
+    for f in list(target.functions):
+        num_rewrites, created = _rewrite_graph(f, index, used_names)
+        count += num_rewrites
+        _add_dependencies(f, created, functions)
+    for key, proto in functions.items():
+        if key not in {(f.domain, f.name) for f in target.functions}:
+            target.functions.append(proto)
+            if proto.domain not in {o.domain for o in target.opset_import}:
+                target.opset_import.append(helper.make_opsetid(proto.domain, 1))
+    if count:
+        logger.debug("optimizer:rewrite:%d subgraphs rewritten", count)
+    return count
@@ -0,0 +1,320 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+"""Dynamic quantization of matrix multiplications to 8-bit integers.
+
+The float32 `MatMul` and `Gemm` ops are replaced by a `MatMulInteger` of their
+inputs quantized to uint8, followed by the rescaling of its int32 result:
+
+    a_q, a_scale, a_zero_point = DynamicQuantizeLinear(a)
+    b_q, b_scale, b_zero_point = DynamicQuantizeLinear(b)
+    y = Cast(MatMulInteger(a_q, b_q, a_zero_point, b_zero_point)) * (a_scale * b_scale)
+
+The quantization parameters of the first input are computed at inference time, from
+the actual values. The quantization of a constant second input, such as a weight, is
+computed by the pass.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Callable, Collection, Optional, Union
+
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper
+
+from onnxscript import irbuilder, utils, values
+
+logger = logging.getLogger("onnx-script")
+
+# The first version of the standard opset providing DynamicQuantizeLinear.
+_MIN_OPSET_VERSION = 11
+
+_FLOAT = onnx.TensorProto.FLOAT
+
+# Selects the nodes to quantize: either the names of the (first) outputs of the nodes
+# or a predicate over the nodes.
+NodeSelector = Union[Collection[str], Callable[[onnx.NodeProto], bool]]
+
+
+def quantize_weight(weight: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Quantizes a float32 tensor to uint8 like `DynamicQuantizeLinear`.
+
+    Returns:
+        the quantized tensor, its scale and its zero point
+    """
+    low = min(float(weight.min(initial=0.0)), 0.0)
+    high = max(float(weight.max(initial=0.0)), 0.0)
+    scale = np.float32((high - low) / 255)
+    if scale == 0:
+        # All the values are zeros.
+        scale = np.float32(1.0)
+    zero_point = np.clip(np.round(-low / scale), 0, 255).astype(np.uint8)
+    quantized = np.clip(np.round(weight / scale) + zero_point, 0, 255).astype(np.uint8)
+    return quantized, np.array(scale, dtype=np.float32), np.array(zero_point)
+
+
+def _is_selected(node: onnx.NodeProto, nodes: Optional[NodeSelector]) -> bool:
+    if nodes is None:
+        return True
+    if callable(nodes):
+        return nodes(node)
+    return node.output[0] in nodes
+
+
+def _attribute(node: onnx.NodeProto, name: str, default):
+    for attr in node.attribute:
+        if attr.name == name:
+            return helper.get_attribute_value(attr)
+    return default
+
+
+class _Quantizer:
+    """Replaces MatMul and Gemm nodes by their quantized computation."""
+
+    def __init__(
+        self,
+        elem_types: dict[str, int],
+        constants: dict[str, np.ndarray],
+        used_names: set[str],
+        use_initializers: bool,
+    ):
+        self.elem_types = elem_types
+        self.constants = constants
+        self.used_names = used_names
+        # Constants are stored as initializers in a graph and as nodes in a function.
+        self.use_initializers = use_initializers
+        self.nodes: list[onnx.NodeProto] = []
+        self.initializers: list[onnx.TensorProto] = []
+        # The quantized values, by name and transposition.
+        self.quantized: dict[tuple[str, bool], tuple[str, str | np.ndarray, str]] = {}
+
+    def _unique_name(self, name: str) -> str:
+        candidate = name
+        while candidate in self.used_names:
+            candidate = "_" + candidate
+        self.used_names.add(candidate)
+        return candidate
+
+    def _add_node(self, op_type: str, inputs: list[str], output: str, **attrs) -> str:
+        name = self._unique_name(output)
+        self.nodes.append(helper.make_node(op_type, inputs, [name], **attrs))
+        return name
+
+    def _add_constant(self, value: np.ndarray, name: str) -> str:
+        name = self._unique_name(name)
+        tensor = numpy_helper.from_array(value, name)
+        if self.use_initializers:
+            self.initializers.append(tensor)
+        else:
+            self.nodes.append(helper.make_node("Constant", [], [name], value=tensor))
+        return name
+
+    def is_quantizable(self, node: onnx.NodeProto) -> bool:
+        if node.domain not in ("", "ai.onnx") or node.op_type not in ("MatMul", "Gemm"):
+            return False
+        return all(self.elem_types.get(x) == _FLOAT for x in node.input[:2])
+
+    def _quantize_input(self, name: str, transpose: bool) -> tuple[str, str | np.ndarray, str]:
+        """Returns the quantized value, its scale and its zero point.
+
+        The scale of a constant is returned as an array, it is combined with other
+        constant factors by the caller. A value used by several quantized ops is
+        quantized once.
+        """
+        key = (name, transpose)
+        if key in self.quantized:
+            return self.quantized[key]
+        if name in self.constants:
+            value = self.constants[name]
+            quantized, scale, zero_point = quantize_weight(value.T if transpose else value)
+            self.quantized[key] = (
+                self._add_constant(quantized, f"{name}_quantized"),
+                scale,
+                self._add_constant(zero_point, f"{name}_zero_point"),
+            )
+            return self.quantized[key]
+        if transpose:
+            name = self._add_node("Transpose", [name], f"{name}_transposed")
+        outputs = [
+            self._unique_name(f"{name}_quantized"),
+            self._unique_name(f"{name}_scale"),
+            self._unique_name(f"{name}_zero_point"),
+        ]
+        self.nodes.append(helper.make_node("DynamicQuantizeLinear", [name], outputs))
+        self.quantized[key] = (outputs[0], outputs[1], outputs[2])
+        return self.quantized[key]
+
+    def quantize(self, node: onnx.NodeProto) -> None:
+        is_gemm = node.op_type == "Gemm"
+        a_q, a_scale, a_zero_point = self._quantize_input(
+            node.input[0], is_gemm and bool(_attribute(node, "transA", 0))
+        )
+        b_q, b_scale, b_zero_point = self._quantize_input(
+            node.input[1], is_gemm and bool(_attribute(node, "transB", 0))
+        )
+        output = node.output[0]
+        product = self._add_node(
+            "MatMulInteger", [a_q, b_q, a_zero_point, b_zero_point], f"{output}_int32"
+        )
+        product = self._add_node("Cast", [product], f"{output}_float", to=_FLOAT)
+        # The constant factors of the result, including alpha, are combined by the pass.
+        factor = np.array(_attribute(node, "alpha", 1.0) if is_gemm else 1.0, np.float32)
+        scales = []
+        for scale in [a_scale, b_scale]:
+            if isinstance(scale, np.ndarray):
+                factor = factor * scale
+            else:
+                scales.append(scale)
+        if factor != 1.0 or not scales:
+            scales.append(self._add_constant(factor, f"{output}_factor"))
+        scale = scales[0]
+        if len(scales) > 1:
+            scale = self._add_node("Mul", scales[:2], f"{output}_scale")
+        if len(scales) > 2:
+            scale = self._add_node("Mul", [scale, scales[2]], f"{output}_scale")
+        c = node.input[2] if is_gemm and len(node.input) > 2 else ""
+        if not c:
+            self.nodes.append(helper.make_node("Mul", [product, scale], [output]))
+            return
+        product = self._add_node("Mul", [product, scale], f"{output}_product")
+        beta = _attribute(node, "beta", 1.0)
+        if beta != 1.0:
+            beta_name = self._add_constant(np.array(beta, dtype=np.float32), f"{output}_beta")
+            c = self._add_node("Mul", [c, beta_name], f"{output}_bias")
+        self.nodes.append(helper.make_node("Add", [product, c], [output]))
+
+
+def _quantize_nodes(
+    nodes: list[onnx.NodeProto],
+    outputs: Collection[str],
+    initializers: Optional[dict[str, onnx.TensorProto]],
+    elem_types: dict[str, int],
+    selected: Optional[NodeSelector],
+    used_names: set[str],
+) -> tuple[list[onnx.NodeProto], list[onnx.TensorProto], set[str], int]:
+    """Quantizes the selected MatMul and Gemm of a topologically sorted list of nodes.
+
+    Returns:
+        the new list of nodes, the constants to add as initializers (if initializers
+        is not None), the quantized constants and the number of quantized nodes
+    """
+    constants = {}
+    for name, tensor in (initializers or {}).items():
+        if tensor.data_type == _FLOAT:
+            constants[name] = numpy_helper.to_array(tensor)
+    for node in nodes:
+        if node.op_type == "Constant" and len(node.attribute) == 1:
+            value = utils.constant_attribute_value(node.attribute[0])
+            if value is not None and value.dtype == np.float32:
+                constants[node.output[0]] = value
+    quantizer = _Quantizer(elem_types, constants, used_names, initializers is not None)
+    count = 0
+    for node in nodes:
+        if quantizer.is_quantizable(node) and _is_selected(node, selected):
+            quantizer.quantize(node)
+            count += 1
+        else:
+            quantizer.nodes.append(node)
+    # The float32 weights replaced by their quantization may no longer be used.
+    quantized = {name for name, _ in quantizer.quantized if name in constants}
+    used = set(outputs)
+    for node in quantizer.nodes:
+        used |= utils.used_names(node)
+    unused = {name for name in quantized if name not in used}
+    new_nodes = [
+        n for n in quantizer.nodes if n.op_type != "Constant" or n.output[0] not in unused
+    ]
+    return new_nodes, quantizer.initializers, unused, count
+
+
+def _quantize_model(model: onnx.ModelProto, selected: Optional[NodeSelector]) -> int:
+    if utils.standard_opset_version(model.opset_import) < _MIN_OPSET_VERSION:
+        return 0
+    graph = model.graph
+    graph_inputs = {x.name for x in graph.input}
+    # Initializers which are also inputs can be overridden, they are not constants.
+    initializers = {t.name: t for t in graph.initializer if t.name not in graph_inputs}
+    used_names = {t.name for t in graph.initializer} | graph_inputs
+    for node in graph.node:
+        used_names |= utils.used_names(node)
+        used_names.update(node.output)
+    nodes, new_initializers, unused, count = _quantize_nodes(
+        list(graph.node),
+        [y.name for y in graph.output],
+        initializers,
+        utils.elem_types(model),
+        selected,
+        used_names,
+    )
+    kept = [t for t in graph.initializer if t.name not in unused]
+    utils.replace_all(graph.initializer, kept + new_initializers)
+    utils.replace_all(graph.node, nodes)
+    return count
+
+
+def _quantize_function(
+    function: irbuilder.IRFunction, selected: Optional[NodeSelector]
+) -> int:
+    standard_opsets = [
+        s.callee.opset for s in function.stmts if s.callee.opset.domain in ("", "ai.onnx")
+    ]
+    if not standard_opsets or standard_opsets[0].version < _MIN_OPSET_VERSION:
+        return 0
+    opset = standard_opsets[0]
+    model = function.to_model_proto()
+    used_names = {x.name for x in function.inputs}
+    for stmt in function.stmts:
+        used_names.update(x for x in stmt.args if x is not None)
+        used_names.update(stmt.output_names)
+    # Nodes are matched with the statements they come from by their name.
+    stmts = {f"n{i}": stmt for i, stmt in enumerate(function.stmts)}
+    nodes, _, _, count = _quantize_nodes(
+        list(model.graph.node),
+        [y.name for y in function.outputs],
+        None,
+        utils.elem_types(model),
+        selected,
+        used_names,
+    )
+    function.stmts = [
+        stmts[node.name]
+        if node.name in stmts
+        else irbuilder.IRStmt(
+            list(node.output),
+            values.Op(opset, node.op_type),
+            list(node.input),
+            [irbuilder.IRAttributeValue(a) for a in node.attribute],
+        )
+        for node in nodes
+    ]
+    return count
+
+
+def quantize_dynamic(
+    target: irbuilder.IRFunction | onnx.ModelProto, nodes: Optional[NodeSelector] = None
+) -> int:
+    """Replaces in-place float32 MatMul and Gemm ops by their dynamic 8-bit quantization.
+
+    For a model, only the nodes of the main graph are quantized. For an IRFunction, only
+    its top-level statements are quantized. Both inputs of a quantized op must be known
+    to be float32 tensors. The ops are left unchanged if the standard opset used by the
+    target is older than version 11.
+
+    Args:
+        target: the function or the model to quantize
+        nodes: the nodes to quantize, identified by the name of their first output or
+            selected by a predicate over NodeProtos; by default all the MatMul and
+            Gemm ops are quantized
+
+    Returns:
+        the number of quantized nodes
+    """
+    if isinstance(target, irbuilder.IRFunction):
+        count = _quantize_function(target, nodes)
+    else:
+        count = _quantize_model(target, nodes)
+    if count:
+        logger.debug("quantization:%d nodes quantized", count)
+    return count
@@ -12,7 +12,13 @@ from typing import Callable, Optional
 
 
 class SourceInfo:
-    """Information about onnxscript source fragment, used for diagnostic messages."""
+    """Information about onnxscript source fragment, used for diagnostic messages.
+
+    The source code and the function name are references shared by all the fragments
+    of a function.
+    """
+
+    __slots__ = ("ast_node", "code", "function_name", "lineno")
 
     def __init__(
         self,
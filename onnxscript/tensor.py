@@ -79,11 +79,17 @@ class Tensor:
         for axis_, s in enumerate(index):
             if isinstance(s, slice):
                 if s.step is None or s.step > 0:
-                    indices_.append([s.start or 0, s.stop or shape[axis_], axis_, s.step or 1])
+                    start = 0 if s.start is None else s.start
+                    stop = shape[axis_] if s.stop is None else s.stop
+                    indices_.append([start, stop, axis_, s.step or 1])
                 else:
-                    indices_.append([s.start or (shape[axis_] - 1), s.stop, axis_, s.step])
+                    start = shape[axis_] - 1 if s.start is None else s.start
+                    # The smallest int64 value makes Slice stop after the first element.
+                    stop = np.iinfo(np.int64).min if s.stop is None else s.stop
+                    indices_.append([start, stop, axis_, s.step])
             elif isinstance(s, int):
-                indices_.append([s, s + 1, axis_, 1])
+                stop = s + 1 if s != -1 else shape[axis_]
+                indices_.append([s, stop, axis_, 1])
                 to_squeeze.append(axis_)
             else:
                 raise TypeError(f"Unexpected type {type(s)}: slice or int expected.")
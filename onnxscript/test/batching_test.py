@@ -0,0 +1,145 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import unittest
+
+import numpy as np
+import onnx
+
+from onnxscript import batching, script
+from onnxscript.onnx_opset import opset17 as op
+from onnxscript.onnx_types import BOOL, FLOAT
+from onnxscript.test.common import testutils
+
+
+@script()
+def affine(x: FLOAT[4], w: FLOAT[4, 3], b: FLOAT[3]) -> FLOAT[3]:
+    return op.Relu(op.Add(op.MatMul(x, w), b))
+
+
+@script()
+def attention(q: FLOAT[3, 4], k: FLOAT[5, 4]) -> FLOAT[3, 5]:
+    scores = op.MatMul(q, op.Transpose(k, perm=[1, 0]))
+    return op.Softmax(scores, axis=-1)
+
+
+@script()
+def stats(x: FLOAT[2, 6]):
+    flat = op.Reshape(x, op.Constant(value_ints=[3, 4]))
+    total = op.ReduceSum(flat, op.Constant(value_ints=[1]), keepdims=0)
+    return total, op.Shape(flat)
+
+
+@script()
+def scale(x, alpha: float = 2.0):
+    return op.Mul(x, op.Constant(value_float=alpha))
+
+
+@script()
+def layer(x: FLOAT[1, 2, 5, 5], w: FLOAT[3, 2, 3, 3]) -> FLOAT[1, 3, 3, 3]:
+    return scale(op.Conv(x, w), alpha=0.5)
+
+
+@script()
+def gemm(a: FLOAT[3, 4], b: FLOAT[5, 4], c: FLOAT[5]):
+    y = op.Gemm(a, b, c, transB=1, alpha=2.0, beta=0.5)
+    z = op.Concat(y, op.Unsqueeze(c, op.Constant(value_ints=[0])), axis=0)
+    return op.Flatten(z, axis=1), op.Neg(c)
+
+
+@script()
+def branch(x: FLOAT[4], flag: BOOL) -> FLOAT[4]:
+    if flag:
+        y = op.Neg(x)
+    else:
+        y = op.Relu(x)
+    return y
+
+
+def _run_model(function, *args):
+    model = function.to_model_proto()
+    onnx.checker.check_model(model)
+    return testutils.run_model(
+        model, **{x.name: arg for x, arg in zip(model.graph.input, args)}
+    )
+
+
+class TestVmap(unittest.TestCase):
+    def test_batched_and_shared_inputs(self):
+        xs = np.random.randn(6, 4).astype(np.float32)
+        w = np.random.randn(4, 3).astype(np.float32)
+        b = np.random.randn(3).astype(np.float32)
+        batched = batching.vmap(affine, in_axes=(0, None, None))
+        expected = np.stack([affine(x, w, b) for x in xs])
+        np.testing.assert_allclose(batched(xs, w, b), expected, rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(
+            _run_model(batched, xs, w, b)[0], expected, rtol=1e-5, atol=1e-6
+        )
+        self.assertEqual(batched.name, "affine_vmap_0_n_n_0")
+
+    def test_in_and_out_axes(self):
+        qs = np.random.randn(2, 3, 4).astype(np.float32)
+        ks = np.random.randn(5, 2, 4).astype(np.float32)
+        batched = batching.vmap(attention, in_axes=(0, 1), out_axes=2)
+        expected = np.stack([attention(qs[i], ks[:, i]) for i in range(2)], axis=2)
+        np.testing.assert_allclose(batched(qs, ks), expected, rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(_run_model(batched, qs, ks)[0], expected, rtol=1e-5)
+
+    def test_reshape_reduction_and_shape(self):
+        xs = np.random.randn(4, 2, 6).astype(np.float32)
+        totals, shape = batching.vmap(stats)(xs)
+        np.testing.assert_allclose(
+            totals, xs.reshape(4, 3, 4).sum(axis=2), rtol=1e-5, atol=1e-6
+        )
+        np.testing.assert_equal(shape, np.tile([3, 4], (4, 1)))
+
+    def test_merged_batch_and_called_function(self):
+        xs = np.random.randn(6, 1, 2, 5, 5).astype(np.float32)
+        w = np.random.randn(3, 2, 3, 3).astype(np.float32)
+        batched = batching.vmap(layer, in_axes=(0, None))
+        expected = np.stack([layer(x, w) for x in xs])
+        np.testing.assert_allclose(batched(xs, w), expected, rtol=1e-4, atol=1e-5)
+        model = batched.to_model_proto()
+        self.assertEqual([f.name for f in model.functions], ["scale", "scale_vmap"])
+        np.testing.assert_allclose(
+            _run_model(batched, xs, w)[0], expected, rtol=1e-4, atol=1e-5
+        )
+
+    def test_unbatched_outputs_are_broadcast(self):
+        a = np.random.randn(2, 3, 4).astype(np.float32)
+        b = np.random.randn(5, 4).astype(np.float32)
+        c = np.random.randn(5).astype(np.float32)
+        flat, neg = batching.vmap(gemm, in_axes=(0, None, None))(a, b, c)
+        expected = [gemm(x, b, c) for x in a]
+        np.testing.assert_allclose(
+            flat, np.stack([e[0] for e in expected]), rtol=1e-5, atol=1e-6
+        )
+        np.testing.assert_allclose(neg, np.stack([e[1] for e in expected]), rtol=1e-5)
+
+    def test_all_inputs_batched(self):
+        a = np.random.randn(2, 3, 4).astype(np.float32)
+        b = np.random.randn(2, 5, 4).astype(np.float32)
+        c = np.random.randn(2, 5).astype(np.float32)
+        flat, neg = batching.vmap(gemm)(a, b, c)
+        for i in range(2):
+            expected = gemm(a[i], b[i], c[i])
+            np.testing.assert_allclose(flat[i], expected[0], rtol=1e-5, atol=1e-6)
+            np.testing.assert_allclose(neg[i], expected[1], rtol=1e-5)
+
+    def test_batched_control_flow_is_reported(self):
+        with self.assertRaisesRegex(ValueError, "If"):
+            batching.vmap(branch)
+        # The branches would have to be rewritten as well.
+        with self.assertRaisesRegex(ValueError, "subgraphs of If"):
+            batching.vmap(branch, in_axes=(0, None))
+
+    def test_invalid_axes(self):
+        with self.assertRaisesRegex(ValueError, "no input"):
+            batching.vmap(affine, in_axes=None)
+        with self.assertRaises(ValueError):
+            batching.vmap(affine, in_axes=(0, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
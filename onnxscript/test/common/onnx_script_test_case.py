@@ -14,7 +14,6 @@ from typing import Any, Collection, Optional
 import numpy as np
 import onnx
 import onnx.backend.test.case.node as node_test
-import onnxruntime as ort
 from onnx.onnx_cpp2py_export import checker
 from onnxruntime.capi.onnxruntime_pybind11_state import (
     Fail,
@@ -23,7 +22,8 @@ from onnxruntime.capi.onnxruntime_pybind11_state import (
 )
 
 import onnxscript
-from onnxscript import utils
+from onnxscript import quantization, utils
+from onnxscript.test.common import testutils
 
 
 @dataclasses.dataclass(repr=False, eq=False)
@@ -179,16 +179,16 @@ class OnnxScriptTestCase(unittest.TestCase):
                     vi.name: np.array(t) if isinstance(t, numbers.Number) else t
                     for vi, t in zip(model.graph.input, param.input)
                 }
-        try:
-            session = ort.InferenceSession(
-                model.SerializeToString(), providers=["CPUExecutionProvider"]
-            )
-        except (Fail, InvalidArgument, InvalidGraph) as e:
-            raise AssertionError(f"Unable to load model\n{str(model)}") from e
         # input['input_2'] = None
-        actual = session.run(None, input)
+        actual = self._run_model(model, input)
         np.testing.assert_allclose(actual, param.output, rtol=self.rtol)
 
+    def _run_model(self, model: onnx.ModelProto, feeds: dict[str, Any]) -> list[Any]:
+        try:
+            return testutils.run_model(model, **feeds)
+        except (Fail, InvalidArgument, InvalidGraph) as e:
+            raise AssertionError(f"Unable to run model\n{str(model)}") from e
+
     def run_eager_test(
         self,
         param: FunctionTestParams,
@@ -203,6 +203,38 @@ class OnnxScriptTestCase(unittest.TestCase):
             atol=atol or self.atol,
         )
 
+    def run_quantization_test(
+        self,
+        function: onnxscript.OnnxFunction,
+        input: list[Any],
+        tolerance: float = 0.05,
+        nodes: Optional[quantization.NodeSelector] = None,
+    ) -> onnx.ModelProto:
+        """Compares the outputs of a function with the outputs of its dynamic quantization.
+
+        Args:
+            function: the function to quantize
+            input: the inputs given to the function
+            tolerance: the largest acceptable error, relative to the largest absolute
+                value of each output
+            nodes: the nodes to quantize, all the MatMul and Gemm ops by default
+
+        Returns:
+            the quantized model
+        """
+        model = function.function_ir.to_model_proto()
+        feeds = {
+            vi.name: np.array(t) if isinstance(t, numbers.Number) else t
+            for vi, t in zip(model.graph.input, input)
+        }
+        expected = self._run_model(model, feeds)
+        quantization.quantize_dynamic(model, nodes)
+        onnx.checker.check_model(model)
+        actual = self._run_model(model, feeds)
+        for a, e in zip(actual, expected):
+            np.testing.assert_allclose(a, e, rtol=0, atol=tolerance * np.abs(e).max())
+        return model
+
     def run_onnx_test(
         self,
         function: onnxscript.OnnxFunction,
@@ -2,9 +2,12 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 # --------------------------------------------------------------------------
+from __future__ import annotations
 
 import unittest
+from typing import Any
 
+import onnxruntime
 from onnx import FunctionProto, GraphProto, ModelProto, parser
 
 from onnxscript import OnnxFunction
@@ -29,6 +32,19 @@ def graph_proto(g):
     raise TypeError(f"Cannot convert {type(g)} to ModelProto")
 
 
+def run_model(model: ModelProto, **inputs: Any) -> list[Any]:
+    """Runs a model with onnxruntime on the CPU and returns its outputs."""
+    session = onnxruntime.InferenceSession(
+        model.SerializeToString(), providers=["CPUExecutionProvider"]
+    )
+    return session.run(None, inputs)
+
+
+def op_types(model: ModelProto) -> list[str]:
+    """Returns the op types of the nodes of the main graph of a model."""
+    return [n.op_type for n in model.graph.node]
+
+
 def to_function_or_graph(testcase):
     if isinstance(testcase, FunctionProto):
         return testcase
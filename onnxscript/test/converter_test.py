@@ -11,6 +11,7 @@ import textwrap
 import types
 import unittest
 import warnings
+from typing import List
 
 import numpy as np
 import onnx
@@ -34,6 +35,8 @@ from onnxscript.test.common import onnx_script_test_case, testutils
 TEST_INPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
 TEST_OUTPUT_DIR = os.path.join(TEST_INPUT_DIR, "testoutputs")
 
+USE_ABS = True
+
 
 class TestConverter(testutils.TestBase):
     def validate(self, script):
@@ -466,6 +469,9 @@ class TestConverter(testutils.TestBase):
         check_function(x, "getitem_index_int0", [0, 1, 2], eager=eager)
         check_function(x, "getitem_rev", x[:0:-1].tolist())
         check_function(x, "getitem_rev0", x[0, :0:-1].tolist())
+        check_function(x, "getitem_i_slice_right_step", x[1::-1].tolist())
+        check_function(x, "getitem_reverse", x[::-1].tolist())
+        check_function(x, "getitem_last_column", x[1:, -1].tolist())
 
     @unittest.skipIf(
         sys.version_info[:2] < (3, 9), reason="Notation [...] not supported in python 3.8."
@@ -535,11 +541,181 @@ class TestConverter(testutils.TestBase):
         ast_name = "_ast" if sys.version_info[:2] < (3, 9) else "ast"
         self.check_failure(f1, f"Left term must be a tuple not <class '{ast_name}.Name'>")
 
-        def f2(A: FLOAT[...]) -> FLOAT[...]:
-            return A[::-1]
+    def test_static_slice_lowering(self):
+        @script()
+        def static_slice(A: FLOAT[None, None]) -> FLOAT[None, None]:
+            return op.Identity(A[:2, 1:-1])
 
-        ast_name = "_ast" if sys.version_info[:2] < (3, 9) else "ast"
-        self.check_failure(f2, "`?::-1` cannot be expressed with ONNX")
+        @script()
+        def mixed_slice(A: FLOAT[None, None], i: INT64) -> FLOAT[None, None]:
+            return op.Identity(A[i:, ::-1])
+
+        op_types = [n.op_type for n in static_slice.to_function_proto().node]
+        self.assertEqual(op_types, ["Constant", "Constant", "Slice", "Identity"])
+        op_types = [n.op_type for n in mixed_slice.to_function_proto().node]
+        self.assertNotIn("Shape", op_types)
+        self.assertEqual(op_types.count("Concat"), 1)
+
+        x = np.arange(12, dtype=np.float32).reshape((3, 4))
+        self.check_run(static_slice, [x], x[:2, 1:-1])
+        self.check_run(mixed_slice, [x, np.array(1, dtype=np.int64)], x[1:, ::-1])
+
+    def test_static_type_propagation(self):
+        @script()
+        def accumulate(A: FLOAT[2, 3], n: INT64) -> FLOAT[2, 3]:
+            B = op.Transpose(A * 2)
+            C = op.Transpose(B)
+            for i in range(n):
+                C = C + 1
+            return C
+
+        model = accumulate.to_model_proto()
+        onnx.checker.check_model(model, full_check=True)
+        value_info = {v.name: v.type for v in model.graph.value_info}
+        self.assertEqual(value_info["B"], FLOAT[3, 2].to_type_proto())
+        self.assertEqual(value_info["C"], FLOAT[2, 3].to_type_proto())
+        op_types = [n.op_type for n in model.graph.node]
+        self.assertNotIn("CastLike", op_types)
+        # loop-state variables get the element type of their initial value
+        loop = next(n for n in model.graph.node if n.op_type == "Loop")
+        body = loop.attribute[0].g
+        self.assertEqual(body.input[2].type.tensor_type.elem_type, TensorProto.FLOAT)
+        self.assertNotIn("CastLike", [n.op_type for n in body.node])
+
+        x = np.arange(6, dtype=np.float32).reshape((2, 3))
+        self.check_run(accumulate, [x, np.array(3, dtype=np.int64)], x * 2 + 3)
+
+    def test_static_if_elimination(self):
+        @script()
+        def static_if(A: FLOAT[None]) -> FLOAT[None]:
+            if USE_ABS and 1 > 0:
+                B = op.Abs(A)
+            else:
+                B = op.Neg(A)
+            return B
+
+        op_types = [n.op_type for n in static_if.to_function_proto().node]
+        self.assertEqual(op_types, ["Abs"])
+        x = np.array([-1.0, 2.0], dtype=np.float32)
+        self.check_run(static_if, [x], np.abs(x))
+
+    def test_unbound_name_in_condition_is_reported(self):
+        def unbound_if(A: FLOAT[None]) -> FLOAT[None]:
+            if not undefined_flag:  # noqa: F821
+                B = op.Abs(A)
+            else:
+                B = op.Neg(A)
+            return B
+
+        with self.assertRaisesRegex(ValueError, "Unbound name: undefined_flag"):
+            script()(unbound_if)
+
+    def test_attribute_specialization(self):
+        @script()
+        def add(X, Y, alpha: float = 1.0):
+            if alpha != 1:
+                Y = op.Mul(Y, alpha)
+            return op.Add(X, Y)
+
+        self.assertIn("If", [n.op_type for n in add.to_function_proto().node])
+
+        add_1 = add.specialize(alpha=1)
+        self.assertEqual(add_1.name, "add_alpha_1")
+        proto = add_1.to_function_proto()
+        self.assertEqual([n.op_type for n in proto.node], ["Add"])
+        self.assertEqual(list(proto.attribute), [])
+
+        add_2 = add.specialize(alpha=2.5)
+        self.assertEqual(add_2.name, "add_alpha_2_5")
+        op_types = [n.op_type for n in add_2.to_function_proto().node]
+        self.assertNotIn("If", op_types)
+        self.assertIn("Mul", op_types)
+
+        # In eager mode as well, the attributes are bound to the given values.
+        x = np.array([1.0, 2.0], dtype=np.float32)
+        np.testing.assert_equal(add_1(x, x), x + x)
+        np.testing.assert_equal(add_2(x, x), x + x * 2.5)
+
+        with self.assertRaises(ValueError):
+            add.specialize(beta=1.0)
+
+    def test_specialization_is_folded_and_cached(self):
+        @script()
+        def scale(X, alpha: float = 1.0, beta: float = 0.0):
+            factor = op.Add(op.Constant(value_float=alpha), op.Constant(value_float=beta))
+            return op.Mul(X, op.CastLike(factor, X))
+
+        scale_3 = scale.specialize(alpha=2.0, beta=1.0)
+        self.assertIs(scale.specialize(beta=1.0, alpha=2.0), scale_3)
+        self.assertEqual(
+            [n.op_type for n in scale_3.to_function_proto().node],
+            ["Constant", "CastLike", "Mul"],
+        )
+        model = scale_3.to_model_proto(io_types=FLOAT[None])
+        session = onnxruntime.InferenceSession(model.SerializeToString())
+        x = np.array([1.0, -2.0], dtype=np.float32)
+        np.testing.assert_equal(session.run(None, {"X": x})[0], x * 3)
+        np.testing.assert_equal(scale_3(x), x * 3)
+        # The attributes bound by a first specialization are kept by the next one.
+        scale_4 = scale.specialize(beta=1.0).specialize(alpha=3.0)
+        np.testing.assert_equal(scale_4(x), x * 4)
+        self.assertEqual(
+            [n.op_type for n in scale_4.to_function_proto().node],
+            ["Constant", "CastLike", "Mul"],
+        )
+
+    def test_rank_specialization(self):
+        @script()
+        def flatten_unbatched(X: FLOAT[...]) -> FLOAT[...]:
+            if op.Size(op.Shape(X)) == 1:
+                result = op.Unsqueeze(X, op.Constant(value_ints=[0]))
+            else:
+                result = op.Flatten(X)
+            return result
+
+        vector = flatten_unbatched.specialize(input_ranks={"X": 1})
+        self.assertEqual(vector.name, "flatten_unbatched_X_rank1")
+        self.assertEqual(
+            [n.op_type for n in vector.to_function_proto().node], ["Constant", "Unsqueeze"]
+        )
+        matrix = flatten_unbatched.specialize(input_ranks={"X": 3})
+        self.assertEqual([n.op_type for n in matrix.to_function_proto().node], ["Flatten"])
+        self.assertIs(flatten_unbatched.specialize(input_ranks={"X": 3}), matrix)
+
+        x = np.arange(24, dtype=np.float32).reshape((2, 3, 4))
+        self.check_run(matrix, [x], x.reshape((2, 12)))
+        with self.assertRaises(ValueError):
+            flatten_unbatched.specialize(input_ranks={"Y": 1})
+
+    def test_respecialization_keeps_input_ranks(self):
+        @script()
+        def flatten_scaled(X: FLOAT[...], alpha: float = 1.0) -> FLOAT[...]:
+            if op.Size(op.Shape(X)) == 1:
+                result = op.Unsqueeze(X, op.Constant(value_ints=[0]))
+            else:
+                result = op.Flatten(X)
+            return op.Mul(result, op.CastLike(op.Constant(value_float=alpha), result))
+
+        scaled = flatten_scaled.specialize(input_ranks={"X": 3}).specialize(alpha=2.0)
+        self.assertEqual(scaled.name, "flatten_scaled_alpha_2_0_X_rank3")
+        self.assertEqual(
+            [n.op_type for n in scaled.to_function_proto().node],
+            ["Flatten", "Constant", "CastLike", "Mul"],
+        )
+        x = np.arange(24, dtype=np.float32).reshape((2, 3, 4))
+        self.check_run(scaled, [x], x.reshape((2, 12)) * 2)
+
+    def test_specialization_with_array_attribute(self):
+        @script()
+        def weigh(X, weights: List[float]):
+            return op.Mul(X, op.CastLike(op.Constant(value_floats=weights), X))
+
+        weights = np.array([2.0, 3.0], dtype=np.float32)
+        weighed = weigh.specialize(weights=weights)
+        self.assertIs(weigh.specialize(weights=weights.copy()), weighed)
+        self.assertIsNot(weigh.specialize(weights=weights.astype(np.float64)), weighed)
+        x = np.ones(2, dtype=np.float32)
+        np.testing.assert_equal(weighed(x), weights)
 
     def check_run(self, onnxfn, inputs, expected_output):
         # Test by converting to model and running with ORT
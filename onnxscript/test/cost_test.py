@@ -0,0 +1,114 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import unittest
+
+import numpy as np
+from onnx import numpy_helper
+
+from onnxscript import cost, script
+from onnxscript.onnx_opset import opset17 as op
+from onnxscript.onnx_types import BOOL, FLOAT
+
+
+@script()
+def dense(x: FLOAT["N", 8], w: FLOAT[8, 4], b: FLOAT[4]) -> FLOAT["N", 4]:  # noqa: F821
+    return op.Softmax(op.Relu(op.Gemm(x, w, b)))
+
+
+@script()
+def power(x: FLOAT[4, 4]) -> FLOAT[4, 4]:
+    y = x
+    for i in range(3):
+        y = op.MatMul(y, x)
+    return y
+
+
+@script()
+def grow(x: FLOAT[4]) -> FLOAT[None]:
+    y = x
+    for i in range(3):
+        y = op.Concat(y, x, axis=0)
+    return y
+
+
+@script()
+def branches(x: FLOAT[4, 4], flag: BOOL) -> FLOAT[4, 4]:
+    if flag:
+        y = op.MatMul(x, x)
+    else:
+        y = op.Neg(x)
+    return y
+
+
+@script()
+def double(x: FLOAT[4, 4]) -> FLOAT[4, 4]:
+    return op.Add(x, x)
+
+
+@script()
+def call(x: FLOAT[4, 4]) -> FLOAT[4, 4]:
+    return double(op.Relu(x))
+
+
+class TestEstimate(unittest.TestCase):
+    def test_costs_of_nodes(self):
+        report = cost.estimate(dense, [FLOAT[2, 8]])
+        self.assertEqual([n.op_type for n in report.nodes], ["Gemm", "Softmax", "Relu"])
+        gemm = report.nodes[0]
+        # 2 * 8 operations per element of the 2 x 4 product, plus the bias.
+        self.assertEqual(gemm.flops, 2 * 8 * 8 + 8)
+        self.assertEqual(gemm.bytes_read, 4 * (16 + 32 + 4))
+        self.assertEqual(gemm.bytes_written, 4 * 8)
+        self.assertAlmostEqual(gemm.arithmetic_intensity, 136 / 240)
+        self.assertEqual(report.flops, 136 + 5 * 8 + 8)
+        self.assertTrue(report.exact)
+        self.assertIn("total", str(report))
+
+    def test_unknown_shapes_give_lower_bound(self):
+        report = cost.estimate(dense)
+        self.assertFalse(report.exact)
+        self.assertEqual(report.flops, 0)
+        self.assertIn("lower bound", str(report))
+
+    def test_loop_body_is_counted_for_each_iteration(self):
+        report = cost.estimate(power)
+        matmul = report.nodes[0]
+        self.assertEqual(matmul.op_type, "MatMul")
+        self.assertEqual(matmul.name.split("/")[0], "y_1")
+        self.assertEqual(matmul.flops, 3 * 2 * 16 * 4)
+        self.assertTrue(matmul.exact)
+
+    def test_loop_running_zero_times(self):
+        for trip_count in [0, -2]:
+            model = power.to_model_proto()
+            bound = model.graph.node[0]
+            self.assertEqual(bound.output, ["loop_bound"])
+            bound.attribute[0].t.CopyFrom(
+                numpy_helper.from_array(np.array(trip_count, dtype=np.int64))
+            )
+            report = cost.estimate(model)
+            matmul = next(n for n in report.nodes if n.op_type == "MatMul")
+            self.assertEqual(matmul.flops, 0)
+            self.assertEqual(matmul.bytes_read, 0)
+            self.assertTrue(matmul.exact)
+
+    def test_loop_state_changing_shape(self):
+        report = cost.estimate(grow)
+        concat = next(n for n in report.nodes if n.op_type == "Concat")
+        self.assertFalse(concat.exact)
+
+    def test_most_expensive_branch_is_counted(self):
+        report = cost.estimate(branches)
+        self.assertEqual([n.op_type for n in report.nodes if "/" in n.name], ["MatMul"])
+        self.assertEqual(report.flops, 2 * 16 * 4)
+
+    def test_called_functions_are_included(self):
+        report = cost.estimate(call)
+        self.assertEqual(sorted(n.op_type for n in report.nodes), ["Add", "Relu"])
+        self.assertEqual(report.flops, 32)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,11 @@
 import unittest
+from unittest import mock
 
 import numpy as np
 
-from onnxscript import evaluator, graph, script
+from onnxscript import evaluator, graph, irbuilder, script
 from onnxscript.onnx_opset import opset17 as op
-from onnxscript.onnx_types import FLOAT
+from onnxscript.onnx_types import BOOL, FLOAT, INT64
 
 
 class EvaluatorTest(unittest.TestCase):
@@ -35,6 +36,174 @@ class EvaluatorTest(unittest.TestCase):
         output = seq_map[evaluator.ort_evaluator](x)
         np.testing.assert_equal(output, expected)
 
+    def test_sequence_map_is_vectorized(self):
+        @script()
+        def seq_map(x: FLOAT["N"], s: FLOAT["M"]):  # noqa: F821
+            seq1 = op.SequenceConstruct(x, x + 1, x + 2)
+
+            @graph()
+            def body(y: FLOAT["N"], z: FLOAT["M"]):  # noqa: F821
+                return op.Mul(y, y) + op.ReduceSum(s), op.Concat(y, z, axis=0)
+
+            squares, concats = op.SequenceMap(seq1, s, body=body)
+            return squares, concats
+
+        x = np.array([0.0, 1.0], dtype=np.float32)
+        s = np.array([1.0, 2.0, 3.0], dtype=np.float32)
+        cache = evaluator._cache_vectorized_bodies  # pylint: disable=protected-access
+        count = len(cache)
+        squares, concats = seq_map[evaluator.ort_mixed_evaluator](x, s)
+        self.assertEqual(len(cache), count + 1)
+        np.testing.assert_allclose(squares, [t * t + 6 for t in [x, x + 1, x + 2]])
+        np.testing.assert_allclose(
+            concats, [np.concatenate([t, s]) for t in [x, x + 1, x + 2]]
+        )
+        # The vectorized body is reused.
+        seq_map[evaluator.ort_mixed_evaluator](x + 1, s)
+        self.assertEqual(len(cache), count + 1)
+
+    def test_sequence_map_of_ragged_sequence(self):
+        @script()
+        def seq_map(x: FLOAT["N"]):  # noqa: F821
+            seq1 = op.SequenceConstruct(x, op.Concat(x, x, axis=0))
+
+            @graph()
+            def body(y: FLOAT["N"]) -> FLOAT["N"]:  # noqa: F821
+                return op.Neg(y)
+
+            return op.SequenceMap(seq1, body=body)
+
+        x = np.array([0.0, 1.0], dtype=np.float32)
+        output = seq_map[evaluator.ort_mixed_evaluator](x)
+        self.assertEqual(len(output), 2)
+        np.testing.assert_equal(output[0], -x)
+        np.testing.assert_equal(output[1], -np.concatenate([x, x]))
+
+    def test_control_flow_bodies_are_compiled_once(self):
+        @script()
+        def loop(x: FLOAT["N"], n: INT64, s: FLOAT["N"]):  # noqa: F821
+            @graph()
+            def body(i: INT64, cond: BOOL, y: FLOAT["N"]):  # noqa: F821
+                z = op.Add(y, s)
+                return op.Identity(cond), z, op.ReduceSum(z, keepdims=0)
+
+            return op.Loop(n, None, x, body=body)
+
+        @script()
+        def scan(x: FLOAT["N"], rows: FLOAT["N", "M"]):  # noqa: F821
+            @graph()
+            def body(total: FLOAT["N"], row: FLOAT["N"]):  # noqa: F821
+                t = op.Add(total, row)
+                return t, op.Identity(t)
+
+            return op.Scan(x, rows, body=body, num_scan_inputs=1, scan_input_axes=[1])
+
+        @script()
+        def branches(x: FLOAT["N"], flag: BOOL):  # noqa: F821
+            @graph()
+            def then_branch():
+                return op.Neg(x)
+
+            @graph()
+            def else_branch():
+                return op.Relu(x)
+
+            return op.If(flag, then_branch=then_branch, else_branch=else_branch)
+
+        x = np.array([-1.0, 0.0, 1.0], dtype=np.float32)
+        rows = np.arange(6, dtype=np.float32).reshape(3, 2)
+        three = np.array(3, dtype=np.int64)
+        cache = evaluator._cache_body_sessions  # pylint: disable=protected-access
+        count = len(cache)
+        for _ in range(2):
+            for flag in [True, False]:
+                np.testing.assert_equal(
+                    branches[evaluator.ort_mixed_evaluator](x, np.array(flag)),
+                    branches[evaluator.ort_evaluator](x, np.array(flag)),
+                )
+            np.testing.assert_equal(
+                loop[evaluator.ort_mixed_evaluator](x, three, x),
+                loop[evaluator.ort_evaluator](x, three, x),
+            )
+            np.testing.assert_equal(
+                scan[evaluator.ort_mixed_evaluator](x, rows),
+                scan[evaluator.ort_evaluator](x, rows),
+            )
+            # One session for each branch and each body.
+            self.assertEqual(len(cache), count + 4)
+
+    def test_control_flow_bodies_run_zero_times(self):
+        @script()
+        def loop(x: FLOAT[3], n: INT64):
+            @graph()
+            def body(i: INT64, cond: BOOL, y: FLOAT[3]) -> (BOOL, FLOAT[3], INT64[3]):
+                z = op.Add(y, y)
+                return op.Identity(cond), z, op.Cast(z, to=7)
+
+            return op.Loop(n, None, x, body=body)
+
+        @script()
+        def scan(x: FLOAT[3], rows: FLOAT[3, "M"]):  # noqa: F821
+            @graph()
+            def body(total: FLOAT[3], row: FLOAT[3]) -> (FLOAT[3], INT64[3]):
+                t = op.Add(total, row)
+                return t, op.Cast(t, to=7)
+
+            return op.Scan(
+                x,
+                rows,
+                body=body,
+                num_scan_inputs=1,
+                scan_input_axes=[1],
+                scan_output_axes=[1],
+            )
+
+        x = np.array([-1.0, 0.0, 1.0], dtype=np.float32)
+        zero = np.array(0, dtype=np.int64)
+        # onnxruntime does not support scanning an empty axis.
+        rows = np.zeros((3, 0), dtype=np.float32)
+        cases = [
+            (loop, (x, zero), loop[evaluator.ort_evaluator](x, zero)),
+            (scan, (x, rows), (x, np.zeros((3, 0), dtype=np.int64))),
+        ]
+        for function, args, expected in cases:
+            outputs = function[evaluator.ort_mixed_evaluator](*args)
+            for output, expected_output in zip(outputs, expected):
+                self.assertEqual(output.dtype, expected_output.dtype)
+                self.assertEqual(output.shape, expected_output.shape)
+                np.testing.assert_equal(output, expected_output)
+
+    def test_graph_attributes_are_converted_once(self):
+        @script()
+        def seq_map(x: FLOAT["N"]):  # noqa: F821
+            seq1 = op.SequenceConstruct(x, x + 1)
+
+            @graph()
+            def shift(y: FLOAT["N"]) -> FLOAT["N"]:  # noqa: F821
+                return op.Add(y, x)
+
+            return op.SequenceMap(seq1, body=shift)
+
+        x = np.array([0.0, 1.0], dtype=np.float32)
+        body = seq_map.function_ir.nested_functions["shift"]
+        with mock.patch.object(
+            irbuilder.IRFunction,
+            "to_graph_and_functions",
+            autospec=True,
+            side_effect=irbuilder.IRFunction.to_graph_and_functions,
+        ) as convert:
+            for i in range(3):
+                # The value of the outer-scope variable is bound at each call.
+                output = seq_map[evaluator.ort_evaluator](x + i)
+                np.testing.assert_equal(output, [2 * x + 2 * i, 2 * x + 2 * i + 1])
+            # The graph was converted when seq_map was scripted.
+            self.assertEqual(convert.call_count, 0)
+            graph_proto = body.to_graph_proto()
+            self.assertIs(body.to_graph_proto(), graph_proto)
+            # Modifying the function discards the converted graph.
+            body.stmts = list(body.stmts)
+            self.assertIsNot(body.to_graph_proto(), graph_proto)
+
 
 if __name__ == "__main__":
     unittest.main()
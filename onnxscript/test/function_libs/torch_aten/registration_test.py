@@ -0,0 +1,50 @@
+"""Test the dispatch of aten functions to their rank-specialized variants."""
+from __future__ import annotations
+
+import unittest
+
+from onnxscript.function_libs.torch_aten import registration
+from onnxscript.onnx_opset import opset18 as op
+from onnxscript.onnx_types import FLOAT
+
+
+class TestRegistryDispatch(unittest.TestCase):
+    def setUp(self):
+        self.registry = registration.Registry()
+
+        @registration.torch_op("aten::pool", registry=self.registry)
+        def aten_pool(self):
+            if op.Size(op.Shape(self)) == 2:
+                # Unbatched case
+                self = op.Unsqueeze(self, op.Constant(value_ints=[0]))
+                pooled = op.GlobalAveragePool(self)
+                result = op.Squeeze(pooled, op.Constant(value_ints=[0]))
+            else:
+                result = op.GlobalAveragePool(self)
+            return result
+
+        @registration.torch_op("aten::traced", registry=self.registry, trace_only=True)
+        def aten_traced(self):
+            return op.Identity(self)
+
+    def test_dispatch_compiles_rank_specialized_variant(self):
+        pool = self.registry["aten::pool"]
+        batched = pool.dispatch({"self": FLOAT[None, 3, 8]})
+        self.assertEqual(batched.name, "aten_pool_self_rank3")
+        self.assertEqual(
+            [n.op_type for n in batched.to_function_proto().node], ["GlobalAveragePool"]
+        )
+        unbatched = pool.dispatch({"self": 2})
+        self.assertNotIn("If", [n.op_type for n in unbatched.to_function_proto().node])
+        self.assertIs(pool.dispatch({"self": FLOAT[3, 8]}), unbatched)
+
+    def test_dispatch_without_static_rank_returns_default(self):
+        pool = self.registry["aten::pool"]
+        self.assertIs(pool.dispatch({"self": FLOAT[...]}), pool.default)
+        self.assertIs(pool.dispatch({}), pool.default)
+        traced = self.registry["aten::traced"]
+        self.assertIs(traced.dispatch({"self": 2}), traced.default)
+
+
+if __name__ == "__main__":
+    unittest.main()
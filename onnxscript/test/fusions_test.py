@@ -0,0 +1,145 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import unittest
+
+import numpy as np
+import onnx
+
+from onnxscript import fusions, script
+from onnxscript.onnx_opset import opset15, opset17, opset18
+from onnxscript.onnx_types import FLOAT
+from onnxscript.test.common import testutils
+
+
+@script()
+def layer_norm15(x: FLOAT[2, 4], scale: FLOAT[4], bias: FLOAT[4]) -> FLOAT[2, 4]:
+    mean = opset15.ReduceMean(x, axes=[-1])
+    deviation = x - mean
+    variance = opset15.ReduceMean(deviation * deviation, axes=[-1])
+    return deviation / opset15.Sqrt(variance + 1e-3) * scale + bias
+
+
+@script()
+def layer_norm17(x: FLOAT[2, 4], scale: FLOAT[4], bias: FLOAT[4]) -> FLOAT[2, 4]:
+    mean = opset17.ReduceMean(x, axes=[-1])
+    deviation = x - mean
+    variance = opset17.ReduceMean(deviation * deviation, axes=[-1])
+    return deviation / opset17.Sqrt(variance + 1e-3) * scale + bias
+
+
+@script()
+def layer_norm18(x: FLOAT[2, 4], scale: FLOAT[4], bias: FLOAT[4]) -> FLOAT[2, 4]:
+    axes = opset18.Constant(value_ints=[-1])
+    mean = opset18.ReduceMean(x, axes)
+    deviation = x - mean
+    variance = opset18.ReduceMean(deviation * deviation, axes)
+    return deviation / opset18.Sqrt(variance + 1e-3) * scale + bias
+
+
+@script()
+def layer_norm_scale3d(
+    x: FLOAT[2, 4], scale: FLOAT[2, 1, 4], bias: FLOAT[4]
+) -> FLOAT[2, 2, 4]:
+    mean = opset17.ReduceMean(x, axes=[-1])
+    deviation = x - mean
+    variance = opset17.ReduceMean(deviation * deviation, axes=[-1])
+    return deviation / opset17.Sqrt(variance + 1e-3) * scale + bias
+
+
+@script()
+def layer_norm_scale2d(x: FLOAT[2, 4], scale: FLOAT[1, 4], bias: FLOAT[4]) -> FLOAT[2, 4]:
+    mean = opset17.ReduceMean(x, axes=[-1])
+    deviation = x - mean
+    variance = opset17.ReduceMean(deviation * deviation, axes=[-1])
+    return deviation / opset17.Sqrt(variance + 1e-3) * scale + bias
+
+
+@script()
+def mish17(x: FLOAT[4]) -> FLOAT[4]:
+    return x * opset17.Tanh(opset17.Log(opset17.Exp(x) + 1.0))
+
+
+@script()
+def mish18(x: FLOAT[4]) -> FLOAT[4]:
+    return x * opset18.Tanh(opset18.Log(opset18.Exp(x) + 1.0))
+
+
+class TestFuseOps(unittest.TestCase):
+    def setUp(self):
+        self.layer_norm_inputs = {
+            "x": np.random.rand(2, 4).astype(np.float32),
+            "scale": np.random.rand(4).astype(np.float32),
+            "bias": np.random.rand(4).astype(np.float32),
+        }
+
+    def test_layer_normalization(self):
+        for function in [layer_norm17, layer_norm18]:
+            with self.subTest(function=function.name):
+                expected = testutils.run_model(
+                    function.to_model_proto(), **self.layer_norm_inputs
+                )
+                model = function.to_model_proto(fuse_ops=True)
+                onnx.checker.check_model(model)
+                self.assertEqual(testutils.op_types(model), ["LayerNormalization"])
+                epsilon = onnx.helper.get_attribute_value(model.graph.node[0].attribute[1])
+                self.assertAlmostEqual(epsilon, 1e-3)
+                np.testing.assert_allclose(
+                    testutils.run_model(model, **self.layer_norm_inputs),
+                    expected,
+                    rtol=1e-5,
+                    atol=1e-6,
+                )
+
+    def test_layer_normalization_with_broadcast_scale(self):
+        inputs = dict(self.layer_norm_inputs, scale=self.layer_norm_inputs["scale"][None])
+        model = layer_norm_scale2d.to_model_proto(fuse_ops=True)
+        self.assertEqual(testutils.op_types(model), ["LayerNormalization"])
+        np.testing.assert_allclose(
+            testutils.run_model(model, **inputs),
+            testutils.run_model(layer_norm_scale2d.to_model_proto(), **inputs),
+            rtol=1e-5,
+            atol=1e-6,
+        )
+
+    def test_layer_normalization_is_not_fused_for_other_scale_shapes(self):
+        # LayerNormalization would require the scale to have 4 elements, not 8.
+        model = layer_norm_scale3d.to_model_proto(fuse_ops=True)
+        self.assertNotIn("LayerNormalization", testutils.op_types(model))
+        inputs = dict(self.layer_norm_inputs, scale=np.random.rand(2, 1, 4).astype(np.float32))
+        self.assertEqual(testutils.run_model(model, **inputs)[0].shape, (2, 2, 4))
+        # Without the types of the inputs, the shape of the scale is unknown.
+        model = layer_norm17.to_model_proto()
+        for x in model.graph.input:
+            x.type.tensor_type.ClearField("shape")
+        self.assertEqual(fusions.fuse_ops(model), 0)
+
+    def test_decomposition_is_kept_for_older_opsets(self):
+        model = layer_norm15.to_model_proto(fuse_ops=True)
+        self.assertNotIn("LayerNormalization", testutils.op_types(model))
+        self.assertEqual(fusions.fuse_ops(layer_norm17.to_model_proto(), opset_version=16), 0)
+
+    def test_mish(self):
+        x = np.array([-1.0, 0.0, 1.0, 2.0], dtype=np.float32)
+        model = mish18.to_model_proto(fuse_ops=True)
+        onnx.checker.check_model(model)
+        self.assertEqual(testutils.op_types(model), ["Mish"])
+        np.testing.assert_allclose(
+            testutils.run_model(model, x=x),
+            testutils.run_model(mish18.to_model_proto(), x=x),
+            rtol=1e-6,
+        )
+        # Mish is not available in opset 17, only its Softplus part is fused.
+        model = mish17.to_model_proto(fuse_ops=True)
+        self.assertEqual(testutils.op_types(model), ["Softplus", "Tanh", "Mul"])
+
+    def test_fuse_function(self):
+        function_ir = script()(layer_norm17.function).function_ir
+        self.assertEqual(fusions.fuse_ops(function_ir), 1)
+        self.assertEqual([s.callee.opname for s in function_ir.stmts], ["LayerNormalization"])
+        self.assertEqual(function_ir.stmts[0].callee.opset.version, 17)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,278 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import threading
+import unittest
+import weakref
+
+import numpy as np
+import onnx
+from onnx import helper
+
+from onnxscript import evaluator, graph, interpreter, script, tensor
+from onnxscript.onnx_opset import opset17 as op
+from onnxscript.onnx_types import BOOL, FLOAT, INT64
+
+
+@script()
+def scale(x, alpha: float = 2.0):
+    return op.Mul(x, op.Constant(value_float=alpha))
+
+
+@script()
+def wide(x: FLOAT[None]) -> FLOAT[None]:
+    a = op.Relu(x)
+    b = op.Sigmoid(x)
+    return op.Add(a, b)
+
+
+@script()
+def control_flow(x: FLOAT[None], flag: BOOL) -> FLOAT[None]:
+    y = op.Sigmoid(x) * x
+    if flag:
+        z = scale(y, alpha=3.0)
+    else:
+        z = op.Neg(y)
+    for i in range(3):
+        z = z + op.CastLike(i, z)
+    return z
+
+
+@script()
+def seq_map(x: FLOAT[None]):
+    seq = op.SequenceConstruct(x, x + 1, x + 2)
+
+    @graph()
+    def shift(y: FLOAT[None]) -> FLOAT[None]:
+        return y + x
+
+    return op.SequenceMap(seq, body=shift)
+
+
+@script()
+def chain(x: FLOAT[None]) -> FLOAT[None]:
+    a = op.Relu(x)
+    b = op.Sigmoid(a)
+    c = op.Tanh(b * x)
+    return op.Softsign(c)
+
+
+@script()
+def typed_loop(x: FLOAT[3], n: INT64):
+    @graph()
+    def body(i: INT64, cond: BOOL, y: FLOAT[3]) -> (BOOL, FLOAT[3], INT64[3]):
+        z = op.Add(y, y)
+        return op.Identity(cond), z, op.Cast(z, to=7)
+
+    y, ys = op.Loop(n, None, x, body=body)
+    return y, ys
+
+
+@script()
+def typed_scan(x: FLOAT[3], rows: FLOAT[3, "M"]):  # noqa: F821
+    @graph()
+    def body(total: FLOAT[3], row: FLOAT[3]) -> (FLOAT[3], INT64[3]):
+        t = op.Add(total, row)
+        return t, op.Cast(t, to=7)
+
+    total, totals = op.Scan(
+        x, rows, body=body, num_scan_inputs=1, scan_input_axes=[1], scan_output_axes=[1]
+    )
+    return total, totals
+
+
+class _BarrierEvaluator(evaluator.ORTEvaluator):
+    """Evaluates ops only when two of them are evaluated at the same time."""
+
+    def __init__(self):
+        super().__init__()
+        self.barrier = threading.Barrier(2, timeout=10)
+
+    def _eval(self, schema, inputs, attributes, closure):
+        if schema.name in ("Relu", "Sigmoid"):
+            self.barrier.wait()
+        return super()._eval(schema, inputs, attributes, closure)
+
+
+class _TracingEvaluator(evaluator.ORTEvaluator):
+    """Records whether the output of Relu is still alive when Softsign is evaluated."""
+
+    def __init__(self):
+        super().__init__()
+        self.relu_output = None
+        self.relu_output_alive = None
+
+    def _eval(self, schema, inputs, attributes, closure):
+        outputs = super()._eval(schema, inputs, attributes, closure)
+        if schema.name == "Relu":
+            self.relu_output = weakref.ref(outputs[0])
+        elif schema.name == "Softsign":
+            self.relu_output_alive = self.relu_output() is not None
+        return outputs
+
+
+class TestInterpreter(unittest.TestCase):
+    def setUp(self):
+        self.x = np.random.randn(5).astype(np.float32)
+
+    def test_same_results_as_eager_mode(self):
+        for flag in [True, False]:
+            expected = control_flow(self.x, np.array(flag))
+            np.testing.assert_allclose(
+                interpreter.run(control_flow, self.x, np.array(flag)), expected, rtol=1e-6
+            )
+            np.testing.assert_allclose(
+                interpreter.run(control_flow.function_ir, self.x, np.array(flag)),
+                expected,
+                rtol=1e-6,
+            )
+
+    def test_independent_nodes_run_concurrently(self):
+        with interpreter.Interpreter(max_workers=2, evaluator=_BarrierEvaluator()) as runner:
+            result = runner.run(wide, self.x)
+        np.testing.assert_allclose(
+            result, np.maximum(self.x, 0) + 1 / (1 + np.exp(-self.x)), rtol=1e-6
+        )
+
+    def test_single_worker(self):
+        with interpreter.Interpreter(max_workers=1) as runner:
+            for _ in range(2):
+                result = runner.run(control_flow, self.x, np.array(True))
+                np.testing.assert_allclose(result, control_flow(self.x, np.array(True)))
+
+    def test_attributes(self):
+        np.testing.assert_allclose(interpreter.run(scale, self.x), self.x * 2)
+        np.testing.assert_allclose(interpreter.run(scale, self.x, alpha=0.5), self.x * 0.5)
+
+    def test_tensors_in_tensors_out(self):
+        result = interpreter.run(scale, tensor.Tensor(self.x))
+        self.assertIsInstance(result, tensor.Tensor)
+        np.testing.assert_allclose(result.value, self.x * 2)
+
+    def test_sequence_map_uses_outer_values(self):
+        result = interpreter.run(seq_map, self.x)
+        self.assertEqual(len(result), 3)
+        for i, value in enumerate(result):
+            np.testing.assert_allclose(value, 2 * self.x + i, rtol=1e-6)
+
+    def test_function_proto_calling_model_function(self):
+        model = control_flow.to_model_proto()
+        main = helper.make_function(
+            "this",
+            "main",
+            [x.name for x in model.graph.input],
+            [y.name for y in model.graph.output],
+            model.graph.node,
+            model.opset_import,
+        )
+        with interpreter.Interpreter(functions=model.functions) as runner:
+            result = runner.run(main, self.x, np.array(True))
+        np.testing.assert_allclose(result, control_flow(self.x, np.array(True)), rtol=1e-6)
+
+    def test_scan(self):
+        body = helper.make_graph(
+            [
+                helper.make_node("Add", ["total_in", "row"], ["total_out"]),
+                helper.make_node("Identity", ["total_out"], ["partial"]),
+            ],
+            "body",
+            [
+                helper.make_tensor_value_info("total_in", onnx.TensorProto.FLOAT, [2]),
+                helper.make_tensor_value_info("row", onnx.TensorProto.FLOAT, [2]),
+            ],
+            [
+                helper.make_tensor_value_info("total_out", onnx.TensorProto.FLOAT, [2]),
+                helper.make_tensor_value_info("partial", onnx.TensorProto.FLOAT, [2]),
+            ],
+        )
+        function = helper.make_function(
+            "this",
+            "cumsum",
+            ["init", "rows"],
+            ["total", "partials"],
+            [
+                helper.make_node(
+                    "Scan",
+                    ["init", "rows"],
+                    ["total", "partials"],
+                    body=body,
+                    num_scan_inputs=1,
+                    scan_input_axes=[1],
+                    scan_output_directions=[1],
+                )
+            ],
+            [helper.make_opsetid("", 17)],
+        )
+        rows = np.arange(6, dtype=np.float32).reshape(2, 3)
+        total, partials = interpreter.run(function, np.zeros(2, np.float32), rows)
+        np.testing.assert_allclose(total, rows.sum(axis=1))
+        np.testing.assert_allclose(partials, np.cumsum(rows.T, axis=0)[::-1])
+
+    def test_control_flow_bodies_run_zero_times(self):
+        x = np.array([-1.0, 0.0, 1.0], dtype=np.float32)
+        zero = np.array(0, dtype=np.int64)
+        # onnxruntime does not support scanning an empty axis.
+        rows = np.zeros((3, 0), dtype=np.float32)
+        cases = [
+            (typed_loop, (x, zero), typed_loop(x, zero)),
+            (typed_scan, (x, rows), (x, np.zeros((3, 0), dtype=np.int64))),
+        ]
+        for function, args, expected in cases:
+            outputs = interpreter.run(function, *args)
+            self.assertEqual(len(outputs), 2)
+            for output, expected_output in zip(outputs, expected):
+                self.assertEqual(output.dtype, expected_output.dtype)
+                self.assertEqual(output.shape, expected_output.shape)
+                np.testing.assert_equal(output, expected_output)
+
+    def test_dead_values_are_released(self):
+        tracer = _TracingEvaluator()
+        with interpreter.Interpreter(max_workers=1, evaluator=tracer) as runner:
+            runner.run(chain, self.x)
+        self.assertFalse(tracer.relu_output_alive)
+
+    def test_buffers_are_reused(self):
+        x = np.random.randn(1000).astype(np.float32)
+        with interpreter.Interpreter(max_workers=1, reuse_buffers=True) as runner:
+            acquired = []
+            acquire = runner._buffers.acquire  # pylint: disable=protected-access
+
+            def record(shape, dtype):
+                buffer = acquire(shape, dtype)
+                acquired.append(buffer is not None)
+                return buffer
+
+            runner._buffers.acquire = record  # pylint: disable=protected-access
+            for _ in range(2):
+                np.testing.assert_allclose(runner.run(chain, x), chain(x), atol=1e-6)
+            # Mul reuses the array of Relu, dead once Sigmoid has run, Tanh that of Sigmoid.
+            self.assertEqual(acquired, [True, True, True, True])
+            result = runner.run(control_flow, x, np.array(True))
+            np.testing.assert_allclose(result, control_flow(x, np.array(True)), atol=1e-5)
+
+    def test_modified_function_is_run_again(self):
+        function = script()(wide.function).function_ir
+        with interpreter.Interpreter() as runner:
+            expected = np.maximum(self.x, 0) + 1 / (1 + np.exp(-self.x))
+            np.testing.assert_allclose(runner.run(function, self.x), expected, rtol=1e-6)
+            function.outputs[0] = function.inputs[0]
+            # The function is modified in place: its new version must be recorded.
+            function.invalidate()
+            np.testing.assert_allclose(runner.run(function, self.x), self.x)
+
+    def test_missing_values_are_reported(self):
+        function = helper.make_function(
+            "this",
+            "broken",
+            ["x"],
+            ["y"],
+            [helper.make_node("Add", ["x", "undefined"], ["y"])],
+            [helper.make_opsetid("", 17)],
+        )
+        with self.assertRaisesRegex(ValueError, "undefined"):
+            interpreter.run(function, self.x)
+
+
+if __name__ == "__main__":
+    unittest.main()
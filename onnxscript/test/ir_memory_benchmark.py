@@ -0,0 +1,75 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+"""Measures the memory used by the IR of large generated scripts.
+
+Usage::
+
+    python -m onnxscript.test.ir_memory_benchmark [number of statements]
+
+A function with the given number of statements is translated, and the memory still
+allocated once it is translated is reported per statement, with and without the source
+information. The peak is the maximum memory allocated during the translation.
+"""
+from __future__ import annotations
+
+import ast
+import gc
+import sys
+import tracemalloc
+
+from onnxscript import irbuilder, main, values
+from onnxscript.onnx_opset import opset17 as op
+from onnxscript.onnx_types import FLOAT
+
+
+def generated_source(num_stmts: int) -> str:
+    """Returns the source of a function computing a chain of num_stmts statements."""
+    lines = ["def chain(x: FLOAT[None]) -> FLOAT[None]:", "    y0 = op.Relu(x)"]
+    lines.extend(f"    y{i} = op.Add(y{i - 1}, x)" for i in range(1, num_stmts))
+    lines.append(f"    return y{num_stmts - 1}")
+    return "\n".join(lines)
+
+
+def translate(source: str, source_info: bool, domain: str) -> irbuilder.IRFunction:
+    function_ast = ast.parse(source).body[0]
+    assert isinstance(function_ast, ast.FunctionDef)
+    function_ir = main.script_check(
+        function_ast, values.Opset(domain, 1), {"op": op, "FLOAT": FLOAT}, source
+    )
+    if not source_info:
+        function_ir.drop_source_info()
+    return function_ir
+
+
+def measure(num_stmts: int, source_info: bool) -> tuple[float, float]:
+    """Returns the memory retained by the IR and the peak memory, per statement."""
+    domain = f"benchmark.{num_stmts}.{source_info}"
+    # The caches filled by the first translation are not counted.
+    translate(generated_source(10), source_info, f"{domain}.warmup")
+    source = generated_source(num_stmts)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function_ir = translate(source, source_info, domain)
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    num_stmts = len(function_ir.stmts)
+    return retained / num_stmts, peak / num_stmts
+
+
+def main_(argv: list[str]) -> None:
+    num_stmts = int(argv[0]) if argv else 10000
+    for source_info in [True, False]:
+        retained, peak = measure(num_stmts, source_info)
+        print(
+            f"source_info={source_info}: {retained:.0f} bytes per statement "
+            f"retained, {peak:.0f} bytes per statement at peak"
+        )
+
+
+if __name__ == "__main__":
+    main_(sys.argv[1:])
@@ -0,0 +1,118 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import unittest
+from unittest import mock
+
+from onnxscript import graph, irbuilder, script
+from onnxscript.onnx_opset import opset17 as op
+from onnxscript.onnx_types import FLOAT
+
+
+@script()
+def double(x: FLOAT[None]) -> FLOAT[None]:
+    return op.Add(x, x)
+
+
+@script()
+def layer(x: FLOAT[2, 4]) -> FLOAT[2, 4]:
+    y = op.Relu(x)
+    return double(y)
+
+
+@script()
+def chain(x: FLOAT[2, 4]) -> FLOAT[2, 4]:
+    a = op.Relu(x)
+    b = op.Sigmoid(a)
+    c = op.Relu(b)
+    return c
+
+
+@script()
+def seq_map(x: FLOAT[2, 4]):
+    @graph()
+    def shift(y: FLOAT[2, 4]) -> FLOAT[2, 4]:
+        return op.Add(y, x)
+
+    return op.SequenceMap(op.SequenceConstruct(x, x), body=shift)
+
+
+class TestProtoCache(unittest.TestCase):
+    def setUp(self):
+        self.function = script()(layer.function).function_ir
+
+    def test_protos_are_converted_once(self):
+        with mock.patch.object(
+            irbuilder.IRFunction,
+            "to_graph_and_functions",
+            autospec=True,
+            side_effect=irbuilder.IRFunction.to_graph_and_functions,
+        ) as convert:
+            for _ in range(3):
+                self.function.to_function_proto()
+                self.function.to_graph_proto()
+                self.function.to_model_proto()
+            self.assertEqual(convert.call_count, 2)
+        self.assertIs(self.function.to_function_proto(), self.function.to_function_proto())
+
+    def test_models_are_copies(self):
+        model = self.function.to_model_proto()
+        model.graph.node.pop()
+        other = self.function.to_model_proto()
+        self.assertIsNot(other, model)
+        self.assertEqual(len(other.graph.node), 2)
+        self.assertEqual(other, self.function.to_model_proto())
+
+    def test_models_are_cached_by_parameters(self):
+        model = self.function.to_model_proto()
+        inlined = self.function.to_model_proto(inline=True)
+        self.assertEqual(len(model.functions), 1)
+        self.assertEqual(len(inlined.functions), 0)
+        self.assertEqual(self.function.to_model_proto(inline=True), inlined)
+        # The functions given to the call are not cached.
+        self.assertEqual(self.function.to_model_proto(functions=[double]), model)
+
+    def test_modifications_increment_version(self):
+        function_proto = self.function.to_function_proto()
+        version = self.function.version
+        self.function.append_output(
+            irbuilder.IRVar(self.function.stmts[0].output_names[0], None, None)
+        )
+        self.assertGreater(self.function.version, version)
+        self.assertEqual(len(self.function.to_function_proto().output), 2)
+        self.assertEqual(len(function_proto.output), 1)
+        version = self.function.version
+        self.function.stmts = self.function.stmts[:1]
+        self.assertGreater(self.function.version, version)
+        self.assertEqual(len(self.function.to_model_proto().graph.node), 1)
+
+
+class TestCompactIR(unittest.TestCase):
+    def test_statements_have_no_dict(self):
+        function = layer.function_ir
+        for obj in [function.stmts[0], function.inputs[0], function.inputs[0].info]:
+            self.assertFalse(hasattr(obj, "__dict__"), type(obj))
+
+    def test_types_and_ops_are_shared(self):
+        function = script()(chain.function).function_ir
+        self.assertIs(function.value_types["a"], function.value_types["c"])
+        self.assertIs(function.stmts[0].callee, function.stmts[2].callee)
+
+    def test_source_info_can_be_dropped(self):
+        function = script(source_info=False)(layer.function)
+        self.assertIsNone(function.source)
+        self.assertIsNone(function.function_ir.inputs[0].info)
+        self.assertEqual(
+            function.to_function_proto(), script()(layer.function).to_function_proto()
+        )
+
+    def test_source_info_of_outer_scope_variables_can_be_dropped(self):
+        function_ir = script(source_info=False)(seq_map.function).function_ir
+        shift = function_ir.nested_functions["shift"]
+        self.assertEqual([pyvar for pyvar, _ in shift.outer_scope_variables], ["x"])
+        self.assertIsNone(shift.outer_scope_variables[0][1].info)
+
+
+if __name__ == "__main__":
+    unittest.main()
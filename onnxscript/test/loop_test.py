@@ -1,8 +1,10 @@
 import unittest
 
 import numpy as np
+import onnxruntime
+from onnxruntime.capi.onnxruntime_pybind11_state import InvalidArgument
 
-from onnxscript import script
+from onnxscript import script, unroll
 from onnxscript.onnx_opset import opset15 as op
 from onnxscript.onnx_types import FLOAT, INT64
 from onnxscript.test.common import testutils
@@ -42,6 +44,151 @@ class LoopOpTester(testutils.TestBase):
 
         self.validate(sumprod)
 
+    def test_loop_invariant_code_motion(self):
+        """Test that loop-invariant computations are hoisted out of the loop body."""
+
+        @script()
+        def scaled_sum(x: FLOAT["N"], N: INT64) -> FLOAT["N"]:  # noqa: F821
+            total = op.Identity(x)
+            for _ in range(N):
+                scale = op.Cast(op.Size(x), to=1)
+                total = total + x * scale
+            return total
+
+        model = scaled_sum.to_model_proto()
+        op_types = [n.op_type for n in model.graph.node]
+        for op_type in ["Size", "Cast"]:
+            self.assertIn(op_type, op_types)
+        body = next(n for n in model.graph.node if n.op_type == "Loop").attribute[0].g
+        # Mul may fail on incompatible shapes: it is not run when the loop is not.
+        self.assertEqual([n.op_type for n in body.node], ["Mul", "Add", "Identity"])
+
+        x = np.array([1.0, 2.0], dtype=np.float32)
+        session = onnxruntime.InferenceSession(model.SerializeToString())
+        result = session.run(None, {"x": x, "N": np.array(3, dtype=np.int64)})[0]
+        np.testing.assert_equal(result, x + 3 * x * 2)
+
+    def test_loop_invariant_code_motion_zero_trips(self):
+        """Test that ops which may fail are not hoisted out of a loop run zero times."""
+
+        @script()
+        def gather_sum(x: FLOAT["N"], n: INT64) -> FLOAT["N"]:  # noqa: F821
+            y = op.Identity(x)
+            for _ in range(n):
+                y = y + op.Gather(x, 3)
+            return y
+
+        model = gather_sum.to_model_proto()
+        self.assertNotIn("Gather", [n.op_type for n in model.graph.node])
+        x = np.array([1.0, 2.0], dtype=np.float32)
+        n = np.array(0, dtype=np.int64)
+        session = onnxruntime.InferenceSession(model.SerializeToString())
+        np.testing.assert_equal(session.run(None, {"x": x, "n": n})[0], x)
+        np.testing.assert_equal(gather_sum(x, n), x)
+
+    def test_unroll_marker(self):
+        """Test a loop unrolled with the unroll marker."""
+
+        @script()
+        def power(x: FLOAT["N"]) -> FLOAT["N"]:  # noqa: F821
+            result = op.Identity(x)
+            for i in range(unroll(3)):
+                result = result * x + op.CastLike(i, x)
+            return result
+
+        op_types = [n.op_type for n in power.to_function_proto().node]
+        self.assertNotIn("Loop", op_types)
+        self.assertEqual(op_types.count("Mul"), 3)
+
+        x = np.array([2.0, 3.0], dtype=np.float32)
+        expected = ((x * x + 0) * x + 1) * x + 2
+        model = power.to_model_proto()
+        session = onnxruntime.InferenceSession(model.SerializeToString())
+        np.testing.assert_equal(session.run(None, {"x": x})[0], expected)
+        np.testing.assert_equal(power(x), expected)
+
+    def test_unroll_threshold(self):
+        """Test the automatic unrolling of loops with a small constant trip-count."""
+
+        def sumprod(x: FLOAT["N"]) -> (FLOAT["N"], FLOAT["N"]):  # noqa: F821
+            sum = op.Identity(x)
+            prod = op.Identity(x)
+            for _ in range(4):
+                sum = sum + x
+                prod = prod * x
+            return sum, prod
+
+        unrolled = script(unroll_threshold=4)(sumprod)
+        self.assertNotIn("Loop", [n.op_type for n in unrolled.to_function_proto().node])
+        not_unrolled = script(unroll_threshold=3)(sumprod)
+        self.assertIn("Loop", [n.op_type for n in not_unrolled.to_function_proto().node])
+
+        x = np.array([2.0], dtype=np.float32)
+        sum, prod = unrolled(x)
+        np.testing.assert_equal(sum, np.array([10.0], dtype=np.float32))
+        np.testing.assert_equal(prod, np.array([32.0], dtype=np.float32))
+
+    def test_unroll_threshold_is_kept_by_specialization(self):
+        """Test that a specialized function is unrolled as the original one."""
+
+        def repeat(x: FLOAT["N"], alpha: float = 1.0) -> FLOAT["N"]:  # noqa: F821
+            result = op.Identity(x)
+            for _ in range(3):
+                result = result * op.CastLike(alpha, x)
+            return result
+
+        specialized = script(unroll_threshold=3)(repeat).specialize(alpha=2.0)
+        self.assertNotIn("Loop", [n.op_type for n in specialized.to_function_proto().node])
+        x = np.array([1.0, 2.0], dtype=np.float32)
+        np.testing.assert_equal(specialized(x), x * 8)
+
+    def test_loop_over_slices_is_scanned(self):
+        """Test that a loop reducing the slices X[i] of a tensor is translated to a Scan."""
+
+        @script()
+        def weighted_sum(
+            X: FLOAT["M", "N"], W: FLOAT["M", "N"], n: INT64  # noqa: F821
+        ) -> FLOAT["N"]:  # noqa: F821
+            total = op.ReduceSum(X, op.Constant(value_ints=[0]), keepdims=0)
+            for i in range(n):
+                total = total + X[i] * W[i]
+            return total
+
+        model = weighted_sum.to_model_proto()
+        op_types = [n.op_type for n in model.graph.node]
+        self.assertNotIn("Loop", op_types)
+        then_branch = next(n for n in model.graph.node if n.op_type == "If").attribute[0].g
+        self.assertEqual([n.op_type for n in then_branch.node], ["Scan"])
+
+        session = onnxruntime.InferenceSession(model.SerializeToString())
+        X = np.arange(12, dtype=np.float32).reshape((4, 3))
+        W = np.ones((4, 3), dtype=np.float32) * 2
+        for n in [-1, 0, 2, 4]:
+            result = session.run(None, {"X": X, "W": W, "n": np.array(n, dtype=np.int64)})
+            expected = X.sum(axis=0) + (X[: max(n, 0)] * W[: max(n, 0)]).sum(axis=0)
+            np.testing.assert_equal(result[0], expected)
+        # As with a Loop, a trip-count greater than the number of slices is an error.
+        with self.assertRaises(InvalidArgument):
+            session.run(None, {"X": X, "W": W, "n": np.array(5, dtype=np.int64)})
+
+    def test_loop_changing_state_shape_is_not_scanned(self):
+        """Test that a loop is kept if the shape of its state may change."""
+
+        @script()
+        def concat_rows(X: FLOAT["M", "N"], n: INT64) -> FLOAT[None]:  # noqa: F821
+            rows = op.ReduceSum(X, op.Constant(value_ints=[0]), keepdims=0)
+            for i in range(n):
+                rows = op.Concat(rows, X[i], axis=0)
+            return rows
+
+        op_types = [n.op_type for n in concat_rows.to_function_proto().node]
+        self.assertIn("Loop", op_types)
+        self.assertNotIn("Scan", op_types)
+        # Nothing is left from the attempt to translate the loop into a Scan.
+        function_ir = concat_rows.function_ir
+        names = {y for stmt in function_ir.stmts for y in stmt.output_names}
+        self.assertTrue(set(function_ir.value_types) <= names | {"X", "n"})
+
 
 if __name__ == "__main__":
     unittest.main()
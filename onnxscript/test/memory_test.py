@@ -0,0 +1,100 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import unittest
+
+import onnx
+
+from onnxscript import memory, script
+from onnxscript.onnx_opset import opset17 as op
+from onnxscript.onnx_types import BOOL, FLOAT
+
+
+@script()
+def widen(x: FLOAT["N", 16]) -> FLOAT["N", 16]:  # noqa: F821
+    a = op.Relu(x)
+    b = op.Concat(a, a, axis=1)
+    c = op.ReduceSum(b, axes=[1], keepdims=1)
+    return op.Mul(x, c)
+
+
+@script()
+def branches(x: FLOAT[4, 4], flag: BOOL) -> FLOAT[4, 4]:
+    if flag:
+        stacked = op.Concat(x, x, x, x, axis=0)
+        y = op.ReduceSum(stacked, [0], keepdims=1) + x
+    else:
+        y = op.Neg(x)
+    return y
+
+
+@script()
+def power(x: FLOAT[4, 4]) -> FLOAT[4, 4]:
+    y = x
+    for i in range(3):
+        y = op.MatMul(y, x)
+    return y
+
+
+class TestEstimatePeakMemory(unittest.TestCase):
+    def test_peak_with_input_shapes(self):
+        estimate = memory.estimate_peak_memory(widen, [FLOAT[10, 16]])
+        # x, a and b (twice as large) are live while Concat runs.
+        self.assertEqual(estimate.peak, 640 + 640 + 1280)
+        self.assertEqual(estimate.peak_node.op_type, "Concat")
+        self.assertEqual([v.name for v in estimate.top(2)], ["b", "x"])
+        self.assertEqual(estimate.top(1)[0].op_type, "Concat")
+        self.assertEqual(estimate.lifetimes["a"], (0, 1))
+        self.assertEqual(estimate.lifetimes["x"], (0, 3))
+        self.assertEqual(estimate.unknown_sizes, [])
+        self.assertIn("peak memory: 2560 bytes at Concat", str(estimate))
+
+    def test_unknown_sizes_are_reported(self):
+        estimate = memory.estimate_peak_memory(widen)
+        self.assertEqual(estimate.peak, 0)
+        self.assertIn("b", estimate.unknown_sizes)
+
+    def test_subgraph_peak_is_included(self):
+        estimate = memory.estimate_peak_memory(branches)
+        self.assertEqual(estimate.peak_node.op_type, "If")
+        # The then-branch holds the concatenation (256 bytes) and its sum (16 bytes).
+        self.assertEqual(estimate.subgraph_peak, 256 + 16)
+        self.assertEqual(estimate.peak, 64 + 1 + 64 + 256 + 16)
+
+    def test_loop_states_keep_their_initial_shape(self):
+        estimate = memory.estimate_peak_memory(power)
+        self.assertEqual(estimate.peak_node.op_type, "Loop")
+        # The body holds the iteration number, the condition, y and the product.
+        self.assertEqual(estimate.subgraph_peak, 8 + 1 + 64 + 64)
+        self.assertEqual(estimate.unknown_sizes, [])
+
+    def test_model_with_named_input_types(self):
+        model = widen.to_model_proto()
+        estimate = memory.estimate_peak_memory(model, {"x": FLOAT[2, 16]})
+        self.assertEqual(estimate.peak, 128 + 128 + 256)
+        # The model itself is not modified.
+        self.assertFalse(
+            model.graph.input[0].type.tensor_type.shape.dim[0].HasField("dim_value")
+        )
+
+    def test_constants_are_not_activations(self):
+        model = onnx.helper.make_model(
+            onnx.helper.make_graph(
+                [onnx.helper.make_node("Add", ["x", "w"], ["y"])],
+                "g",
+                [onnx.helper.make_tensor_value_info("x", onnx.TensorProto.FLOAT, [8])],
+                [onnx.helper.make_tensor_value_info("y", onnx.TensorProto.FLOAT, [8])],
+                initializer=[
+                    onnx.helper.make_tensor("w", onnx.TensorProto.FLOAT, [8], [1.0] * 8)
+                ],
+            ),
+            opset_imports=[onnx.helper.make_opsetid("", 17)],
+        )
+        estimate = memory.estimate_peak_memory(model)
+        self.assertEqual(estimate.peak, 64)
+        self.assertEqual(estimate.constant_size, 32)
+
+
+if __name__ == "__main__":
+    unittest.main()
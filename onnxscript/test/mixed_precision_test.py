@@ -0,0 +1,157 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import unittest
+
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper
+
+from onnxscript import mixed_precision, script
+from onnxscript.onnx_opset import opset17 as op
+from onnxscript.onnx_types import BFLOAT16, FLOAT, FLOAT16, INT64
+from onnxscript.test.common import testutils
+
+
+def _elem_types(model):
+    graph = onnx.shape_inference.infer_shapes(model).graph
+    return {
+        info.name: info.type.tensor_type.elem_type
+        for info in [*graph.input, *graph.value_info, *graph.output]
+    }
+
+
+@script()
+def mlp(x: FLOAT[2, 4], w: FLOAT[4, 3]) -> FLOAT[2, 3]:
+    h = op.Relu(op.MatMul(x, w) + 0.5)
+    return op.Softmax(h * 2.0, axis=-1)
+
+
+@script()
+def layer_norm(x: FLOAT[2, 4], scale: FLOAT[4], bias: FLOAT[4]) -> FLOAT[2, 4]:
+    mean = op.ReduceMean(x, axes=[-1])
+    deviation = x - mean
+    variance = op.ReduceMean(deviation * deviation, axes=[-1])
+    return deviation / op.Sqrt(variance + 1e-3) * scale + bias
+
+
+@script()
+def expand(x: FLOAT[4], shape: INT64[2]) -> FLOAT[3, 4]:
+    return op.Expand(x, shape) + op.ConstantOfShape(shape)
+
+
+class TestMixedPrecision(unittest.TestCase):
+    def setUp(self):
+        self.x = np.random.rand(2, 4).astype(np.float32)
+        self.w = np.random.rand(4, 3).astype(np.float32)
+
+    def test_sensitive_ops_are_kept_in_float32(self):
+        model = mlp.to_model_proto(mixed_precision=FLOAT16)
+        onnx.checker.check_model(model)
+        self.assertEqual(
+            [n.op_type for n in model.graph.node],
+            ["Cast", "Cast", "MatMul", "Add", "Relu", "Mul", "Cast", "Softmax"],
+        )
+        softmax = model.graph.node[-1]
+        elem_types = _elem_types(model)
+        self.assertEqual(elem_types[softmax.input[0]], onnx.TensorProto.FLOAT)
+        self.assertEqual(elem_types[model.graph.node[4].output[0]], onnx.TensorProto.FLOAT16)
+        # The interface of the model is unchanged.
+        self.assertEqual(elem_types["x"], onnx.TensorProto.FLOAT)
+        self.assertEqual(elem_types["return_val"], onnx.TensorProto.FLOAT)
+        np.testing.assert_allclose(
+            testutils.run_model(model, x=self.x, w=self.w),
+            testutils.run_model(mlp.to_model_proto(), x=self.x, w=self.w),
+            rtol=1e-2,
+            atol=1e-3,
+        )
+
+    def test_constants_are_converted(self):
+        model = mlp.to_model_proto(mixed_precision=BFLOAT16)
+        onnx.checker.check_model(model, full_check=True)
+        self.assertNotIn("Constant", [n.op_type for n in model.graph.node])
+        self.assertEqual(
+            {t.data_type for t in model.graph.initializer}, {onnx.TensorProto.BFLOAT16}
+        )
+        self.assertEqual(len(model.graph.initializer), 2)
+
+    def test_initializers_are_converted(self):
+        weight = numpy_helper.from_array(self.w, "w")
+        graph = helper.make_graph(
+            [
+                helper.make_node("MatMul", ["x", "w"], ["y"]),
+                helper.make_node("Relu", ["y"], ["z"]),
+            ],
+            "g",
+            [helper.make_tensor_value_info("x", onnx.TensorProto.FLOAT, [2, 4])],
+            [helper.make_tensor_value_info("z", onnx.TensorProto.FLOAT, [2, 3])],
+            initializer=[weight],
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+        expected = testutils.run_model(model, x=self.x)
+        self.assertEqual(mixed_precision.convert_to_mixed_precision(model), 2)
+        onnx.checker.check_model(model)
+        self.assertEqual(
+            [n.op_type for n in model.graph.node], ["Cast", "MatMul", "Relu", "Cast"]
+        )
+        self.assertEqual([t.name for t in model.graph.initializer], ["w_fp16"])
+        np.testing.assert_allclose(
+            testutils.run_model(model, x=self.x), expected, rtol=1e-2, atol=1e-3
+        )
+
+    def test_layer_normalization_statistics_are_kept_in_float32(self):
+        model = layer_norm.to_model_proto(mixed_precision=FLOAT16)
+        onnx.checker.check_model(model)
+        elem_types = _elem_types(model)
+        for node in model.graph.node:
+            if node.op_type == "ReduceMean":
+                self.assertEqual(elem_types[node.input[0]], onnx.TensorProto.FLOAT)
+        fused = layer_norm.to_model_proto(fuse_ops=True, mixed_precision=FLOAT16)
+        self.assertEqual([n.op_type for n in fused.graph.node], ["LayerNormalization"])
+        inputs = {
+            "x": self.x,
+            "scale": np.random.rand(4).astype(np.float32),
+            "bias": np.random.rand(4).astype(np.float32),
+        }
+        np.testing.assert_allclose(
+            testutils.run_model(model, **inputs),
+            testutils.run_model(layer_norm.to_model_proto(), **inputs),
+            rtol=1e-2,
+            atol=1e-3,
+        )
+
+    def test_outputs_typed_by_attributes_are_not_converted(self):
+        model = expand.to_model_proto()
+        mixed_precision.convert_to_mixed_precision(model)
+        onnx.checker.check_model(model, full_check=True)
+        op_types = [n.op_type for n in model.graph.node]
+        # The float32 output of ConstantOfShape is cast to the input type of Add.
+        self.assertEqual(
+            op_types, ["Cast", "Expand", "ConstantOfShape", "Cast", "Add", "Cast"]
+        )
+
+    def test_convert_function(self):
+        function_ir = script()(mlp.function).function_ir
+        self.assertEqual(mixed_precision.convert_to_mixed_precision(function_ir), 4)
+        self.assertEqual(
+            [s.callee.opname for s in function_ir.stmts],
+            ["Cast", "Cast", "MatMul", "Constant", "Add", "Relu", "Constant", "Mul", "Cast"]
+            + ["Softmax"],
+        )
+        model = function_ir.to_model_proto()
+        onnx.checker.check_model(model, full_check=True)
+        np.testing.assert_allclose(
+            testutils.run_model(model, x=self.x, w=self.w),
+            testutils.run_model(mlp.to_model_proto(), x=self.x, w=self.w),
+            rtol=1e-2,
+            atol=1e-3,
+        )
+
+    def test_invalid_type(self):
+        with self.assertRaises(ValueError):
+            mixed_precision.convert_to_mixed_precision(mlp.to_model_proto(), FLOAT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,7 +3,12 @@
 # Licensed under the MIT License.
 # --------------------------------------------------------------------------
 
-# Test cases for automatic introduction of CastLike around constants:
+# Test cases for automatic introduction of CastLike around constants.
+# When the type of the other operand is statically known, the constant is
+# directly emitted with the right type and no CastLike is needed.
+
+from onnx import TensorProto
+from onnx.helper import make_tensor
 
 from onnxscript import script
 from onnxscript.onnx_opset import opset15 as op
@@ -17,7 +22,7 @@ def inc_right(A: FLOAT[...]) -> FLOAT[...]:
 
 @script()
 def inc_right_expanded(A: FLOAT[...]) -> FLOAT[...]:
-    return A + op.CastLike(1, A)
+    return A + op.Constant(value=make_tensor("c", TensorProto.FLOAT, [], [1.0]))
 
 
 @script(default_opset=op)
@@ -27,7 +32,7 @@ def inc_left(A: FLOAT[...]) -> FLOAT[...]:
 
 @script()
 def inc_left_expanded(A: FLOAT[...]) -> FLOAT[...]:
-    return op.CastLike(1, A) + A
+    return op.Constant(value=make_tensor("c", TensorProto.FLOAT, [], [1.0])) + A
 
 
 @script(default_opset=op)
@@ -37,7 +42,7 @@ def cmp_zero_right(A: FLOAT[...]) -> BOOL[...]:
 
 @script()
 def cmp_zero_right_expanded(A: FLOAT[...]) -> BOOL[...]:
-    return A == op.CastLike(0, A)
+    return A == op.Constant(value=make_tensor("c", TensorProto.FLOAT, [], [0.0]))
 
 
 @script(default_opset=op)
@@ -47,7 +52,7 @@ def cmp_zero_mright(A: FLOAT[...]) -> BOOL[...]:
 
 @script()
 def cmp_zero_mright_expanded(A: FLOAT[...]) -> BOOL[...]:
-    return A == op.CastLike(-11, A)
+    return A == op.Constant(value=make_tensor("c", TensorProto.FLOAT, [], [-11.0]))
 
 
 @script(default_opset=op)
@@ -57,7 +62,7 @@ def cmp_zero_left(A: FLOAT[...]) -> BOOL[...]:
 
 @script()
 def cmp_zero_left_expanded(A: FLOAT[...]) -> BOOL[...]:
-    return op.CastLike(0, A) == A
+    return op.Constant(value=make_tensor("c", TensorProto.FLOAT, [], [0.0])) == A
 
 
 @script(default_opset=op)
@@ -67,7 +72,7 @@ def div_right(A: FLOAT[...]) -> FLOAT[...]:
 
 @script()
 def div_right_expanded(A: FLOAT[...]) -> FLOAT[...]:
-    return A / op.CastLike(2, A)
+    return A / op.Constant(value=make_tensor("c", TensorProto.FLOAT, [], [2.0]))
 
 
 @script(default_opset=op)
@@ -77,7 +82,7 @@ def div_minus_right(A: FLOAT[...]) -> FLOAT[...]:
 
 @script()
 def div_minus_right_expanded(A: FLOAT[...]) -> FLOAT[...]:
-    return A / op.CastLike(-2, A)
+    return A / op.Constant(value=make_tensor("c", TensorProto.FLOAT, [], [-2.0]))
 
 
 # @script()
@@ -92,7 +97,7 @@ def where_left(C: BOOL[...], A: FLOAT[...]) -> FLOAT[...]:
 
 @script()
 def where_left_expanded(C: BOOL[...], A: FLOAT[...]) -> FLOAT[...]:
-    return op.Where(C, op.CastLike(2, A), A)
+    return op.Where(C, op.Constant(value=make_tensor("c", TensorProto.FLOAT, [], [2.0])), A)
 
 
 @script()
@@ -102,4 +107,14 @@ def where_right(C: BOOL[...], A: FLOAT[...]) -> FLOAT[...]:
 
 @script()
 def where_right_expanded(C: BOOL[...], A: FLOAT[...]) -> FLOAT[...]:
-    return op.Where(C, A, op.CastLike(3, A))
+    return op.Where(C, A, op.Constant(value=make_tensor("c", TensorProto.FLOAT, [], [3.0])))
+
+
+@script(default_opset=op)
+def inc_untyped(A):
+    return A + 1
+
+
+@script()
+def inc_untyped_expanded(A):
+    return A + op.CastLike(1, A)
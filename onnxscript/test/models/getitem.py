@@ -110,8 +110,19 @@ def getitem_i_expr(A: FLOAT[...]) -> FLOAT[...]:
     return r
 
 
-# This notation is not possible with ONNX but is allowed by numpy.
-# @script()
-# def getitem_i_slice_right_step(A: FLOAT[...]) -> FLOAT[...]:
-#     r = A[1::-1]
-#     return r
+@script(default_opset=op)
+def getitem_i_slice_right_step(A: FLOAT[...]) -> FLOAT[...]:
+    r = A[1::-1]
+    return r
+
+
+@script(default_opset=op)
+def getitem_reverse(A: FLOAT[...]) -> FLOAT[...]:
+    r = A[::-1]
+    return r
+
+
+@script(default_opset=op)
+def getitem_last_column(A: FLOAT[...]) -> FLOAT[...]:
+    r = A[1:, -1]
+    return r
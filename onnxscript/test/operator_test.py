@@ -33,8 +33,7 @@ class TestConverter(testutils.TestBase):
         @script()
         def explicit_plus1(A: FLOAT["N"]) -> FLOAT["N"]:  # noqa: F821
             one = op.Constant(value=onnx.helper.make_tensor("one", 1, [], [1.0]))
-            one_cast = op.CastLike(one, A)
-            return op.Add(A, one_cast)
+            return op.Add(A, one)
 
         @script()
         def implicit_plus1(A: FLOAT["N"]) -> FLOAT["N"]:  # noqa: F821
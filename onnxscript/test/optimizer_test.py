@@ -0,0 +1,323 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import unittest
+
+import numpy as np
+import onnx
+
+from onnxscript import optimizer, script
+from onnxscript.onnx_opset import opset15 as op
+from onnxscript.onnx_types import FLOAT, INT64
+from onnxscript.test.common import testutils
+from onnxscript.test.functions import gemmgelu
+from onnxscript.values import Opset
+
+
+def _opnames(function_ir):
+    return [s.callee.opname for s in function_ir.stmts]
+
+
+class TestConstantFolding(unittest.TestCase):
+    def test_fold_constant_inputs(self):
+        @script()
+        def reshape(x: FLOAT[None, None]) -> FLOAT[None]:
+            shape = op.Concat(
+                op.Constant(value_ints=[1]), op.Constant(value_ints=[-1]), axis=0
+            )
+            flat = op.Reshape(x, shape)
+            return op.Squeeze(flat, op.Constant(value_ints=[0]))
+
+        x = np.arange(6, dtype=np.float32).reshape((2, 3))
+        expected = testutils.run_model(reshape.to_model_proto(), x=x)
+
+        num_folded = optimizer.fold_constants(reshape.function_ir)
+        self.assertEqual(num_folded, 1)
+        self.assertNotIn("Concat", _opnames(reshape.function_ir))
+        np.testing.assert_equal(testutils.run_model(reshape.to_model_proto(), x=x), expected)
+
+    def test_fold_chain_of_constants(self):
+        @script()
+        def chain(x: FLOAT[None]) -> FLOAT[None]:
+            two = op.Add(op.Constant(value_float=1.0), op.Constant(value_float=1.0))
+            four = op.Mul(two, two)
+            return op.Mul(x, four)
+
+        optimizer.fold_constants(chain.function_ir)
+        self.assertEqual(_opnames(chain.function_ir).count("Constant"), 4)
+        x = np.array([1.0, 2.0], dtype=np.float32)
+        np.testing.assert_equal(testutils.run_model(chain.to_model_proto(), x=x)[0], x * 4)
+
+    def test_attribute_references_are_not_folded(self):
+        @script()
+        def scale(x, alpha: float = 2.0):
+            factor = op.Add(op.Constant(value_float=alpha), op.Constant(value_float=1.0))
+            return op.Mul(x, factor)
+
+        num_folded = optimizer.fold_constants(scale.function_ir)
+        self.assertEqual(num_folded, 0)
+        self.assertIn("Add", _opnames(scale.function_ir))
+
+    def test_size_limit(self):
+        @script()
+        def large(x: FLOAT[None]) -> FLOAT[None]:
+            zeros = op.ConstantOfShape(op.Constant(value_ints=[100, 100]))
+            return op.Add(x, op.ReduceSum(zeros, keepdims=0))
+
+        optimizer.fold_constants(large.function_ir, size_limit=10)
+        self.assertIn("ConstantOfShape", _opnames(large.function_ir))
+
+
+@script()
+def negate(x):
+    return op.Neg(x)
+
+
+class TestDeadCodeElimination(unittest.TestCase):
+    def test_unused_statements_and_functions_are_removed(self):
+        @script()
+        def unused(x: FLOAT[None]) -> FLOAT[None]:
+            y = negate(x)
+            z = op.Abs(y)  # noqa: F841
+            return op.Relu(x)
+
+        self.assertIn("negate", unused.function_ir.called_functions)
+        num_removed = optimizer.eliminate_dead_code(unused.function_ir)
+        self.assertEqual(num_removed, 2)
+        self.assertEqual(_opnames(unused.function_ir), ["Relu"])
+        self.assertEqual(unused.function_ir.called_functions, {})
+        self.assertEqual(len(unused.to_model_proto().functions), 0)
+
+    def test_identity_copies_are_forwarded(self):
+        @script()
+        def copies(x: FLOAT[None], n: INT64) -> FLOAT[None]:
+            y = op.Identity(x)
+            z = y
+            for i in range(n):
+                z = z + y
+            if op.ReduceSum(z) > 0:
+                w = z
+            else:
+                w = op.Neg(z)
+            r = op.Identity(w)
+            return r
+
+        x = np.array([1.0, 2.0], dtype=np.float32)
+        n = np.array(3, dtype=np.int64)
+        expected = testutils.run_model(copies.to_model_proto(), x=x, n=n)
+
+        optimizer.eliminate_dead_code(copies.function_ir)
+        self.assertNotIn("Identity", _opnames(copies.function_ir))
+        model = copies.to_model_proto()
+        onnx.checker.check_model(model)
+        np.testing.assert_equal(testutils.run_model(model, x=x, n=n), expected)
+
+    def test_identity_of_input_returned_as_output_is_kept(self):
+        @script(default_opset=op)
+        def identity(x: FLOAT[None]) -> FLOAT[None]:
+            return x
+
+        optimizer.eliminate_dead_code(identity.function_ir)
+        self.assertEqual(_opnames(identity.function_ir), ["Identity"])
+
+    def test_folded_constants_are_removed(self):
+        @script()
+        def folded(x: FLOAT[None]) -> FLOAT[None]:
+            two = op.Add(op.Constant(value_float=1.0), op.Constant(value_float=1.0))
+            return op.Mul(x, two)
+
+        optimizer.fold_constants(folded.function_ir)
+        optimizer.eliminate_dead_code(folded.function_ir)
+        self.assertEqual(_opnames(folded.function_ir), ["Constant", "Mul"])
+
+
+@script()
+def leaky_relu(x, alpha: float):
+    return op.LeakyRelu(x, alpha=alpha)
+
+
+@script()
+def scaled_leaky_relu(x, scale: float):
+    scaled = op.Mul(x, op.CastLike(op.Constant(value_float=scale), x))
+    return leaky_relu(scaled, alpha=0.2)
+
+
+@script()
+def calls_functions(x: FLOAT[None]) -> FLOAT[None]:
+    a = leaky_relu(x, alpha=0.1)
+    if op.ReduceSum(a) > 0:
+        b = scaled_leaky_relu(a, scale=2.0)
+    else:
+        b = leaky_relu(a, alpha=0.5)
+    return op.Add(a, b)
+
+
+class TestInlining(unittest.TestCase):
+    def setUp(self):
+        self.x = np.array([-1.0, 2.0], dtype=np.float32)
+        self.expected = testutils.run_model(calls_functions.to_model_proto(), x=self.x)
+
+    def test_inline_all_functions(self):
+        model = calls_functions.to_model_proto(inline=True)
+        onnx.checker.check_model(model)
+        self.assertEqual(len(model.functions), 0)
+        op_types = [n.op_type for n in model.graph.node]
+        self.assertNotIn("leaky_relu", op_types)
+        leaky = [n for n in model.graph.node if n.op_type == "LeakyRelu"]
+        self.assertAlmostEqual(onnx.helper.get_attribute_value(leaky[0].attribute[0]), 0.1)
+        then_branch = next(n for n in model.graph.node if n.op_type == "If").attribute[0].g
+        self.assertEqual(
+            [n.op_type for n in then_branch.node], ["Constant", "CastLike", "Mul", "LeakyRelu"]
+        )
+        np.testing.assert_allclose(testutils.run_model(model, x=self.x), self.expected)
+
+    def test_inline_selected_functions(self):
+        model = calls_functions.to_model_proto(inline={"leaky_relu"})
+        onnx.checker.check_model(model)
+        self.assertEqual([f.name for f in model.functions], ["scaled_leaky_relu"])
+        self.assertEqual(
+            [n.op_type for n in model.functions[0].node],
+            ["Constant", "CastLike", "Mul", "LeakyRelu"],
+        )
+        np.testing.assert_allclose(testutils.run_model(model, x=self.x), self.expected)
+
+
+fused = Opset("fused", 1)
+
+
+@script(fused)
+def FastGelu(X, Bias):
+    """The fused op, defined as a model-local function."""
+    X = op.Add(X, Bias)
+    inner = op.Mul(X, op.Add(op.Constant(value_float=0.797885), X * X * 0.035677))
+    return X * op.Constant(value_float=0.5) * (op.Tanh(inner) + 1.0)
+
+
+@script()
+def gemm_gelu_pattern(A, W, Bias):
+    X = op.Add(op.MatMul(A, W), Bias)
+    T3 = op.Add(
+        op.Constant(value_float=0.797885),
+        op.Mul(op.Constant(value_float=0.035677), op.Mul(X, X)),
+    )
+    T6 = op.Add(op.Constant(value_float=1.0), op.Tanh(op.Mul(X, T3)))
+    return op.Mul(op.Constant(value_float=0.5), op.Mul(X, T6))
+
+
+@script()
+def gemm_fast_gelu(A, W, Bias):
+    return FastGelu(op.MatMul(A, W), Bias)
+
+
+@script()
+def leaky_relu_pattern(x, alpha: float):
+    return op.Where(
+        op.Less(x, op.Constant(value_float=0.0)), op.Mul(x, op.Constant(value_float=alpha)), x
+    )
+
+
+class TestRewriting(unittest.TestCase):
+    def setUp(self):
+        self.rule = optimizer.RewriteRule(gemm_gelu_pattern, gemm_fast_gelu)
+        self.inputs = {
+            "A": np.random.rand(4, 3).astype(np.float32),
+            "W": np.random.rand(3, 5).astype(np.float32),
+            "Bias": np.random.rand(5).astype(np.float32),
+        }
+
+    def test_rule_is_indexed_by_root_op(self):
+        self.assertEqual(self.rule.root_op, ("", "Mul"))
+
+    def test_rewrite_model(self):
+        model = gemmgelu.gemmgelu.to_model_proto()
+        expected = testutils.run_model(model, **self.inputs)
+
+        self.assertEqual(optimizer.rewrite(model, [self.rule]), 1)
+        onnx.checker.check_model(model)
+        self.assertEqual([n.op_type for n in model.graph.node], ["MatMul", "FastGelu"])
+        self.assertEqual([f.name for f in model.functions], ["FastGelu"])
+        self.assertIn("fused", [o.domain for o in model.opset_import])
+        np.testing.assert_allclose(
+            testutils.run_model(model, **self.inputs), expected, rtol=1e-5
+        )
+
+    def test_rewrite_function(self):
+        # The function is translated again to keep the one of the test module unchanged.
+        function_ir = script()(gemmgelu.gemmgelu.function).function_ir
+        expected = testutils.run_model(gemmgelu.gemmgelu.to_model_proto(), **self.inputs)
+        self.assertEqual(optimizer.rewrite(function_ir, [self.rule]), 1)
+        self.assertEqual(_opnames(function_ir), ["MatMul", "FastGelu"])
+        model = function_ir.to_model_proto()
+        np.testing.assert_allclose(
+            testutils.run_model(model, **self.inputs), expected, rtol=1e-5
+        )
+
+    def test_no_rewrite_if_intermediate_value_is_used(self):
+        @script()
+        def gelu_and_bias(
+            A: FLOAT["M", "K"], W: FLOAT["K", "N"], Bias: FLOAT["N"]  # noqa: F821
+        ) -> FLOAT["M", "N"]:  # noqa: F821
+            X = op.Add(op.MatMul(A, W), Bias)
+            T3 = op.Add(
+                op.Constant(value_float=0.797885),
+                op.Mul(op.Constant(value_float=0.035677), op.Mul(X, X)),
+            )
+            T6 = op.Add(op.Constant(value_float=1.0), op.Tanh(op.Mul(X, T3)))
+            return op.Add(op.Mul(op.Constant(value_float=0.5), op.Mul(X, T6)), X)
+
+        self.assertEqual(optimizer.rewrite(gelu_and_bias.to_model_proto(), [self.rule]), 0)
+
+    def test_commutative_inputs_and_attributes(self):
+        @script()
+        def leaky(x: FLOAT[None]) -> FLOAT[None]:
+            return op.Where(
+                op.Less(x, op.Constant(value_float=0.0)),
+                op.Mul(op.Constant(value_float=0.25), x),
+                x,
+            )
+
+        @script()
+        def leaky_relu_replacement(x, alpha: float):
+            return op.LeakyRelu(x, alpha=alpha)
+
+        rule = optimizer.RewriteRule(leaky_relu_pattern, leaky_relu_replacement)
+        model = leaky.to_model_proto()
+        # The pattern can only bind alpha to an attribute, not to the value of a constant.
+        self.assertEqual(optimizer.rewrite(model, [rule]), 0)
+
+        @script()
+        def leaky_relu_pattern_const(x):
+            return op.Where(
+                op.Less(x, op.Constant(value_float=0.0)),
+                op.Mul(x, op.Constant(value_float=0.25)),
+                x,
+            )
+
+        @script()
+        def leaky_relu_const(x):
+            return op.LeakyRelu(x, alpha=0.25)
+
+        rule = optimizer.RewriteRule(leaky_relu_pattern_const, leaky_relu_const)
+        self.assertEqual(optimizer.rewrite(model, [rule]), 1)
+        self.assertEqual([n.op_type for n in model.graph.node], ["LeakyRelu"])
+        x = np.array([-2.0, 3.0], dtype=np.float32)
+        np.testing.assert_equal(
+            testutils.run_model(model, x=x)[0], np.array([-0.5, 3.0], dtype=np.float32)
+        )
+        no_commute = optimizer.RewriteRule(
+            leaky_relu_pattern_const, leaky_relu_const, commute=False
+        )
+        self.assertEqual(optimizer.rewrite(leaky.to_model_proto(), [no_commute]), 0)
+
+    def test_invalid_rule(self):
+        @script()
+        def uses_unknown_input(x, y):
+            return op.Add(x, y)
+
+        with self.assertRaises(ValueError):
+            optimizer.RewriteRule(gemm_gelu_pattern, uses_unknown_input)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import unittest
+
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper
+
+from onnxscript import quantization, script
+from onnxscript.onnx_opset import opset10, opset17
+from onnxscript.onnx_types import FLOAT
+from onnxscript.test.common import onnx_script_test_case, testutils
+
+_WEIGHT = np.random.rand(8, 3).astype(np.float32) - 0.5
+
+
+@script()
+def linear(x: FLOAT[4, 8]) -> FLOAT[4, 3]:
+    weight = opset17.Constant(value=numpy_helper.from_array(_WEIGHT))
+    return opset17.Relu(opset17.MatMul(x, weight))
+
+
+@script()
+def gemm(x: FLOAT[4, 8], w: FLOAT[3, 8], bias: FLOAT[3]) -> FLOAT[4, 3]:
+    return opset17.Gemm(x, w, bias, alpha=2.0, beta=0.5, transB=1)
+
+
+@script()
+def two_layers(x: FLOAT[4, 8]) -> FLOAT[4, 3]:
+    weight = opset17.Constant(value=numpy_helper.from_array(_WEIGHT))
+    hidden = opset17.MatMul(x, weight)
+    return opset17.MatMul(x, weight) + opset17.MatMul(hidden, opset17.Transpose(hidden))[:, :3]
+
+
+@script()
+def linear10(x: FLOAT[4, 8], w: FLOAT[8, 3]) -> FLOAT[4, 3]:
+    return opset10.MatMul(x, w)
+
+
+class TestQuantizeDynamic(onnx_script_test_case.OnnxScriptTestCase):
+    def setUp(self):
+        self.x = np.random.rand(4, 8).astype(np.float32)
+
+    def test_constant_weight_is_quantized_by_the_pass(self):
+        model = self.run_quantization_test(linear, [self.x])
+        self.assertEqual(
+            testutils.op_types(model),
+            ["DynamicQuantizeLinear", "MatMulInteger", "Cast", "Mul", "Mul", "Relu"],
+        )
+        initializers = {t.name: t for t in model.graph.initializer}
+        self.assertNotIn("weight", initializers)
+        self.assertEqual(initializers["weight_quantized"].data_type, onnx.TensorProto.UINT8)
+
+    def test_gemm(self):
+        w = np.random.rand(3, 8).astype(np.float32)
+        bias = np.random.rand(3).astype(np.float32)
+        model = self.run_quantization_test(gemm, [self.x, w, bias])
+        self.assertNotIn("Gemm", testutils.op_types(model))
+        self.assertEqual(testutils.op_types(model).count("DynamicQuantizeLinear"), 2)
+        self.assertIn("Transpose", testutils.op_types(model))
+
+    def test_values_are_quantized_once(self):
+        model = self.run_quantization_test(two_layers, [self.x], tolerance=0.1)
+        self.assertEqual(testutils.op_types(model).count("MatMulInteger"), 3)
+        # x, hidden and its transposition are quantized, the weight is quantized by the pass.
+        self.assertEqual(testutils.op_types(model).count("DynamicQuantizeLinear"), 3)
+        names = [t.name for t in model.graph.initializer]
+        self.assertEqual(names.count("weight_quantized"), 1)
+
+    def test_nodes_are_selected(self):
+        model = self.run_quantization_test(two_layers, [self.x], nodes=["hidden"])
+        self.assertEqual(testutils.op_types(model).count("MatMulInteger"), 1)
+        self.assertEqual(testutils.op_types(model).count("MatMul"), 2)
+        model = self.run_quantization_test(
+            two_layers, [self.x], nodes=lambda node: "hidden" not in node.input
+        )
+        self.assertEqual(testutils.op_types(model).count("MatMulInteger"), 2)
+
+    def test_initializer_weight(self):
+        graph = helper.make_graph(
+            [helper.make_node("MatMul", ["x", "w"], ["y"])],
+            "g",
+            [helper.make_tensor_value_info("x", onnx.TensorProto.FLOAT, [4, 8])],
+            [helper.make_tensor_value_info("y", onnx.TensorProto.FLOAT, [4, 3])],
+            initializer=[numpy_helper.from_array(_WEIGHT, "w")],
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+        expected = self._run_model(model, {"x": self.x})
+        self.assertEqual(quantization.quantize_dynamic(model), 1)
+        self.assertEqual(
+            [t.name for t in model.graph.initializer],
+            ["w_quantized", "w_zero_point", "y_factor"],
+        )
+        actual = self._run_model(model, {"x": self.x})
+        np.testing.assert_allclose(actual[0], expected[0], atol=0.05 * np.abs(expected).max())
+
+    def test_quantize_function(self):
+        function_ir = script()(linear.function).function_ir
+        self.assertEqual(quantization.quantize_dynamic(function_ir), 1)
+        self.assertEqual(
+            [s.callee.opname for s in function_ir.stmts],
+            ["DynamicQuantizeLinear", "Constant", "Constant", "MatMulInteger", "Cast"]
+            + ["Constant", "Mul", "Mul", "Relu"],
+        )
+        onnx.checker.check_model(function_ir.to_model_proto(), full_check=True)
+
+    def test_older_opsets_are_not_quantized(self):
+        self.assertEqual(quantization.quantize_dynamic(linear10.to_model_proto()), 0)
+
+    def test_quantize_weight(self):
+        weight = np.array([[-1.0, 0.5], [2.0, 0.0]], dtype=np.float32)
+        quantized, scale, zero_point = quantization.quantize_weight(weight)
+        np.testing.assert_allclose(
+            (quantized.astype(np.float32) - zero_point) * scale, weight, atol=scale / 2
+        )
+        quantized, scale, zero_point = quantization.quantize_weight(np.zeros(2, np.float32))
+        self.assertEqual(scale, 1.0)
+        np.testing.assert_array_equal(quantized, zero_point)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,6 +11,8 @@ import numpy as np
 import onnx
 import onnx.helper
 import onnx.mapping
+import onnx.numpy_helper
+import onnx.shape_inference
 from onnx import FunctionProto, ModelProto, TensorProto, ValueInfoProto
 
 from onnxscript import tensor
@@ -160,3 +162,91 @@ def make_model_from_function_proto(
         opset_imports=model_proto_opset,
     )
     return model
+
+
+# Helpers shared by the passes rewriting or analyzing graphs:
+
+
+def subgraphs(attr: onnx.AttributeProto) -> list[onnx.GraphProto]:
+    """Returns the graphs held by an attribute, an empty list if it is not graph-valued."""
+    if attr.type == onnx.AttributeProto.GRAPH:
+        return [attr.g]
+    if attr.type == onnx.AttributeProto.GRAPHS:
+        return list(attr.graphs)
+    return []
+
+
+def referenced_names(graph: onnx.GraphProto) -> set[str]:
+    """Returns the names used by a graph or its subgraphs, including outer-scope names."""
+    names = {o.name for o in graph.output}
+    for node in graph.node:
+        names.update(node.input)
+        for attr in node.attribute:
+            for subgraph in subgraphs(attr):
+                names |= referenced_names(subgraph)
+    return names
+
+
+def used_names(node: onnx.NodeProto) -> set[str]:
+    """Returns the inputs of a node, including the outer-scope names used by its subgraphs."""
+    names = set(node.input)
+    for attr in node.attribute:
+        for subgraph in subgraphs(attr):
+            names |= referenced_names(subgraph)
+    return names
+
+
+def rename_outer_scope_references(graph: onnx.GraphProto, renaming: dict[str, str]) -> None:
+    """Renames in-place the inputs of the nodes of a graph and of its subgraphs."""
+    for node in graph.node:
+        node.input[:] = [renaming.get(x, x) for x in node.input]
+        for attr in node.attribute:
+            for subgraph in subgraphs(attr):
+                rename_outer_scope_references(subgraph, renaming)
+
+
+def constant_attribute_value(attr: onnx.AttributeProto) -> Optional[np.ndarray]:
+    """Returns the value defined by the attribute of a `Constant`, or None."""
+    if attr.ref_attr_name:
+        return None
+    if attr.name == "value":
+        return onnx.numpy_helper.to_array(attr.t)
+    if attr.name == "value_int":
+        return np.array(attr.i, dtype=np.int64)
+    if attr.name == "value_ints":
+        return np.array(list(attr.ints), dtype=np.int64)
+    if attr.name == "value_float":
+        return np.array(attr.f, dtype=np.float32)
+    if attr.name == "value_floats":
+        return np.array(list(attr.floats), dtype=np.float32)
+    return None
+
+
+def elem_types(model: ModelProto) -> dict[str, int]:
+    """Returns the element type of the tensors of the main graph of a model, when known."""
+    inferred = onnx.shape_inference.infer_shapes(model)
+    graph = inferred.graph
+    types = {t.name: t.data_type for t in graph.initializer}
+    for info in [*graph.input, *graph.value_info, *graph.output]:
+        if info.type.HasField("tensor_type") and info.type.tensor_type.elem_type:
+            types[info.name] = info.type.tensor_type.elem_type
+    return types
+
+
+def standard_opset_version(opset_imports: Iterable[onnx.OperatorSetIdProto]) -> int:
+    """Returns the version of the standard opset imported, the latest one if not imported."""
+    for opset in opset_imports:
+        if opset.domain in ("", "ai.onnx"):
+            return opset.version
+    return onnx.defs.onnx_opset_version()
+
+
+def replace_all(field: Any, items: Iterable[Any]) -> None:
+    """Replaces the elements of a repeated field of a proto by copies of items."""
+    copies = []
+    for item in items:
+        copy = type(item)()
+        copy.CopyFrom(item)
+        copies.append(copy)
+    del field[:]
+    field.extend(copies)
@@ -5,6 +5,7 @@
 from __future__ import annotations
 
 import dataclasses
+import functools
 import logging
 import types
 from enum import IntFlag
@@ -153,6 +154,9 @@ class OnnxClosure:
 
     function: Any
 
+    def __call__(self, *args):
+        return self.function(*args)
+
 
 UserModeValue = Any
 EagerModeValue = Any
@@ -239,6 +243,15 @@ def _adapt_to_user_mode(output: ExtendedModeValue) -> UserModeValue:
     raise TypeError(f"Unexpected type {type(output)}.")
 
 
+def _hashable(value: Any) -> Any:
+    """Returns a hashable form of an attribute value, identifying the cached variants."""
+    if isinstance(value, np.ndarray):
+        return (value.dtype.str, value.shape, value.tobytes())
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
 class OnnxFunction(Op):
     """Represents an ONNX op for which a function-body has been defined in onnxscript.
 
@@ -249,15 +262,33 @@ class OnnxFunction(Op):
             :class:`onnxscript.converter.Converter`
         source: source code used to generate the function
         kwargs: additional properties used to construct a ModelProto
+        unroll_threshold: threshold the function was translated with, see
+            :func:`onnxscript.script`
+        input_ranks: ranks of the inputs the function is specialized for, see
+            :meth:`specialize`
     """
 
-    def __init__(self, opset, pyfun, irfun, source, kwargs):
+    def __init__(
+        self,
+        opset,
+        pyfun,
+        irfun,
+        source,
+        kwargs,
+        unroll_threshold: int = 0,
+        input_ranks: Optional[dict[str, int]] = None,
+    ):
         opset = opset or Opset(irfun.domain, 1)
         super().__init__(opset, irfun.name)
         self.function = pyfun
         self.function_ir = irfun
         self.source = source
         self.kwargs = kwargs
+        self.unroll_threshold = unroll_threshold
+        # ranks of the inputs this function is specialized for, see specialize
+        self.input_ranks = dict(input_ranks or {})
+        # attribute-specialized variants of this function, see specialize
+        self._specializations: dict[tuple, OnnxFunction] = {}
 
     @property
     def name(self):
@@ -294,6 +325,81 @@ class OnnxFunction(Op):
 
         return _adapt_to_user_mode(result) if has_array else result
 
+    def specialize(
+        self, *, input_ranks: Optional[dict[str, int]] = None, **attrs
+    ) -> OnnxFunction:
+        """Returns a variant of this function for the given attribute values.
+
+        The function is translated again with these attributes replaced by
+        script-time constants. Conditions depending on them, or on the rank of
+        the inputs when it is given, are resolved at translation time, so that
+        the variant contains no If statement for them, and the computations
+        depending only on constants are folded.
+        Variants are cached: specializing twice for the same attribute values
+        and input ranks returns the same function.
+
+        Args:
+            input_ranks: known ranks of (a subset of) the inputs of the function
+            attrs: values of (a subset of) the attribute-parameters of the function
+
+        Returns:
+            a new :class:`OnnxFunction` named after the function, the attribute values
+            and the input ranks
+        """
+        from onnxscript import main, optimizer  # pylint: disable=import-outside-toplevel
+
+        input_ranks = input_ranks or {}
+        key = (
+            tuple((k, _hashable(v)) for k, v in sorted(attrs.items())),
+            tuple(sorted(input_ranks.items())),
+        )
+        if key in self._specializations:
+            return self._specializations[key]
+        known = set(self.function_ir.attrs)
+        known.update(a.attr_proto.name for a in self.function_ir.attr_protos)
+        unknown = set(attrs) - known
+        if unknown:
+            raise ValueError(f"{self.name}: Unknown attributes {sorted(unknown)}.")
+        unknown = set(input_ranks) - {x.name for x in self.function_ir.inputs}
+        if unknown:
+            raise ValueError(f"{self.name}: Unknown inputs {sorted(unknown)}.")
+        pyfun = self.function
+        if isinstance(pyfun, functools.partial):
+            # Specializing a specialized function: start again from the original one,
+            # with the attribute values and input ranks of the first specialization.
+            attrs = {**pyfun.keywords, **attrs}
+            pyfun = pyfun.func
+        input_ranks = {**self.input_ranks, **input_ranks}
+        default_opset = next(
+            (s.callee.opset for s in self.function_ir.stmts if s.callee.opset.domain == ""),
+            None,
+        )
+        src, f_ast = main.get_src_and_ast(pyfun)
+        function_ir = main.script_check(
+            f_ast,
+            self.opset,
+            main.get_globals(pyfun),
+            src,
+            default_opset=default_opset,
+            attribute_values=attrs,
+            input_ranks=input_ranks,
+            unroll_threshold=self.unroll_threshold,
+        )
+        optimizer.fold_constants(function_ir)
+        optimizer.eliminate_dead_code(function_ir)
+        # In eager mode, the attributes are bound to their values.
+        specialized = OnnxFunction(
+            self.opset,
+            functools.partial(pyfun, **attrs),
+            function_ir,
+            src,
+            self.kwargs,
+            self.unroll_threshold,
+            input_ranks,
+        )
+        self._specializations[key] = specialized
+        return specialized
+
     def to_function_proto(self):
         """Converts the function into :class:`onnx.FunctionProto`."""
         return self.function_ir.to_function_proto()
@@ -345,13 +451,17 @@ class SymbolValue:
     * To represent constant-values, translated into ONNX constants.
     """
 
+    __slots__ = ("info",)
+
     def __init__(self, info: sourceinfo.SourceInfo) -> None:
         if not isinstance(info, sourceinfo.SourceInfo):
             raise TypeError(f"info must be of type sourceinfo.SourceInfo not {type(info)!r}.")
-        self.info = info
+        self.info: Optional[sourceinfo.SourceInfo] = info
 
 
 class AttrRef(SymbolValue):
+    __slots__ = ("value", "typeinfo")
+
     def __init__(
         self, attr_name: str, typeinfo: _GenericAlias, info: sourceinfo.SourceInfo
     ) -> None:
@@ -381,6 +491,8 @@ class DynamicKind(IntFlag):
 
 
 class Dynamic(SymbolValue):
+    __slots__ = ("value", "kind", "typeinfo")
+
     def __init__(
         self, onnx_var: str, kind: DynamicKind, info: sourceinfo.SourceInfo, typeinfo=None
     ) -> None: